@@ -0,0 +1,43 @@
+// The backend API is running through nginx proxy
+const FASTAPI_URL = process.env.NEXT_PUBLIC_FASTAPI_URL || 'http://localhost';
+
+export async function POST(request: Request) {
+  try {
+    const { query } = await request.json();
+
+    if (!query) {
+      return Response.json({ error: 'Query is required' }, { status: 400 });
+    }
+
+    const fastapiResponse = await fetch(`${FASTAPI_URL}/api/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ query }),
+    });
+
+    if (!fastapiResponse.ok || !fastapiResponse.body) {
+      const errorBody = await fastapiResponse.text();
+      console.error('FastAPI error:', errorBody);
+      return Response.json(
+        { error: `Error from backend: ${fastapiResponse.statusText}`, details: errorBody },
+        { status: fastapiResponse.status }
+      );
+    }
+
+    // Pass the event stream through without buffering
+    return new Response(fastapiResponse.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+      },
+    });
+
+  } catch (error) {
+    console.error('Error in chat stream API route:', error);
+    const errorMessage = error instanceof Error ? error.message : 'An unknown error occurred';
+    return Response.json({ error: 'Internal Server Error', details: errorMessage }, { status: 500 });
+  }
+}
@@ -0,0 +1,31 @@
+import { NextResponse } from 'next/server';
+
+// The backend API is running through nginx proxy
+const FASTAPI_URL = process.env.NEXT_PUBLIC_FASTAPI_URL || 'http://localhost';
+
+export async function GET(request: Request, { params }: { params: Promise<{ id: string }> }) {
+  try {
+    const { id } = await params;
+
+    const fastapiResponse = await fetch(`${FASTAPI_URL}/api/jobs/${encodeURIComponent(id)}`, {
+      cache: 'no-store',
+    });
+
+    const data = await fastapiResponse.json();
+
+    if (!fastapiResponse.ok) {
+      console.error('FastAPI job status error:', data);
+      return NextResponse.json(
+        { error: `Error from backend: ${fastapiResponse.statusText}`, details: data.detail },
+        { status: fastapiResponse.status }
+      );
+    }
+
+    return NextResponse.json(data);
+
+  } catch (error) {
+    console.error('Error in job status API route:', error);
+    const errorMessage = error instanceof Error ? error.message : 'An unknown error occurred';
+    return NextResponse.json({ error: 'Internal Server Error', details: errorMessage }, { status: 500 });
+  }
+}
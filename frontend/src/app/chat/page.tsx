@@ -13,6 +13,21 @@ type Message = {
   sources?: Source[];
 };
 
+type StreamEvent = {
+  type: string;
+  data: Record<string, unknown>;
+};
+
+function parseEvent(rawEvent: string): StreamEvent | null {
+  let type = 'message';
+  let data = '';
+  for (const line of rawEvent.split('\n')) {
+    if (line.startsWith('event:')) type = line.slice(6).trim();
+    else if (line.startsWith('data:')) data += line.slice(5).trim();
+  }
+  return data ? { type, data: JSON.parse(data) } : null;
+}
+
 export default function ChatPage() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState('');
@@ -27,30 +42,51 @@ export default function ChatPage() {
     setInput('');
     setIsLoading(true);
 
+    // Append an empty bot message and fill it in as stream events arrive
+    const updateBotMessage = (update: (message: Message) => Message) => {
+      setMessages((prev) => [...prev.slice(0, -1), update(prev[prev.length - 1])]);
+    };
+    setMessages((prev) => [...prev, { text: '', sender: 'bot' }]);
+
     try {
-      const response = await fetch('/api/chat', {
+      const response = await fetch('/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ query: input }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`API error: ${response.statusText}`);
       }
 
-      const data = await response.json();
-      const botMessage: Message = {
-        text: data.answer,
-        sender: 'bot',
-        sources: data.sources,
-      };
-      setMessages((prev) => [...prev, botMessage]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
+        for (const rawEvent of events) {
+          const event = parseEvent(rawEvent);
+          if (!event) continue;
+          if (event.type === 'sources') {
+            updateBotMessage((message) => ({ ...message, sources: event.data.sources as Source[] }));
+          } else if (event.type === 'token' || event.type === 'summary') {
+            updateBotMessage((message) => ({ ...message, text: message.text + (event.data.text as string) }));
+          } else if (event.type === 'error') {
+            throw new Error(event.data.detail as string);
+          }
+        }
+      }
     } catch (error) {
-      const errorMessage: Message = {
+      updateBotMessage((message) => ({
+        ...message,
         text: `Sorry, something went wrong. ${error instanceof Error ? error.message : ''}`,
-        sender: 'bot',
-      };
-      setMessages((prev) => [...prev, errorMessage]);
+      }));
     } finally {
       setIsLoading(false);
     }
@@ -78,7 +114,7 @@ export default function ChatPage() {
             </div>
           </div>
         ))}
-        {isLoading && (
+        {isLoading && !messages[messages.length - 1]?.text && (
           <div className="chat chat-start">
             <div className="chat-bubble">Typing...</div>
           </div>
@@ -34,6 +34,7 @@ interface AdvancedSearchResponse {
     query: string;
     category?: string;
     tags?: string[];
+    tag_mode?: string;
     family_member?: string;
     date_from?: string;
     date_to?: string;
@@ -193,6 +194,7 @@ export default function AdvancedSearchPage() {
           <div className="flex gap-4">
             {[
               { value: 'semantic', label: '語義搜尋', desc: '基於內容理解' },
+              { value: 'lexical', label: '關鍵字搜尋', desc: '精確詞彙比對' },
               { value: 'filter', label: '條件過濾', desc: '基於元資料篩選' },
               { value: 'hybrid', label: '混合模式', desc: '結合語義和過濾' }
             ].map(mode => (
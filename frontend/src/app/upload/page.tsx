@@ -7,6 +7,8 @@ interface UploadResult {
   filename: string;
   file_path: string;
   document_id?: number;
+  job_id?: string;
+  status?: string;
   classification?: {
     category: string;
     confidence: number;
@@ -22,6 +24,26 @@ interface UploadResult {
   };
 }
 
+interface JobStatus {
+  job_id: string;
+  status: 'queued' | 'running' | 'completed' | 'dead';
+  progress: number;
+  current_stage?: string;
+  error?: string;
+  document_id?: number;
+  classification?: UploadResult['classification'];
+}
+
+const STAGE_LABELS: Record<string, string> = {
+  ocr: '文字辨識',
+  classify: '智能分類',
+  metadata: '儲存元資料',
+  embed: '向量化',
+  timeseries: '時間序列擷取',
+};
+
+const POLL_INTERVAL_MS = 1500;
+
 export default function UploadPage() {
   const [file, setFile] = useState<File | null>(null);
   const [isUploading, setIsUploading] = useState(false);
@@ -52,6 +74,25 @@ export default function UploadPage() {
     handleFileChange(e.dataTransfer.files);
   };
 
+  // 上傳後由後端佇列處理，輪詢工作狀態直到完成或失敗
+  const waitForJob = async (jobId: string): Promise<JobStatus> => {
+    while (true) {
+      const response = await fetch(`/api/jobs/${jobId}`);
+      const job = await response.json();
+
+      if (!response.ok) {
+        throw new Error(job.details || job.error || 'Failed to fetch job status');
+      }
+      if (job.status === 'completed' || job.status === 'dead') {
+        return job;
+      }
+
+      const stage = job.current_stage ? STAGE_LABELS[job.current_stage] ?? job.current_stage : '排隊中';
+      setMessage(`正在處理文件（${stage}，${Math.round(job.progress * 100)}%）...`);
+      await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+  };
+
   const handleSubmit = async () => {
     if (!file || isUploading) return;
 
@@ -73,9 +114,19 @@ export default function UploadPage() {
       if (!response.ok) {
         throw new Error(data.detail || 'Upload failed');
       }
+
+      let result: UploadResult = data;
+      if (data.job_id) {
+        setMessage('上傳成功，正在處理文件...');
+        const job = await waitForJob(data.job_id);
+        if (job.status === 'dead') {
+          throw new Error(`文件處理失敗: ${job.error || 'Unknown error'}`);
+        }
+        result = { ...data, document_id: job.document_id, classification: job.classification };
+      }
       
       setMessage('上傳成功！');
-      setUploadResult(data);
+      setUploadResult(result);
       setFile(null);
     } catch (error) {
       setMessage(`錯誤: ${error instanceof Error ? error.message : 'Unknown error'}`);
@@ -2,6 +2,8 @@ import typer
 import uvicorn
 import requests
 import os
+import json
+from typing import Optional
 
 # --- Typer App ---
 cli_app = typer.Typer(name="rag", help="RAG Store CLI for querying and data ingestion.")
@@ -11,28 +13,88 @@ API_BASE_URL = "http://127.0.0.1:8000"
 
 # --- CLI 指令 ---
 
+def _print_answer(data: dict):
+    typer.secho("\n✅ Answer:", fg=typer.colors.GREEN, bold=True)
+    typer.echo(data['answer'])
+
+    if data['sources']:
+        typer.secho("\n📚 Sources:", fg=typer.colors.YELLOW)
+        for i, source in enumerate(data['sources']):
+            typer.echo(f"\n--- Source {i+1} ---")
+            typer.echo(source['page_content'])
+            typer.echo(f"Metadata: {source['metadata']}")
+
+def _load_queries(file_path: str) -> list:
+    """讀取 JSON 陣列或 JSON Lines，每項為問題字串或 QueryRequest 物件"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        items = json.loads(content)
+    else:
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [{"query": item} if isinstance(item, str) else item for item in items]
+
 @cli_app.command()
 def query(
-    question: str = typer.Argument(..., help="The question to ask the RAG system."),
+    question: Optional[str] = typer.Argument(None, help="The question to ask the RAG system."),
+    file: Optional[str] = typer.Option(None, "--file", "-f", help="JSON or JSON Lines file of queries to send as one batch."),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Write batch results to this JSON Lines file."),
+    concurrency: Optional[int] = typer.Option(None, help="Maximum answers generated concurrently in batch mode."),
 ):
     """
     Send a query to the RAG API and print the answer.
+    With --file, send every query in the file to the batch endpoint.
     """
+    if file:
+        query_batch(file, output, concurrency)
+        return
+    if not question:
+        typer.secho("Error: provide a question or --file", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
     typer.echo(f"❓ Querying: {question}")
     try:
         response = requests.post(f"{API_BASE_URL}/api/query", json={"query": question})
         response.raise_for_status()
-        
-        data = response.json()
-        typer.secho("\n✅ Answer:", fg=typer.colors.GREEN, bold=True)
-        typer.echo(data['answer'])
-        
-        if data['sources']:
-            typer.secho("\n📚 Sources:", fg=typer.colors.YELLOW)
-            for i, source in enumerate(data['sources']):
-                typer.echo(f"\n--- Source {i+1} ---")
-                typer.echo(source['page_content'])
-                typer.echo(f"Metadata: {source['metadata']}")
+        _print_answer(response.json())
+
+    except requests.exceptions.RequestException as e:
+        typer.secho(f"Error connecting to API: {e}", fg=typer.colors.RED)
+        typer.echo("Please make sure the RAG server is running. Use 'python -m rag_store serve'")
+
+def query_batch(file_path: str, output: Optional[str] = None, concurrency: Optional[int] = None):
+    """以單一請求送出檔案中的所有查詢"""
+    if not os.path.exists(file_path):
+        typer.secho(f"Error: File not found at '{file_path}'", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    try:
+        queries = _load_queries(file_path)
+    except (ValueError, TypeError) as e:
+        typer.secho(f"Error: Invalid query file: {e}", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+    if not queries:
+        typer.secho("Error: Query file is empty", fg=typer.colors.RED)
+        raise typer.Exit(code=1)
+
+    typer.echo(f"❓ Querying {len(queries)} questions from: {file_path}")
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/api/query/batch",
+            json={"queries": queries, "max_concurrency": concurrency}
+        )
+        response.raise_for_status()
+        results = response.json()["results"]
+
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                for item, result in zip(queries, results):
+                    f.write(json.dumps({"query": item["query"], **result}, ensure_ascii=False) + "\n")
+            typer.secho(f"✅ Wrote {len(results)} answers to {output}", fg=typer.colors.GREEN)
+            return
+
+        for item, result in zip(queries, results):
+            typer.secho(f"\n❓ {item['query']}", bold=True)
+            _print_answer(result)
 
     except requests.exceptions.RequestException as e:
         typer.secho(f"Error connecting to API: {e}", fg=typer.colors.RED)
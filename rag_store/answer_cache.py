@@ -0,0 +1,139 @@
+"""
+語義回答快取
+家人常以幾乎相同的方式重複提問（「這個月電費多少」），
+查詢向量與既有快取項目的 cosine 相似度超過門檻、過濾條件相同且語料未變動時，
+直接回傳先前的回答，省去檢索與 GPT 生成
+
+主要功能：
+1. 先以正規化查詢文字精確比對（不需 embedding），再以 (過濾條件, 查詢向量) 比對，
+   同一組過濾條件的項目以單次矩陣乘法計算相似度
+2. 語料版本：上傳新文件時遞增 CorpusVersion，所有 uvicorn worker 的快取一併失效
+3. TTL 與項目數上限（LRU）淘汰
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .corpus_version import CorpusVersion
+from .vector_codec import VectorLike, normalize, to_array
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("filter_key", "text", "vector", "response", "created_at")
+
+    def __init__(self, filter_key: Hashable, text: str, vector: Optional[np.ndarray], response: Dict[str, Any]):
+        self.filter_key = filter_key
+        self.text = text
+        self.vector = vector
+        self.response = response
+        self.created_at = time.monotonic()
+
+
+class SemanticAnswerCache:
+    """以查詢向量相似度命中的回答快取"""
+
+    def __init__(self,
+                 version: CorpusVersion,
+                 threshold: float = 0.95,
+                 ttl_seconds: float = 3600,
+                 max_entries: int = 1000):
+        self.version = version
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _check_version_locked(self):
+        version = self.version.current()
+        if version != self._version:
+            if self._entries:
+                logger.info(f"語料版本變更，清除 {len(self._entries)} 個快取回答")
+            self._entries.clear()
+            self._version = version
+
+    def _expire_locked(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry.created_at < deadline]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        self.evictions += len(expired)
+
+    def lookup(self,
+               text: str,
+               filter_key: Hashable,
+               vector: Optional[VectorLike] = None) -> Optional[Dict[str, Any]]:
+        """
+        回傳快取回答：正規化文字完全相同者優先，
+        有查詢向量時再找相似度最高且超過門檻者；未命中時回傳 None
+        """
+        query = normalize(to_array(vector)) if vector is not None else None
+        with self._lock:
+            self._check_version_locked()
+            self._expire_locked()
+            candidates: List[Tuple[int, _Entry]] = [
+                (entry_id, entry) for entry_id, entry in self._entries.items()
+                if entry.filter_key == filter_key
+            ]
+            hit = next(((entry_id, entry) for entry_id, entry in candidates if entry.text == text), None)
+            if hit is None and query is not None:
+                with_vectors = [(entry_id, entry) for entry_id, entry in candidates if entry.vector is not None]
+                if with_vectors:
+                    scores = np.stack([entry.vector for _, entry in with_vectors]) @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        hit = with_vectors[best]
+            if hit is None:
+                self.misses += 1
+                return None
+            entry_id, entry = hit
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry.response
+
+    def store(self,
+              text: str,
+              filter_key: Hashable,
+              response: Dict[str, Any],
+              vector: Optional[VectorLike] = None,
+              version: Optional[int] = None):
+        """加入回答；version 為檢索開始時的語料版本，期間語料已變動則不快取"""
+        with self._lock:
+            self._check_version_locked()
+            if version is not None and version != self._version:
+                return
+            normalized = normalize(to_array(vector)) if vector is not None else None
+            self._entries[self._next_id] = _Entry(filter_key, text, normalized, response)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "threshold": self.threshold,
+            }
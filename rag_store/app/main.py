@@ -1,28 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, Callable, List, Dict, Any, Literal, Optional, Tuple, Union
 import os
+import json
 import shutil
 import tempfile
 import asyncio
-import subprocess
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
 import mysql.connector
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from datetime import date, datetime, timedelta
 
+from ..llm_provider import AsyncLLMProvider
+
 # Load environment variables
 load_dotenv()
 
 # --- OpenAI Configuration ---
-openai_client = None
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-else:
+# 所有 OpenAI 請求皆經由非同步服務層（並行上限、限流、逾時與重試）
+llm_provider = AsyncLLMProvider.from_env()
+if not llm_provider:
     print("Warning: OPENAI_API_KEY not found in environment variables")
 
 # --- Request/Response Models ---
@@ -36,11 +38,20 @@ class QueryRequest(BaseModel):
     family_member: Optional[str] = None  # 家庭成員篩選
     amount_min: Optional[float] = None  # 最小金額
     amount_max: Optional[float] = None  # 最大金額
-    search_mode: Optional[str] = "hybrid"  # 搜尋模式：semantic, filter, hybrid
+    search_mode: Optional[str] = "hybrid"  # 搜尋模式：semantic, lexical, filter, hybrid
+    tag_mode: Optional[Literal["any", "all"]] = "any"  # 標籤比對：any（任一標籤）或 all（全部標籤）
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
+    metadata: Optional[Dict[str, Any]] = None  # 內容組裝統計等附加資訊
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+    max_concurrency: Optional[int] = None  # 同時生成回答的上限，未指定時使用 BATCH_QUERY_CONCURRENCY
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
 
 class UploadResponse(BaseModel):
     message: str
@@ -48,6 +59,33 @@ class UploadResponse(BaseModel):
     file_path: str
     document_id: Optional[int] = None
     classification: Optional[Dict[str, Any]] = None
+    job_id: Optional[str] = None  # 處理工作 ID，以 /api/jobs/{job_id} 查詢進度
+    status: Optional[str] = None
+
+# 上傳處理工作
+class JobStageResponse(BaseModel):
+    name: str
+    status: str  # pending、running、completed、failed
+    attempts: int = 0
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str  # queued、running、completed、dead
+    progress: float
+    current_stage: Optional[str] = None
+    stages: List[JobStageResponse]
+    error: Optional[str] = None
+    filename: Optional[str] = None
+    document_id: Optional[int] = None
+    classification: Optional[Dict[str, Any]] = None
+    chunks_count: Optional[int] = None
+    created_at: float
+    updated_at: float
+    finished_at: Optional[float] = None
+    next_run_at: Optional[float] = None  # 等待重試時的下次執行時間
 
 # 時間序列相關模型
 class TimeSeriesRequest(BaseModel):
@@ -93,6 +131,7 @@ class DocumentMetadata(BaseModel):
     document_date: Optional[str] = None
     extracted_amount: Optional[float] = None
     confidence_score: Optional[float] = None
+    processing_status: Optional[str] = None
 
 class CategoryResponse(BaseModel):
     id: int
@@ -138,6 +177,9 @@ app.add_middleware(
 UPLOAD_DIR = Path("raw")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# 儲存後端：tidb（TiDB Cloud）或 sqlite（內嵌，單機部署查詢不經網路）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "tidb")
+
 # TiDB Cloud Configuration
 TIDB_HOST = os.getenv("TIDB_HOST")
 TIDB_USER = os.getenv("TIDB_USER")
@@ -155,6 +197,63 @@ LOCAL_TIDB_DB = os.getenv("LOCAL_TIDB_DB", "local_db")
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
+# Model configuration
+CHAT_MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 128))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 100000))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 20))
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))
+
+# Local vector index configuration（資料庫仍為資料來源，本機索引僅加速查詢；內嵌後端預設啟用）
+VECTOR_INDEX_ENABLED = os.getenv(
+    "VECTOR_INDEX_ENABLED", "true" if STORAGE_BACKEND == "sqlite" else "false"
+).lower() == "true"
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "hnsw")  # hnsw、mmap、int8 或 pq
+VECTOR_INDEX_DIR = Path(os.getenv("VECTOR_INDEX_DIR", "index"))
+VECTOR_INDEX_OVERFETCH = int(os.getenv("VECTOR_INDEX_OVERFETCH", 10))
+VECTOR_INDEX_SAVE_EVERY = int(os.getenv("VECTOR_INDEX_SAVE_EVERY", 500))
+VECTOR_INDEX_RESCORE_FACTOR = int(os.getenv("VECTOR_INDEX_RESCORE_FACTOR", 8))
+VECTOR_INDEX_PQ_SUBSPACES = int(os.getenv("VECTOR_INDEX_PQ_SUBSPACES", 384))
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+CORPUS_VERSION_PATH = Path(os.getenv("CORPUS_VERSION_PATH", "cache/corpus_version"))
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 512))
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 600))
+BATCH_QUERY_MAX_SIZE = int(os.getenv("BATCH_QUERY_MAX_SIZE", 500))
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", 4))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.9))
+QUERY_PLANNER_PREFILTER_MAX_MATCHES = int(os.getenv("QUERY_PLANNER_PREFILTER_MAX_MATCHES", 5000))
+QUERY_PLANNER_PREFILTER_MAX_SELECTIVITY = float(os.getenv("QUERY_PLANNER_PREFILTER_MAX_SELECTIVITY", 0.2))
+QUERY_PLANNER_SCAN_MAX_MATCHES = int(os.getenv("QUERY_PLANNER_SCAN_MAX_MATCHES", 200))
+QUERY_PLANNER_MAX_OVERFETCH = int(os.getenv("QUERY_PLANNER_MAX_OVERFETCH", 50))
+ASYNC_DB_BACKEND = os.getenv("ASYNC_DB_BACKEND", "auto")  # auto、aiomysql 或 thread
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", 200))
+TAXONOMY_CACHE_TTL_SECONDS = int(os.getenv("TAXONOMY_CACHE_TTL_SECONDS", 600))
+READ_REPLICA_ENABLED = os.getenv("READ_REPLICA_ENABLED", "false").lower() == "true"
+READ_REPLICA_DB = os.getenv("READ_REPLICA_DB", "rag")  # 本機副本上的資料庫（LOCAL_TIDB_DB 為本機專用資料）
+READ_REPLICA_MAX_LAG_SECONDS = float(os.getenv("READ_REPLICA_MAX_LAG_SECONDS", 10))
+READ_REPLICA_HEARTBEAT_SECONDS = float(os.getenv("READ_REPLICA_HEARTBEAT_SECONDS", 2))
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", 30))
+READ_REPLICA_VECTOR_SEARCH = os.getenv("READ_REPLICA_VECTOR_SEARCH", "false").lower() == "true"
+INGEST_QUEUE_PATH = Path(os.getenv("INGEST_QUEUE_PATH", "data/jobs.sqlite3"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+INGEST_RETRY_BASE_SECONDS = float(os.getenv("INGEST_RETRY_BASE_SECONDS", 5))
+INGEST_JOB_LEASE_SECONDS = float(os.getenv("INGEST_JOB_LEASE_SECONDS", 600))
+INGEST_JOB_RETENTION_DAYS = float(os.getenv("INGEST_JOB_RETENTION_DAYS", 7))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_MAX_JOBS_PER_WORKER = int(os.getenv("OCR_MAX_JOBS_PER_WORKER", 50))
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", 300))
+OCR_START_METHOD = os.getenv("OCR_START_METHOD", "spawn")  # spawn 或 forkserver
+
 # --- Endpoints ---
 
 # --- Helper Functions ---
@@ -162,28 +261,123 @@ CHUNK_OVERLAP = 50
 # 匯入分類系統和時間序列分析器
 from ..classification_system import DocumentClassifier
 from ..time_series_analyzer import TimeSeriesAnalyzer, process_document_for_time_series
+from ..embedding_batcher import EmbeddingBatcher
+from ..embedding_cache import EmbeddingCache, normalize_text
+from ..vector_codec import from_sql_literal, to_sql_literal
+from ..hnsw_index import HNSW_AVAILABLE, HNSWIndex
+from ..mmap_index import MmapVectorIndex, missing_ids
+from ..quantized_index import QuantizedVectorIndex
+from ..schema_capabilities import SchemaRegistry
+from ..metadata_index import MetadataBitmapIndex, parse_date
+from ..lexical_index import RRF_K, LexicalIndex, looks_like_keyword_query, reciprocal_rank_fusion
+from ..answer_cache import SemanticAnswerCache
+from ..corpus_version import CorpusVersion
+from ..search_cache import SearchResultCache, search_cache_key
+from ..context_packer import ContextPacker
+from ..query_pipeline import StageGraph, gather_stages, merge_timings, stage_timing
+from ..query_planner import PLAN_METADATA_SCAN, PLAN_PREFILTER, QueryPlan, QueryPlanner
+from ..db_pool import ConnectionPool
+from ..db_router import QueryRouter
+from ..async_db import AsyncDatabase, create_async_database
+from ..storage import get_storage_backend
+from ..bulk_writer import BulkWriter
+from ..taxonomy_cache import TaxonomyCache
+from ..job_queue import JOB_DEAD, Job, JobQueue, JobWorkerPool
+from ..ocr_pool import OCRWorkerPool
+
+# 儲存後端（API、分類器與時間序列分析共用，見 STORAGE_BACKEND）
+storage = get_storage_backend(async_backend=ASYNC_DB_BACKEND, async_pool_size=ASYNC_DB_POOL_SIZE)
+
+# 阻塞式連線池（TiDB 設定見 TIDB_POOL_*）
+db_pool = storage.pool
+
+# 端點與多維度搜尋使用的非同步資料庫層（不阻塞 event loop）
+async_db = storage.async_db
+
+# 初始化分類器（與 API 共用 OpenAI 服務層與連線池）
+document_classifier = DocumentClassifier(
+    llm_provider=llm_provider,
+    pool=db_pool,
+    taxonomy=TaxonomyCache(ttl_seconds=TAXONOMY_CACHE_TTL_SECONDS),
+)
 
-# 初始化分類器
-document_classifier = DocumentClassifier()
-
-def get_tidb_cloud_connection():
-    """建立 TiDB Cloud 連線"""
+def get_db_connection():
+    """自儲存後端的連線池借出連線；呼叫 close() 即歸還"""
     try:
-        if not all([TIDB_HOST, TIDB_USER, TIDB_PASSWORD]):
+        if db_pool is None:
             return None
-        conn = mysql.connector.connect(
-            host=TIDB_HOST,
-            user=TIDB_USER,
-            password=TIDB_PASSWORD,
-            database=TIDB_DB,
-            ssl_disabled=False,
-            use_unicode=True
-        )
-        return conn
+        return db_pool.acquire()
     except Exception as e:
-        print(f"TiDB Cloud connection error: {e}")
+        print(f"Database connection error: {e}")
         return None
 
+def require_async_db() -> AsyncDatabase:
+    """取得非同步資料庫層；未設定連線參數時拋出例外"""
+    if async_db is None:
+        raise RuntimeError("Database connection failed")
+    return async_db
+
+def create_query_router() -> Optional[QueryRouter]:
+    """以本機 TiDB（LOCAL_TIDB_*）作為讀取副本；未啟用、未設定 TiDB Cloud 或使用內嵌後端時回傳 None"""
+    if not READ_REPLICA_ENABLED or async_db is None or storage.embedded:
+        return None
+    replica_config = {
+        "host": LOCAL_TIDB_HOST,
+        "port": LOCAL_TIDB_PORT,
+        "user": LOCAL_TIDB_USER,
+        "password": LOCAL_TIDB_PASSWORD,
+        "database": READ_REPLICA_DB,
+        "ssl_disabled": True,
+    }
+    # 副本借出連線的等待時間較短，本機節點停止時盡快改由主庫回應
+    replica_pool = ConnectionPool(
+        lambda: mysql.connector.connect(**replica_config),
+        max_size=db_pool.max_size,
+        wait_timeout=1.0,
+        max_lifetime=db_pool.max_lifetime,
+        idle_timeout=db_pool.idle_timeout,
+        health_check_interval=db_pool.health_check_interval,
+        name="replica",
+    )
+    replica = create_async_database(replica_config, replica_pool,
+                                    backend=ASYNC_DB_BACKEND, max_size=ASYNC_DB_POOL_SIZE)
+    return QueryRouter(
+        async_db, replica, get_db_connection, replica_pool,
+        max_lag_seconds=READ_REPLICA_MAX_LAG_SECONDS,
+        heartbeat_seconds=READ_REPLICA_HEARTBEAT_SECONDS,
+        retry_seconds=READ_REPLICA_RETRY_SECONDS,
+    )
+
+# 讀取密集端點的讀寫分離（READ_REPLICA_ENABLED）
+db_router = create_query_router()
+
+def client_key(http_request: Request) -> Optional[str]:
+    """讀取自己的寫入以客戶端區分：優先使用 X-Client-Id，否則為來源位址"""
+    client_id = http_request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    return http_request.client.host if http_request.client else None
+
+def read_db(client: Optional[str] = None):
+    """讀取密集端點使用：啟用讀寫分離時可能由本機副本回應"""
+    if db_router is not None:
+        return db_router.reader(client)
+    return require_async_db()
+
+def search_db():
+    """檢索查詢使用的資料庫（READ_REPLICA_VECTOR_SEARCH 時由副本回應）"""
+    if db_router is not None and READ_REPLICA_VECTOR_SEARCH:
+        return db_router.reader()
+    return async_db
+
+def record_write(client: Optional[str]):
+    """寫入後呼叫，副本追上前該客戶端的讀取改由主庫回應"""
+    if db_router is not None:
+        db_router.record_write(client)
+
+# Schema 能力快取（遷移後自動重新偵測）
+schema_registry = SchemaRegistry(get_db_connection, describe=storage.describe_columns)
+
 def get_local_tidb_connection():
     """建立本機 TiDB 連線"""
     try:
@@ -199,34 +393,389 @@ def get_local_tidb_connection():
         print(f"Local TiDB connection error: {e}")
         return None
 
+async def _embed_texts(texts: List[str]) -> List[List[float]]:
+    """以單一多輸入請求向 OpenAI 取得多段文字的 embedding"""
+    return await llm_provider.embed(texts, EMBEDDING_MODEL)
+
+# 初始化 embedding 微批次處理器（跨上傳合併 chunk）
+embedding_batcher = EmbeddingBatcher(
+    _embed_texts,
+    max_batch_size=EMBEDDING_BATCH_SIZE,
+    max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+    max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS
+)
+
+# 初始化 embedding 快取（內容定址、持久化）
+embedding_cache = EmbeddingCache(
+    EMBEDDING_CACHE_PATH,
+    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+)
+
 async def get_embedding(text: str) -> Optional[List[float]]:
     """使用 OpenAI API 產生文字的 embedding"""
+    return (await get_embeddings([text]))[0]
+
+async def get_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """批次產生多段文字的 embedding（先查快取），失敗時對應位置為 None"""
+    if not texts:
+        return []
+
+    # 快取為本機 SQLite，查詢與寫入於執行緒中進行，不阻塞 event loop
+    results = await asyncio.to_thread(embedding_cache.get_many, EMBEDDING_MODEL, texts)
+
+    # 未命中的文字去重複後再送出（重疊區段、固定頁首頁尾常重複出現）
+    missing: Dict[str, List[int]] = {}
+    for i, vector in enumerate(results):
+        if vector is None:
+            missing.setdefault(normalize_text(texts[i]), []).append(i)
+    if not missing or not llm_provider:
+        return results
+
     try:
-        if not openai_client:
-            return None
-        response = openai_client.embeddings.create(
-            input=[text],
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
+        pending = list(missing.values())
+        vectors = await embedding_batcher.embed_many([texts[indexes[0]] for indexes in pending])
     except Exception as e:
         print(f"Embedding error: {e}")
+        return results
+
+    for indexes, vector in zip(pending, vectors):
+        for i in indexes:
+            results[i] = vector
+    await asyncio.to_thread(
+        embedding_cache.put_many,
+        EMBEDDING_MODEL,
+        [(texts[indexes[0]], vector) for indexes, vector in zip(pending, vectors)]
+    )
+    return results
+
+def create_local_vector_index() -> Optional[Union[HNSWIndex, MmapVectorIndex, QuantizedVectorIndex]]:
+    """依設定建立本機向量索引：hnsw（近似）、mmap（精確、可跨 worker 共用）或 int8 / pq（量化候選 + 全精度重新評分）"""
+    if not VECTOR_INDEX_ENABLED:
+        return None
+    if VECTOR_INDEX_BACKEND == "mmap":
+        return MmapVectorIndex(VECTOR_INDEX_DIR / "mmap")
+    if VECTOR_INDEX_BACKEND in ("int8", "pq"):
+        return QuantizedVectorIndex(
+            MmapVectorIndex(VECTOR_INDEX_DIR / "mmap"),
+            VECTOR_INDEX_DIR / "quantized",
+            method=VECTOR_INDEX_BACKEND,
+            rescore_factor=VECTOR_INDEX_RESCORE_FACTOR,
+            pq_subspaces=VECTOR_INDEX_PQ_SUBSPACES,
+        )
+    if VECTOR_INDEX_BACKEND == "hnsw":
+        if HNSW_AVAILABLE:
+            return HNSWIndex(VECTOR_INDEX_DIR / "hnsw")
+        if storage.embedded:
+            # 內嵌後端的向量檢索以本機索引為主，改用不需額外套件的精確索引
+            print("Warning: hnswlib is not installed, using the mmap vector index")
+            return MmapVectorIndex(VECTOR_INDEX_DIR / "mmap")
+        print("Warning: VECTOR_INDEX_BACKEND=hnsw but hnswlib is not installed")
         return None
+    print(f"Warning: unknown VECTOR_INDEX_BACKEND '{VECTOR_INDEX_BACKEND}'")
+    return None
+
+# 初始化本機向量索引（選用）
+local_vector_index = create_local_vector_index()
+
+# 詞彙倒排索引：精確詞彙查詢不需 embedding
+lexical_index = LexicalIndex() if LEXICAL_INDEX_ENABLED else None
+
+# 中繼資料點陣圖索引：有過濾條件時求出允許清單，交給本機索引評分
+metadata_index = MetadataBitmapIndex() if local_vector_index is not None or lexical_index is not None else None
+
+# 語料世代計數器：上傳等寫入操作遞增，檢索與回答快取據此失效
+corpus_version = CorpusVersion(CORPUS_VERSION_PATH)
+
+# 查詢計畫：依過濾條件的選擇性決定預先過濾、事後過濾或交由 TiDB 掃描
+query_planner = QueryPlanner(
+    metadata_index,
+    corpus_version,
+    get_db_connection,
+    prefilter_max_matches=QUERY_PLANNER_PREFILTER_MAX_MATCHES,
+    prefilter_max_selectivity=QUERY_PLANNER_PREFILTER_MAX_SELECTIVITY,
+    scan_max_matches=QUERY_PLANNER_SCAN_MAX_MATCHES,
+    max_overfetch=QUERY_PLANNER_MAX_OVERFETCH,
+    default_overfetch=VECTOR_INDEX_OVERFETCH
+) if metadata_index is not None else None
+
+# 檢索結果快取：相同參數的搜尋直接回傳先前結果
+search_cache = SearchResultCache(
+    corpus_version,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ttl_seconds=SEARCH_CACHE_TTL_SECONDS
+) if SEARCH_CACHE_ENABLED else None
+
+# 語義回答快取：相似問題直接回傳先前的回答，上傳新文件時失效
+answer_cache = SemanticAnswerCache(
+    corpus_version,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES
+) if ANSWER_CACHE_ENABLED else None
+
+# 初始化提示詞內容組裝（合併重疊 chunk、去除近似重複、限制 token 預算）
+context_packer = ContextPacker(
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+    model=CHAT_MODEL
+)
+
+def answer_cache_filter_key(request: QueryRequest) -> tuple:
+    """過濾條件與搜尋模式相同的查詢才可共用快取回答"""
+    return (
+        request.search_mode or "hybrid",
+        request.category,
+        tuple(sorted(request.tags)) if request.tags else None,
+        request.tag_mode or "any",
+        request.date_from,
+        request.date_to,
+        request.family_member,
+        request.amount_min,
+        request.amount_max,
+    )
+
+def sync_local_vector_index(batch_size: int = 2000) -> int:
+    """
+    從資料庫載入本機索引缺少的向量
+    以 id 集合比對而非 id > max_id：TiDB 的 AUTO_INCREMENT 由各節點分段配發，
+    較晚提交的列 id 可能小於已同步的最大 id，只看高水位會永遠漏掉這些列
+    """
+    if local_vector_index is None:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
 
-async def vector_search(query_text: str, limit: int = 4) -> List[Dict[str, Any]]:
-    """在 TiDB Cloud 中執行向量搜尋"""
+    added = 0
+    try:
+        cursor = conn.cursor()
+        # 只取 id 比對，8 bytes/列，數萬個 chunk 仍只需一次往返
+        cursor.execute("SELECT id FROM embeddings WHERE vec IS NOT NULL")
+        missing = missing_ids([row[0] for row in cursor.fetchall()], local_vector_index.indexed_ids())
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size].tolist()
+            placeholders = ','.join(['%s'] * len(batch))
+            cursor.execute(f"SELECT id, vec FROM embeddings WHERE id IN ({placeholders})", batch)
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            local_vector_index.add(
+                [row[0] for row in rows],
+                [from_sql_literal(row[1]) for row in rows]
+            )
+            added += len(rows)
+        cursor.close()
+    finally:
+        conn.close()
+
+    if added:
+        local_vector_index.save()
+    return added
+
+async def add_to_local_vector_index(ids: List[int], vectors: List[List[float]]):
+    """將新插入的 chunk 增量加入本機索引，累積一定數量後儲存"""
+    if local_vector_index is None or not ids:
+        return
+    # 追加與編碼（量化索引）在執行緒中進行，不阻塞事件迴圈
+    await asyncio.to_thread(local_vector_index.add, ids, vectors)
+    if local_vector_index.dirty >= VECTOR_INDEX_SAVE_EVERY:
+        await asyncio.to_thread(local_vector_index.save)
+
+# 本程序的詞彙與中繼資料索引上次同步時的語料世代；
+# 其他 uvicorn worker、API 程序或腳本寫入後世代改變，使用索引前先重新同步
+search_index_generations: Dict[str, int] = {}
+search_index_sync_lock = threading.Lock()
+
+def sync_metadata_index() -> int:
+    """從資料庫載入尚未加入中繼資料索引的 chunk"""
+    if metadata_index is None or not schema_registry.get().metadata_join:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    # 於同步前讀取世代：同步期間的寫入會使世代再次改變，下次使用時重新同步
+    generation = corpus_version.current()
+    try:
+        added = metadata_index.sync(conn)
+        search_index_generations["metadata"] = generation
+        return added
+    except Exception as e:
+        print(f"Metadata index sync error: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def sync_lexical_index() -> int:
+    """從資料庫載入尚未加入詞彙索引的 chunk"""
+    if lexical_index is None:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    generation = corpus_version.current()
+    try:
+        added = lexical_index.sync(conn)
+        search_index_generations["lexical"] = generation
+        return added
+    except Exception as e:
+        print(f"Lexical index sync error: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def search_index_syncs() -> Dict[str, Tuple[Any, Callable[[], int]]]:
+    """依語料世代重新同步的程序內索引與其同步函式"""
+    return {
+        "lexical": (lexical_index, sync_lexical_index),
+        "metadata": (metadata_index, sync_metadata_index),
+    }
+
+def stale_search_indexes(generation: int) -> List[str]:
+    """已就緒、但同步時的語料世代與目前不同的索引"""
+    return [
+        name for name, (index, _) in search_index_syncs().items()
+        if index is not None and index.ready and search_index_generations.get(name) != generation
+    ]
+
+def sync_stale_search_indexes():
+    """重新同步過期的索引；多個請求同時發現過期時只同步一次"""
+    syncs = search_index_syncs()
+    with search_index_sync_lock:
+        for name in stale_search_indexes(corpus_version.current()):
+            syncs[name][1]()
+
+async def refresh_search_indexes():
+    """使用本機索引前確認其包含其他程序寫入的 chunk（例如規劃器的允許清單不可遺漏新文件）"""
+    if stale_search_indexes(corpus_version.current()):
+        await asyncio.to_thread(sync_stale_search_indexes)
+
+def lexical_distances(hits: List[Tuple[int, float]]) -> Dict[int, float]:
+    """將 BM25 分數轉換為越小越相關的距離值，與向量距離同向排序"""
+    return {chunk_id: 1.0 / (1.0 + score) for chunk_id, score in hits}
+
+def fused_distances(vector_distances: Dict[int, float], lexical_hits: List[Tuple[int, float]]) -> Dict[int, float]:
+    """以 RRF 融合向量與詞彙排名，分數正規化後轉為距離（兩邊皆排第一時為 0）"""
+    vector_ranking = sorted(vector_distances, key=vector_distances.get)
+    lexical_ranking = [chunk_id for chunk_id, _ in lexical_hits]
+    best_score = 2.0 / (RRF_K + 1)
+    return {
+        chunk_id: 1.0 - score / best_score
+        for chunk_id, score in reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+    }
+
+def local_index_candidates(query_embedding: List[float],
+                           k: int,
+                           allow_ids: Optional[Any] = None) -> Optional[Dict[int, float]]:
+    """從本機索引取得候選 embeddings.id 與距離，索引不可用時回傳 None"""
+    if local_vector_index is None or len(local_vector_index) == 0:
+        return None
+    try:
+        return dict(local_vector_index.search(query_embedding, k, allow_ids))
+    except Exception as e:
+        print(f"Local vector index error: {e}")
+        return None
+
+async def fetch_embedding_rows(db: AsyncDatabase, candidates: Dict[int, float], limit: int) -> List[Dict[str, Any]]:
+    """以主鍵取回候選 chunk，附上距離並依距離排序"""
+    if not candidates:
+        return []
+    placeholders = ','.join(['%s'] * len(candidates))
+    rows = await db.fetch_all(
+        f"SELECT id, doc_id, chunk FROM embeddings WHERE id IN ({placeholders})",
+        list(candidates)
+    )
+    for row in rows:
+        row["distance"] = candidates[row.pop("id")]
+    rows.sort(key=lambda row: row["distance"])
+    return rows[:limit]
+
+@app.on_event("startup")
+async def detect_schema_capabilities():
+    """啟動時偵測一次資料表與欄位"""
+    capabilities = await asyncio.to_thread(schema_registry.refresh)
+    print(f"Schema capabilities: {len(capabilities.tables)} tables, "
+          f"metadata_join={capabilities.metadata_join}, time_series={capabilities.time_series}")
+
+@app.on_event("startup")
+async def load_local_vector_index():
+    """啟動時載入本機向量索引，並從資料庫補齊新資料列"""
+    if local_vector_index is None:
+        return
+    await asyncio.to_thread(local_vector_index.load)
+    added = await asyncio.to_thread(sync_local_vector_index)
+    print(f"Local vector index ready: {len(local_vector_index)} vectors ({added} synced from {storage.name})")
+
+@app.on_event("startup")
+async def load_local_search_indexes():
+    """啟動時建立詞彙索引與中繼資料索引"""
+    if lexical_index is not None:
+        added = await asyncio.to_thread(sync_lexical_index)
+        print(f"Lexical index ready: {len(lexical_index)} chunks ({added} synced from {storage.name})")
+    if metadata_index is not None:
+        await asyncio.to_thread(sync_metadata_index)
+        if metadata_index.ready:
+            print(f"Metadata index ready: {len(metadata_index)} chunks")
+
+@app.on_event("startup")
+async def start_replication_heartbeat():
+    """啟用讀寫分離時於背景追蹤副本延遲"""
+    global replication_heartbeat
+    if db_router is not None:
+        replication_heartbeat = asyncio.create_task(db_router.run_heartbeat())
+
+replication_heartbeat: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_ingest_workers():
+    """啟動 OCR worker 程序與上傳處理 worker；先前未完成的工作自佇列繼續"""
+    await ocr_pool.start()
+    ingest_workers.start()
+    print(f"Ingest workers ready: {ingest_workers.workers} workers, queue {job_queue.stats()['jobs']}")
+
+@app.on_event("shutdown")
+async def stop_ingest_workers():
+    await ingest_workers.stop()
+    job_queue.close()
+    await ocr_pool.close()
+
+@app.on_event("shutdown")
+async def close_async_database():
+    if replication_heartbeat is not None:
+        replication_heartbeat.cancel()
+    if db_router is not None:
+        await db_router.replica.close()
+        db_router.replica_pool.close()
+    await storage.close()
+
+@app.on_event("shutdown")
+async def save_local_vector_index():
+    """關閉時儲存本機向量索引"""
+    if local_vector_index is not None and local_vector_index.dirty:
+        await asyncio.to_thread(local_vector_index.save)
+
+async def vector_search(query_text: str,
+                        limit: int = 4,
+                        query_embedding: Optional[List[float]] = None,
+                        vector_candidates: Optional[Dict[int, float]] = None) -> List[Dict[str, Any]]:
+    """在儲存後端執行向量搜尋；批次查詢可傳入已算好的查詢向量與本機索引候選"""
     try:
         # 產生查詢向量
-        query_embedding = await get_embedding(query_text)
+        if query_embedding is None:
+            query_embedding = await get_embedding(query_text)
         if not query_embedding:
             return []
 
-        conn = get_tidb_cloud_connection()
-        if not conn:
+        db = search_db()
+        if db is None:
             # Fallback to text search if no vector db
             return []
 
-        cursor = conn.cursor(dictionary=True)
+        # 本機索引可用時，只需以主鍵取回 top-k 的 chunk
+        candidates = vector_candidates
+        if candidates is None:
+            candidates = local_index_candidates(query_embedding, limit)
+        if candidates is not None:
+            return await fetch_embedding_rows(db, candidates, limit)
 
         # 向量相似度搜尋 SQL - 使用 JSON_EXTRACT 從 JSON 字串中提取向量
         search_sql = """
@@ -237,22 +786,68 @@ async def vector_search(query_text: str, limit: int = 4) -> List[Dict[str, Any]]
         LIMIT %s
         """
 
-        # 將 embedding 轉換為 JSON 字串格式
-        embedding_json = "[" + ",".join(map(str, query_embedding)) + "]"
-
-        cursor.execute(search_sql, (embedding_json, limit))
-        results = cursor.fetchall()
+        # 將 embedding 編碼為精簡的 VECTOR 字面值
+        embedding_literal = to_sql_literal(query_embedding)
 
-        cursor.close()
-        conn.close()
-
-        return results
+        return await db.fetch_all(search_sql, (embedding_literal, limit))
 
     except Exception as e:
         print(f"Vector search error: {e}")
         return []
 
 async def multi_dimensional_search(
+    query_text: str,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    family_member: Optional[str] = None,
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+    search_mode: str = "hybrid",
+    limit: int = 4,
+    tag_mode: str = "any",
+    query_embedding: Optional[List[float]] = None,
+    vector_candidates: Optional[Dict[int, float]] = None,
+    timings: Optional[Dict[str, Dict[str, float]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    多維度搜尋（含檢索結果快取）
+    參數相同且語料世代未變時直接回傳先前的結果，/api/query 與 /api/search/advanced 共用；
+    query_embedding 與 vector_candidates 只是預先算好的中間結果，不影響快取鍵；
+    傳入 timings 字典時記錄各階段耗時
+    """
+    if search_cache is None:
+        return await _multi_dimensional_search(
+            query_text, category, tags, date_from, date_to, family_member,
+            amount_min, amount_max, search_mode, limit, tag_mode=tag_mode,
+            query_embedding=query_embedding, vector_candidates=vector_candidates,
+            timings=timings
+        )
+
+    started = time.perf_counter()
+    generation = corpus_version.current()
+    key = search_cache_key(
+        query_text, category, tags, tag_mode, date_from, date_to,
+        family_member, amount_min, amount_max, search_mode, limit
+    )
+    cached = search_cache.get(key)
+    merge_timings(timings, {"search_cache": stage_timing(started, started)})
+    if cached is not None:
+        return cached
+
+    results = await _multi_dimensional_search(
+        query_text, category, tags, date_from, date_to, family_member,
+        amount_min, amount_max, search_mode, limit, tag_mode=tag_mode,
+        query_embedding=query_embedding, vector_candidates=vector_candidates,
+        timings=timings
+    )
+    # 空結果可能來自連線錯誤，不快取
+    if results:
+        search_cache.put(key, results, generation)
+    return results
+
+async def _multi_dimensional_search(
     query_text: str, 
     category: Optional[str] = None,
     tags: Optional[List[str]] = None,
@@ -262,7 +857,12 @@ async def multi_dimensional_search(
     amount_min: Optional[float] = None,
     amount_max: Optional[float] = None,
     search_mode: str = "hybrid",
-    limit: int = 4
+    limit: int = 4,
+    use_local_index: bool = True,
+    tag_mode: str = "any",
+    query_embedding: Optional[List[float]] = None,
+    vector_candidates: Optional[Dict[int, float]] = None,
+    timings: Optional[Dict[str, Dict[str, float]]] = None
 ) -> List[Dict[str, Any]]:
     """
     多維度搜尋功能，支援語義搜尋與條件過濾的組合
@@ -274,30 +874,175 @@ async def multi_dimensional_search(
         date_from/date_to: 日期範圍過濾
         family_member: 家庭成員過濾
         amount_min/amount_max: 金額範圍過濾
-        search_mode: 搜尋模式 (semantic, filter, hybrid)
+        search_mode: 搜尋模式 (semantic, lexical, filter, hybrid)
         limit: 結果數量限制
+        use_local_index: 是否使用本機向量索引取得候選
+        tag_mode: 標籤比對方式，any 為任一標籤、all 為全部標籤
+        query_embedding: 預先算好的查詢向量（批次查詢以單一請求取得）
+        vector_candidates: 無過濾條件時預先算好的本機索引候選（批次查詢以單次矩陣搜尋取得）
+        timings: 傳入時記錄各階段（plan、lexical、embed、vector、fetch）的開始時間與耗時
     
     Returns:
         搜尋結果列表
     """
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            return []
+        if use_local_index:
+            await refresh_search_indexes()
+        # 由快取的 schema 能力決定是否可連接文件中繼資料
+        capabilities = schema_registry.get()
+        has_document_id = capabilities.metadata_join
+        has_filters = has_document_id and any([
+            tags, category, family_member, date_from, date_to,
+            amount_min is not None, amount_max is not None
+        ])
+        candidate_distances: Optional[Dict[int, float]] = None
+        prefiltered = False
+        lexical_ready = use_local_index and lexical_index is not None and lexical_index.ready
 
-        cursor = conn.cursor(dictionary=True)
-        
-        # 檢查 embeddings 表是否有 document_id 欄位
-        cursor.execute("DESCRIBE embeddings")
-        columns = [col[0] for col in cursor.fetchall()]
-        has_document_id = 'document_id' in columns
-        
-        # 建構基本查詢
         if search_mode == "semantic":
             # 純語義搜尋模式
-            return await vector_search(query_text, limit)
-            
-        elif search_mode == "filter":
+            return await vector_search(query_text, limit, query_embedding, vector_candidates)
+
+        if search_mode == "lexical" and not lexical_ready:
+            # 詞彙索引不可用時改以混合模式搜尋
+            search_mode = "hybrid"
+        # 關鍵字型查詢先看詞彙索引是否有結果，有結果時省去 embedding 往返
+        keyword_query = search_mode == "hybrid" and lexical_ready and looks_like_keyword_query(query_text)
+
+        def plan_stage(_) -> Optional[QueryPlan]:
+            # 有過濾條件時依選擇性決定：允許清單內評分、超量取回後過濾，或交由 TiDB 掃描
+            if not (use_local_index and has_filters and query_planner is not None):
+                return None
+            if search_mode == "lexical":
+                has_local_index = lexical_ready
+            else:
+                has_local_index = local_vector_index is not None and len(local_vector_index) > 0
+            return query_planner.plan(
+                limit, has_local_index, tag_filter=capabilities.tag_filter,
+                category=category, tags=tags, tag_mode=tag_mode, family_member=family_member,
+                date_from=date_from, date_to=date_to, amount_min=amount_min, amount_max=amount_max
+            )
+
+        def allowed_for(plan: Optional[QueryPlan]) -> Optional[Any]:
+            return plan.allowed_ids if plan is not None and plan.strategy == PLAN_PREFILTER else None
+
+        def candidate_k(plan: Optional[QueryPlan]) -> int:
+            if plan is not None:
+                return plan.candidate_k
+            # 沒有計畫（未使用本機索引）時沿用固定的超量取回倍數
+            return limit * VECTOR_INDEX_OVERFETCH if has_filters else limit
+
+        def metadata_scan(plan: Optional[QueryPlan]) -> bool:
+            return plan is not None and plan.strategy == PLAN_METADATA_SCAN and search_mode != "lexical"
+
+        def lexical_stage(results) -> List[Tuple[int, float]]:
+            plan = results["plan"]
+            if not lexical_ready or search_mode not in ("lexical", "hybrid") or metadata_scan(plan):
+                return []
+            return lexical_index.search(query_text, candidate_k(plan), allowed_for(plan))
+
+        async def embed_stage(results) -> Optional[List[float]]:
+            if search_mode != "hybrid":
+                return None
+            if query_embedding is not None:
+                return query_embedding
+            if keyword_query and results["lexical"]:
+                return None
+            return await get_embedding(query_text)
+
+        def vector_stage(results) -> Optional[Dict[int, float]]:
+            # 本機索引提供候選，資料庫只負責過濾與取回中繼資料
+            plan = results["plan"]
+            if not results["embed"] or not use_local_index or metadata_scan(plan):
+                return None
+            if vector_candidates is not None and not has_filters:
+                return dict(vector_candidates)
+            return local_index_candidates(results["embed"], candidate_k(plan), allowed_for(plan))
+
+        # 查詢向量與本機候選彼此獨立，同時進行
+        started = time.perf_counter()
+        graph = StageGraph()
+        # 基數統計過期時需查詢 TiDB
+        graph.add("plan", plan_stage, blocking=True)
+        # 關鍵字型查詢的 embedding 取決於詞彙結果，其餘查詢不等待詞彙搜尋
+        graph.add("lexical", lexical_stage, after=["plan"], blocking=True)
+        graph.add("embed", embed_stage, after=["lexical"] if keyword_query and query_embedding is None else [])
+        graph.add("vector", vector_stage, after=["embed", "plan"], blocking=True)
+        stage_results, stage_timings = await graph.run()
+        merge_timings(timings, stage_timings)
+
+        db = search_db()
+        if db is None:
+            return []
+
+        plan = stage_results["plan"]
+        allowed_ids = allowed_for(plan)
+        local_k = candidate_k(plan)
+        lexical_hits = stage_results["lexical"]
+        query_embedding = stage_results["embed"]
+
+        if search_mode == "lexical":
+            # 純詞彙搜尋模式：BM25 候選，不需要 embedding
+            candidate_distances = lexical_distances(lexical_hits)
+            prefiltered = allowed_ids is not None
+
+        elif search_mode == "hybrid":
+            # 混合模式：結合語義搜尋、詞彙搜尋和過濾條件
+            if lexical_hits and keyword_query:
+                # 關鍵字型查詢直接採用詞彙索引結果
+                candidate_distances = lexical_distances(lexical_hits)
+                prefiltered = allowed_ids is not None
+            else:
+                candidate_distances = stage_results["vector"]
+                prefiltered = allowed_ids is not None and candidate_distances is not None
+                if candidate_distances is not None and lexical_hits:
+                    # 向量與詞彙排名以 RRF 融合
+                    candidate_distances = fused_distances(candidate_distances, lexical_hits)
+                elif not query_embedding and lexical_hits:
+                    candidate_distances = lexical_distances(lexical_hits)
+                    prefiltered = allowed_ids is not None
+                elif not query_embedding:
+                    # 如果無法生成向量，回退到純過濾模式
+                    search_mode = "filter"
+
+        # 建構基本查詢
+        if candidate_distances is not None:
+            # 距離已由本機索引算出，只需以主鍵取回並過濾
+            if has_document_id:
+                base_sql = """
+                SELECT e.id AS embedding_id, e.doc_id, e.chunk, 0.0 as distance,
+                       d.filename, c.name as category, d.document_date, 
+                       d.extracted_amount, fm.name as family_member
+                FROM embeddings e
+                JOIN documents d ON e.document_id = d.id
+                LEFT JOIN categories c ON d.category_id = c.id
+                LEFT JOIN family_members fm ON d.family_member_id = fm.id
+                """
+            else:
+                base_sql = """
+                SELECT e.id AS embedding_id, e.doc_id, e.chunk, 0.0 as distance
+                FROM embeddings e
+                """
+        elif search_mode == "hybrid":
+            embedding_literal = to_sql_literal(query_embedding)
+            if has_document_id:
+                base_sql = """
+                SELECT e.doc_id, e.chunk,
+                       VEC_COSINE_DISTANCE(CAST(e.vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance,
+                       d.filename, c.name as category, d.document_date, 
+                       d.extracted_amount, fm.name as family_member
+                FROM embeddings e
+                JOIN documents d ON e.document_id = d.id
+                LEFT JOIN categories c ON d.category_id = c.id
+                LEFT JOIN family_members fm ON d.family_member_id = fm.id
+                """
+            else:
+                base_sql = """
+                SELECT e.doc_id, e.chunk,
+                       VEC_COSINE_DISTANCE(CAST(e.vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance
+                FROM embeddings e
+                """
+        else:
             # 純過濾模式（不使用向量搜尋）
             if has_document_id:
                 # 使用 document_id 連接（新版 schema）
@@ -316,68 +1061,32 @@ async def multi_dimensional_search(
                 SELECT e.doc_id, e.chunk, 0.0 as distance
                 FROM embeddings e
                 """
-            
-        else:  # hybrid mode
-            # 混合模式：結合語義搜尋和過濾條件
-            query_embedding = await get_embedding(query_text)
-            if not query_embedding:
-                # 如果無法生成向量，回退到純過濾模式
-                search_mode = "filter"
-                if has_document_id:
-                    base_sql = """
-                    SELECT e.doc_id, e.chunk, 0.0 as distance,
-                           d.filename, c.name as category, d.document_date, 
-                           d.extracted_amount, fm.name as family_member
-                    FROM embeddings e
-                    JOIN documents d ON e.document_id = d.id
-                    LEFT JOIN categories c ON d.category_id = c.id
-                    LEFT JOIN family_members fm ON d.family_member_id = fm.id
-                    """
-                else:
-                    base_sql = """
-                    SELECT e.doc_id, e.chunk, 0.0 as distance
-                    FROM embeddings e
-                    """
-            else:
-                embedding_json = "[" + ",".join(map(str, query_embedding)) + "]"
-                if has_document_id:
-                    base_sql = """
-                    SELECT e.doc_id, e.chunk,
-                           VEC_COSINE_DISTANCE(CAST(e.vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance,
-                           d.filename, c.name as category, d.document_date, 
-                           d.extracted_amount, fm.name as family_member
-                    FROM embeddings e
-                    JOIN documents d ON e.document_id = d.id
-                    LEFT JOIN categories c ON d.category_id = c.id
-                    LEFT JOIN family_members fm ON d.family_member_id = fm.id
-                    """
-                else:
-                    base_sql = """
-                    SELECT e.doc_id, e.chunk,
-                           VEC_COSINE_DISTANCE(CAST(e.vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance
-                    FROM embeddings e
-                    """
         
         # 建構過濾條件（只有在有 document_id 時才能使用）
         conditions = []
         params = []
         
-        # 添加向量搜尋參數（如果使用混合模式）
-        if search_mode == "hybrid" and query_embedding:
-            params.append(embedding_json)
+        # 添加向量搜尋參數（如果使用混合模式且未使用本機索引）
+        if search_mode == "hybrid" and query_embedding and candidate_distances is None:
+            params.append(embedding_literal)
         
         # 只有在有 document_id 且有相關表格連接時才能使用以下過濾條件
         if has_document_id:
-            # 添加標籤過濾
-            if tags:
-                tag_join = """
-                JOIN document_tags dt ON d.id = dt.document_id
-                JOIN tags t ON dt.tag_id = t.id
-                """
-                base_sql = base_sql.replace("FROM embeddings e", f"FROM embeddings e {tag_join}")
+            # 添加標籤過濾（以子查詢比對，不因多個符合標籤而重複列出 chunk）
+            if tags and capabilities.tag_filter:
                 tag_placeholders = ','.join(['%s'] * len(tags))
-                conditions.append(f"t.name IN ({tag_placeholders})")
-                params.extend(tags)
+                tag_subquery = f"""
+                    SELECT {{}} FROM document_tags dt
+                    JOIN tags t ON dt.tag_id = t.id
+                    WHERE dt.document_id = d.id AND t.name IN ({tag_placeholders})
+                """
+                if tag_mode == "all":
+                    conditions.append(f"({tag_subquery.format('COUNT(DISTINCT t.name)')}) = %s")
+                    params.extend(tags)
+                    params.append(len(set(tags)))
+                else:
+                    conditions.append(f"EXISTS ({tag_subquery.format('1')})")
+                    params.extend(tags)
             
             # 添加其他過濾條件
             if category:
@@ -404,12 +1113,23 @@ async def multi_dimensional_search(
                 conditions.append("d.extracted_amount <= %s")
                 params.append(amount_max)
         
+        # 限定在本機索引的候選範圍內
+        if candidate_distances is not None:
+            if not candidate_distances:
+                return []
+            candidate_placeholders = ','.join(['%s'] * len(candidate_distances))
+            conditions.append(f"e.id IN ({candidate_placeholders})")
+            params.extend(candidate_distances)
+        
         # 組合條件
         if conditions:
             base_sql += " WHERE " + " AND ".join(conditions)
         
         # 排序和限制
-        if search_mode == "hybrid" and query_embedding:
+        if candidate_distances is not None:
+            # 距離已由本機索引算出，於取回後排序
+            pass
+        elif search_mode == "hybrid" and query_embedding:
             base_sql += " ORDER BY distance ASC"
         elif has_document_id:
             base_sql += " ORDER BY d.created_at DESC"
@@ -417,13 +1137,36 @@ async def multi_dimensional_search(
             base_sql += " ORDER BY e.id DESC"
         
         base_sql += " LIMIT %s"
-        params.append(limit)
-        
-        cursor.execute(base_sql, params)
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        params.append(len(candidate_distances) if candidate_distances is not None else limit)
+        
+        fetch_started = time.perf_counter()
+        results = await db.fetch_all(base_sql, params)
+        merge_timings(timings, {
+            "fetch": stage_timing(started, fetch_started),
+            "total": stage_timing(started, started),
+        })
+        
+        if candidate_distances is not None:
+            for row in results:
+                row["distance"] = candidate_distances[row.pop("embedding_id")]
+            results.sort(key=lambda row: row["distance"])
+            
+            # 過濾後候選不足時改由 TiDB 完整查詢：
+            # 預先過濾時表示點陣圖索引與資料庫不一致，否則表示超量取回的候選已截斷但仍不夠
+            if prefiltered:
+                fallback = len(results) < len(candidate_distances)
+            else:
+                fallback = len(results) < limit and len(candidate_distances) >= local_k
+            if fallback:
+                fallback_timings: Optional[Dict[str, Dict[str, float]]] = {} if timings is not None else None
+                fallback_results = await _multi_dimensional_search(
+                    query_text, category, tags, date_from, date_to, family_member,
+                    amount_min, amount_max, search_mode, limit, use_local_index=False,
+                    tag_mode=tag_mode, query_embedding=query_embedding, timings=fallback_timings
+                )
+                merge_timings(timings, fallback_timings or {}, prefix="fallback_")
+                return fallback_results
+            return results[:limit]
         
         return results
         
@@ -431,16 +1174,17 @@ async def multi_dimensional_search(
         print(f"Multi-dimensional search error: {e}")
         return []
 
-async def generate_rag_response(query: str, contexts: List[Dict[str, Any]]) -> str:
-    """使用 OpenAI GPT 產生 RAG 回應"""
-    try:
-        if not openai_client or not contexts:
-            return f"無法回答問題「{query}」，因為缺少相關文檔或 API 設定。"
+async def answer_with_context(query: str, search_results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """組裝提示詞內容後生成回應，回傳 (回答, 組裝統計)"""
+    contexts, packing_stats = context_packer.pack(search_results)
+    return await generate_rag_response(query, contexts), packing_stats
 
-        # 建構 context
-        context_text = "\n\n".join([ctx["chunk"] for ctx in contexts])
+def rag_messages(query: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """建構 RAG 提示詞"""
+    # 建構 context
+    context_text = "\n\n".join([ctx["chunk"] for ctx in contexts])
 
-        prompt = f"""根據以下文檔內容回答問題。如果文檔中沒有相關資訊，請說明無法找到相關資訊。
+    prompt = f"""根據以下文檔內容回答問題。如果文檔中沒有相關資訊，請說明無法找到相關資訊。
 
 文檔內容：
 {context_text}
@@ -449,144 +1193,294 @@ async def generate_rag_response(query: str, contexts: List[Dict[str, Any]]) -> s
 
 回答："""
 
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "你是一個有用的助手，會根據提供的文檔內容回答問題。"},
-                {"role": "user", "content": prompt}
-            ],
+    return [
+        {"role": "system", "content": "你是一個有用的助手，會根據提供的文檔內容回答問題。"},
+        {"role": "user", "content": prompt}
+    ]
+
+async def generate_rag_response(query: str, contexts: List[Dict[str, Any]]) -> str:
+    """使用 OpenAI GPT 產生 RAG 回應"""
+    try:
+        if not llm_provider or not contexts:
+            return f"無法回答問題「{query}」，因為缺少相關文檔或 API 設定。"
+
+        return await llm_provider.chat(
+            model=CHAT_MODEL,
+            messages=rag_messages(query, contexts),
             max_tokens=1000,
             temperature=0.7
         )
 
-        return response.choices[0].message.content.strip()
-
     except Exception as e:
         print(f"GPT response error: {e}")
         return f"生成回應時發生錯誤：{str(e)}"
 
-async def process_uploaded_file(file_path: Path) -> Dict[str, Any]:
-    """處理上傳的檔案：OCR -> 分類 -> 分塊 -> 向量化 -> 儲存"""
-    try:
-        # Step 1: OCR 提取
-        ocr_output_dir = Path("ocr_txt")
-        ocr_output_dir.mkdir(exist_ok=True)
-
-        # 執行 OCR 腳本
-        cmd = ["python", "scripts/ocr_extract.py", str(file_path), "--output-dir", str(ocr_output_dir)]
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=Path.cwd())
-
-        if result.returncode != 0:
-            print(f"OCR failed: {result.stderr}")
-            return {"success": False, "error": "OCR processing failed"}
-
-        # Step 2: 找到提取的文字檔案
-        txt_filename = file_path.stem + ".txt"
-        txt_path = ocr_output_dir / txt_filename
-
-        if not txt_path.exists():
-            # 嘗試 OCR 後綴
-            txt_filename = file_path.stem + "_ocr.txt"
-            txt_path = ocr_output_dir / txt_filename
-
-        if not txt_path.exists():
-            print(f"OCR output not found: {txt_path}")
-            return {"success": False, "error": "OCR output not found"}
-
-        # Step 3: 讀取文字內容
-        with open(txt_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        # Step 4: 智能分類
-        print("Classifying document...")
-        classification_result = document_classifier.classify_document(content)
-        print(f"Classification result: {classification_result}")
-
-        # Step 5: 儲存文件元資料
-        file_stats = file_path.stat()
-        document_id = document_classifier.save_document_metadata(
-            filename=file_path.name,
-            file_path=str(file_path),
-            classification_result=classification_result,
-            ocr_text=content,
-            file_size=file_stats.st_size,
-            mime_type=""  # 可以根據副檔名判斷
-        )
+async def stream_rag_response(query: str, contexts: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """以串流方式產生 RAG 回應，逐段回傳文字；錯誤由呼叫端處理"""
+    if not llm_provider or not contexts:
+        yield f"無法回答問題「{query}」，因為缺少相關文檔或 API 設定。"
+        return
+
+    async for text in llm_provider.chat_stream(
+        model=CHAT_MODEL,
+        messages=rag_messages(query, contexts),
+        max_tokens=1000,
+        temperature=0.7
+    ):
+        yield text
+
+# --- Ingestion pipeline ---
+# 上傳的檔案由工作佇列依階段處理；各階段的輸出保存在工作狀態，重試時從失敗的階段繼續
+
+def record_job_write(job: Job):
+    """階段提交寫入後，上傳者的讀取在副本追上前改由主庫回應（可立即看到處理進度與新 chunk）"""
+    record_write(job.payload.get("client"))
+
+async def ocr_stage(job: Job) -> Dict[str, Any]:
+    """OCR 提取文字"""
+    file_path = Path(job.payload["file_path"])
+    document_id = job.payload.get("document_id")
+    if document_id is not None:
+        await asyncio.to_thread(document_classifier.update_processing_status, document_id, "processing")
+        record_job_write(job)
+
+    # 由常駐的 OCR worker 程序擷取，文字直接回傳
+    return {"text": await ocr_pool.extract(file_path)}
+
+async def classify_stage(job: Job) -> Dict[str, Any]:
+    """智能分類"""
+    print("Classifying document...")
+    classification_result = await document_classifier.classify_document(job.state["text"])
+    print(f"Classification result: {classification_result}")
+    return {"classification": classification_result}
+
+async def metadata_stage(job: Job) -> Dict[str, Any]:
+    """儲存文件元資料（更新上傳時建立的 pending 記錄）"""
+    file_path = Path(job.payload["file_path"])
+    # 文件、分類與標籤於單一交易寫入（阻塞式，於執行緒中執行）
+    document_id = await asyncio.to_thread(
+        document_classifier.save_document_metadata,
+        filename=file_path.name,
+        file_path=str(file_path),
+        classification_result=job.state["classification"],
+        ocr_text=job.state["text"],
+        file_size=file_path.stat().st_size,
+        mime_type="",  # 可以根據副檔名判斷
+        document_id=job.payload.get("document_id"),
+        processing_status="processing"
+    )
+    if document_id is None:
+        raise RuntimeError("Failed to save document metadata")
+    record_job_write(job)
+    return {"document_id": document_id}
+
+async def embed_stage(job: Job) -> Dict[str, Any]:
+    """文字分塊、向量化並儲存到資料庫"""
+    content = job.state["text"]
+    document_id = job.state["document_id"]
+    doc_id = Path(job.payload["file_path"]).stem
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    chunks = text_splitter.split_text(content)
+
+    # 所有 chunk 一次送入批次處理器，與其他進行中的上傳合併請求
+    embeddings = await get_embeddings(chunks)
+    missing = sum(1 for embedding in embeddings if not embedding)
+    if missing:
+        # get_embeddings 於 OpenAI 失敗時回傳 None；交由工作佇列重試，不寫入缺少向量的文件
+        raise RuntimeError(f"Embedding failed for {missing}/{len(chunks)} chunks")
+
+    # 取得 embedding 後才借出連線，等待 OpenAI 期間不佔用連線池
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
 
-        # Step 6: 文字分塊
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
+    try:
+        capabilities = schema_registry.get()
+        if job.attempt > 1:
+            # 先前的嘗試可能已提交部分批次；doc_id（檔名主幹）可能與其他文件相同，只能以 document_id 刪除
+            if capabilities.embeddings_has_document_id:
+                deleted_ids = await asyncio.to_thread(delete_document_embeddings, conn, document_id)
+                if deleted_ids:
+                    record_job_write(job)
+                await asyncio.to_thread(remove_from_local_indexes, deleted_ids)
+            else:
+                print(f"embeddings 缺少 document_id 欄位，無法安全清除文件 {document_id} 先前嘗試的 chunk")
+
+        columns = ["doc_id", "chunk", "vec"]
+        row_template = "(%s, %s, CAST(%s AS VECTOR(1536))"
+        if capabilities.embeddings_has_document_id:
+            columns.append("document_id")
+            row_template += ", %s"
+        row_template += ")"
+
+        inserted_vectors = []
+        inserted_chunks = []
+        rows = []
+        for chunk_text, embedding in zip(chunks, embeddings):
+            if embedding:
+                # 將 embedding 編碼為精簡的 VECTOR 字面值
+                values = (doc_id, chunk_text, to_sql_literal(embedding))
+                if capabilities.embeddings_has_document_id:
+                    values += (document_id,)
+                rows.append(values)
+                inserted_vectors.append(embedding)
+                inserted_chunks.append(chunk_text)
+
+        # 多列 VALUES 批次寫入，每批一次往返與一次提交（於執行緒中執行，不阻塞 event loop）
+        writer = BulkWriter(conn, batch_size=BULK_INSERT_BATCH_SIZE)
+        inserted_ids = await asyncio.to_thread(
+            writer.insert, "embeddings", columns, rows, row_template=row_template, returning_ids=True
         )
-        chunks = text_splitter.split_text(content)
+        record_job_write(job)
+    finally:
+        conn.close()
 
-        # Step 7: 向量化並儲存到 TiDB Cloud
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            print("Cannot connect to TiDB Cloud")
-            return {"success": False, "error": "Database connection failed"}
+    # 增量更新本機向量索引、詞彙索引與中繼資料索引
+    await add_to_local_vector_index(inserted_ids, inserted_vectors)
+    if lexical_index is not None and lexical_index.ready:
+        lexical_index.add(inserted_ids, inserted_chunks)
+    if metadata_index is not None and metadata_index.ready:
+        await asyncio.to_thread(sync_metadata_index)
 
-        cursor = conn.cursor()
-        doc_id = file_path.stem
+    # 語料已變動，先前的快取結果失效（於索引更新後，避免以舊索引結果重新填入快取）
+    corpus_version.bump()
 
-        for chunk_text in chunks:
-            embedding = await get_embedding(chunk_text)
-            if embedding:
-                # 將 embedding 轉換為 JSON 字串格式
-                embedding_json = "[" + ",".join(map(str, embedding)) + "]"
-                insert_sql = "INSERT INTO embeddings (doc_id, chunk, vec, document_id) VALUES (%s, %s, CAST(%s AS VECTOR(1536)), %s)"
-                cursor.execute(insert_sql, (doc_id, chunk_text, embedding_json, document_id))
+    print(f"Successfully embedded {Path(job.payload['file_path']).name}: {len(inserted_ids)} chunks")
+    return {"chunks_count": len(inserted_ids)}
 
-        conn.commit()
+def delete_document_embeddings(conn, document_id: int) -> List[int]:
+    """刪除文件的所有 chunk，回傳被刪除的 embeddings.id"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM embeddings WHERE document_id = %s", (document_id,))
+        ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            cursor.execute("DELETE FROM embeddings WHERE document_id = %s", (document_id,))
+            conn.commit()
+        return ids
+    finally:
         cursor.close()
 
-        # Step 8: 提取時間序列數據
-        print("Extracting time series data...")
-        try:
-            # 重新建立連接進行時間序列處理
-            conn_ts = get_tidb_cloud_connection()
-            if conn_ts:
-                document_date = classification_result.get('extracted_date')
-                if isinstance(document_date, str):
-                    # 轉換字串日期為 date 對象
-                    try:
-                        document_date = datetime.strptime(document_date, "%Y-%m-%d").date()
-                    except ValueError:
-                        document_date = date.today()
-                elif not document_date:
+def remove_from_local_indexes(ids: List[int]):
+    """自本機向量、詞彙與中繼資料索引移除已刪除的 chunk"""
+    if not ids:
+        return
+    if local_vector_index is not None:
+        local_vector_index.remove(ids)
+    if lexical_index is not None:
+        lexical_index.remove(ids)
+    if metadata_index is not None:
+        metadata_index.remove(ids)
+    corpus_version.bump()
+
+async def timeseries_stage(job: Job) -> Dict[str, Any]:
+    """提取時間序列數據，完成後將文件標記為 completed"""
+    document_id = job.state["document_id"]
+    classification_result = job.state["classification"]
+    print("Extracting time series data...")
+    time_series_count = None
+    try:
+        if schema_registry.get().time_series:
+            document_date = classification_result.get('extracted_date')
+            if isinstance(document_date, str):
+                # 轉換字串日期為 date 對象
+                try:
+                    document_date = datetime.strptime(document_date, "%Y-%m-%d").date()
+                except ValueError:
                     document_date = date.today()
-                
-                # 提取時間序列數據
-                time_series_count = process_document_for_time_series(
-                    conn_ts, 
-                    document_id, 
-                    content, 
-                    document_date,
-                    None  # family_member_id，可以從分類結果中提取
-                )
-                conn_ts.close()
-                print(f"Extracted {time_series_count} time series data points")
-            else:
-                print("Cannot connect to database for time series extraction")
-        except Exception as ts_error:
-            print(f"Time series extraction error: {ts_error}")
-            # 不影響主要處理流程，繼續執行
+            elif not document_date:
+                document_date = date.today()
+
+            def extract() -> int:
+                conn = get_db_connection()
+                if not conn:
+                    raise RuntimeError("Database connection failed")
+                try:
+                    return process_document_for_time_series(
+                        conn,
+                        document_id,
+                        job.state["text"],
+                        document_date,
+                        None  # family_member_id，可以從分類結果中提取
+                    )
+                finally:
+                    conn.close()
+
+            # 提取時間序列數據（upsert，重試時不會重複寫入）
+            time_series_count = await asyncio.to_thread(extract)
+            record_job_write(job)
+            print(f"Extracted {time_series_count} time series data points")
+        else:
+            print("Time series tables not found, skipping extraction")
+    except Exception as ts_error:
+        print(f"Time series extraction error: {ts_error}")
+        # 不影響主要處理流程，繼續執行
+
+    if not await asyncio.to_thread(document_classifier.update_processing_status, document_id, "completed"):
+        raise RuntimeError("Failed to update processing status")
+    record_job_write(job)
+    return {"time_series_count": time_series_count}
+
+INGEST_PIPELINE = [
+    ("ocr", ocr_stage),
+    ("classify", classify_stage),
+    ("metadata", metadata_stage),
+    ("embed", embed_stage),
+    ("timeseries", timeseries_stage),
+]
 
-        conn.close()
+async def mark_document_failed(job: Job):
+    """工作移入死信時將文件標記為 failed"""
+    document_id = job.state.get("document_id") or job.payload.get("document_id")
+    if document_id is not None:
+        await asyncio.to_thread(document_classifier.update_processing_status, document_id, "failed")
+        record_job_write(job)
+
+# 常駐 OCR worker 程序（預先載入 unstructured、pytesseract 與 PIL）
+ocr_pool = OCRWorkerPool(
+    workers=OCR_WORKERS,
+    max_jobs_per_worker=OCR_MAX_JOBS_PER_WORKER,
+    timeout=OCR_TIMEOUT_SECONDS,
+    start_method=OCR_START_METHOD,
+)
 
-        print(f"Successfully processed {file_path.name}: {len(chunks)} chunks")
-        
-        return {
-            "success": True,
-            "document_id": document_id,
-            "classification": classification_result,
-            "chunks_count": len(chunks)
-        }
-        return True
+# 持久化的上傳處理佇列（本機 SQLite）與背景 worker
+job_queue = JobQueue(
+    INGEST_QUEUE_PATH,
+    max_attempts=INGEST_MAX_ATTEMPTS,
+    retry_base_seconds=INGEST_RETRY_BASE_SECONDS,
+    lease_seconds=INGEST_JOB_LEASE_SECONDS,
+    retention_seconds=INGEST_JOB_RETENTION_DAYS * 86400,
+)
+ingest_workers = JobWorkerPool(
+    job_queue,
+    {"upload": INGEST_PIPELINE},
+    workers=INGEST_WORKERS,
+    on_dead=mark_document_failed,
+)
 
-    except Exception as e:
-        print(f"File processing error: {e}")
-        return False
+def job_response(job: Dict[str, Any]) -> JobResponse:
+    state = job["state"]
+    return JobResponse(
+        job_id=job["id"],
+        status=job["status"],
+        progress=job["progress"],
+        current_stage=job["current_stage"],
+        stages=[JobStageResponse(**stage) for stage in job["stages"]],
+        error=job["error"],
+        filename=job["payload"].get("filename"),
+        document_id=state.get("document_id") or job["payload"].get("document_id"),
+        classification=state.get("classification"),
+        chunks_count=state.get("chunks_count"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        finished_at=job["finished_at"],
+        next_run_at=job["next_run_at"],
+    )
 
 @app.get("/")
 def read_root():
@@ -598,7 +1492,7 @@ async def health_check():
     return {"status": "ok", "message": "RAG Store API is running"}
 
 @app.post("/api/upload", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(http_request: Request, file: UploadFile = File(...)):
     """
     Upload a file for processing and storage.
     """
@@ -633,90 +1527,230 @@ async def upload_file(file: UploadFile = File(...)):
             content = await file.read()
             buffer.write(content)
 
-        # Process the file asynchronously
-        processing_result = await process_uploaded_file(file_path)
-
-        if processing_result["success"]:
-            message = "File uploaded and processed successfully"
-            return UploadResponse(
-                message=message,
-                filename=file.filename,
-                file_path=str(file_path),
-                document_id=processing_result.get("document_id"),
-                classification=processing_result.get("classification")
-            )
-        else:
-            message = f"File uploaded but processing failed: {processing_result.get('error', 'Unknown error')}"
-            return UploadResponse(
-                message=message,
-                filename=file.filename,
-                file_path=str(file_path)
-            )
+        # 建立 pending 文件記錄後交由工作佇列處理，不等待 OCR 與向量化
+        document_id = await asyncio.to_thread(
+            document_classifier.create_pending_document,
+            filename=file_path.name,
+            file_path=str(file_path),
+            file_size=len(content)
+        )
+        # 各階段提交時再以此客戶端記錄寫入，處理期間的讀取同樣走主庫
+        client = client_key(http_request)
+        job_id = ingest_workers.submit("upload", {
+            "file_path": str(file_path),
+            "filename": file.filename,
+            "document_id": document_id,
+            "client": client,
+        })
+        # 副本追上前此客戶端的讀取一律走主庫（可立即看到 pending 文件）
+        record_write(client)
+
+        return UploadResponse(
+            message="File uploaded and queued for processing",
+            filename=file.filename,
+            file_path=str(file_path),
+            document_id=document_id,
+            job_id=job_id,
+            status="queued"
+        )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.get("/api/jobs/stats")
+async def get_job_queue_stats():
+    """上傳處理佇列統計（各狀態工作數、worker 數、重試與死信次數）"""
+    return {**await asyncio.to_thread(ingest_workers.stats), "ocr": ocr_pool.stats()}
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """上傳處理工作的狀態與各階段進度"""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+@app.post("/api/jobs/{job_id}/retry", response_model=JobResponse)
+async def retry_job(job_id: str):
+    """將死信工作重新排入佇列，自失敗的階段繼續"""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != JOB_DEAD or not await asyncio.to_thread(job_queue.retry, job_id):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, only dead jobs can be retried")
+    document_id = job["state"].get("document_id") or job["payload"].get("document_id")
+    if document_id is not None:
+        await asyncio.to_thread(document_classifier.update_processing_status, document_id, "pending")
+    ingest_workers.notify()
+    return job_response(await asyncio.to_thread(job_queue.get, job_id))
+
+def build_query_response(request: QueryRequest,
+                         search_results: List[Dict[str, Any]],
+                         answer: str,
+                         metadata: Optional[Dict[str, Any]] = None) -> QueryResponse:
+    """整理來源資訊並在回答後附上搜尋統計；組裝統計與階段計時放在 metadata"""
+    return QueryResponse(
+        answer=answer + search_summary(request, search_results),
+        sources=build_sources(search_results),
+        metadata=metadata
+    )
+
+def build_sources(search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """準備來源資訊（包含更多元資料）"""
+    sources = []
+    for result in search_results:
+        source_metadata = {
+            "doc_id": result["doc_id"],
+            "distance": float(result.get("distance", 0)),
+            "filename": result.get("filename", ""),
+            "category": result.get("category", ""),
+            "document_date": str(result.get("document_date", "")),
+            "extracted_amount": result.get("extracted_amount"),
+            "family_member": result.get("family_member", "")
+        }
+        
+        sources.append({
+            "page_content": result["chunk"],
+            "metadata": source_metadata
+        })
+    return sources
+
+def search_summary(request: QueryRequest, search_results: List[Dict[str, Any]]) -> str:
+    """附加在回答後的搜尋統計資訊"""
+    summary = f"\n\n📊 搜尋結果統計：找到 {len(search_results)} 個相關文件片段"
+    if request.category:
+        summary += f"，分類：{request.category}"
+    if request.tags:
+        summary += f"，標籤：{', '.join(request.tags)}"
+    if request.date_from or request.date_to:
+        date_range = f"{request.date_from or '開始'} 至 {request.date_to or '現在'}"
+        summary += f"，日期範圍：{date_range}"
+    return summary
+
+def validate_date_filters(date_from: Optional[str], date_to: Optional[str]):
+    """日期篩選須為 YYYY-MM-DD；格式錯誤時回應 400，不讓查詢規劃失敗後回傳空結果"""
+    for name, value in (("date_from", date_from), ("date_to", date_to)):
+        try:
+            parse_date(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {name}: {value!r} (expected YYYY-MM-DD)")
+
+async def search_for_request(request: QueryRequest,
+                             query: str,
+                             limit: int = 4,
+                             timings: Optional[Dict[str, Dict[str, float]]] = None) -> List[Dict[str, Any]]:
+    """以查詢請求的過濾條件執行多維度搜尋"""
+    return await multi_dimensional_search(
+        query_text=query,
+        category=request.category,
+        tags=request.tags,
+        date_from=request.date_from,
+        date_to=request.date_to,
+        family_member=request.family_member,
+        amount_min=request.amount_min,
+        amount_max=request.amount_max,
+        search_mode=request.search_mode or "hybrid",
+        limit=limit,
+        tag_mode=request.tag_mode or "any",
+        timings=timings
+    )
+
+async def lookup_cached_answer(request: QueryRequest, query: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], int]:
+    """
+    語義回答快取：關鍵字型查詢只比對文字，其餘以查詢向量比對相似問題
+    回傳 (快取回答, 查詢向量, 查詢開始時的語料版本)，後兩者供存入快取使用
+    """
+    cache_vector = None
+    version = corpus_version.current()
+    if answer_cache is None:
+        return None, cache_vector, version
+    if not looks_like_keyword_query(query):
+        # embedding 快取與批次處理器會讓後續檢索重用這次的結果
+        cache_vector = await get_embedding(query)
+    cached = answer_cache.lookup(normalize_text(query), answer_cache_filter_key(request), cache_vector)
+    return cached, cache_vector, version
+
+def store_cached_answer(request: QueryRequest,
+                        query: str,
+                        response: QueryResponse,
+                        search_results: List[Dict[str, Any]],
+                        cache_vector: Optional[List[float]],
+                        version: int):
+    """只快取實際由文件生成的回答"""
+    if answer_cache is not None and search_results and llm_provider:
+        cached = response.model_dump()
+        if cached.get("metadata"):
+            # 階段計時只對當次請求有意義
+            cached["metadata"] = {key: value for key, value in cached["metadata"].items() if key != "timings"}
+        answer_cache.store(
+            normalize_text(query), answer_cache_filter_key(request),
+            cached, cache_vector, version
+        )
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """編碼一個 Server-Sent Events 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def has_query_filters(request: QueryRequest) -> bool:
+    """查詢是否帶有任何過濾條件"""
+    return any([
+        request.tags, request.category, request.family_member, request.date_from, request.date_to,
+        request.amount_min is not None, request.amount_max is not None
+    ])
+
+def batch_local_candidates(requests: List[QueryRequest],
+                           embeddings: List[Optional[List[float]]],
+                           limit: int) -> List[Optional[Dict[int, float]]]:
+    """無過濾條件的語義 / 混合查詢以單次矩陣搜尋取得本機索引候選，其餘位置為 None"""
+    candidates: List[Optional[Dict[int, float]]] = [None] * len(requests)
+    if local_vector_index is None or len(local_vector_index) == 0:
+        return candidates
+    eligible = [
+        i for i, (request, embedding) in enumerate(zip(requests, embeddings))
+        if embedding and (request.search_mode or "hybrid") in ("semantic", "hybrid")
+        and not has_query_filters(request)
+    ]
+    if not eligible:
+        return candidates
+    try:
+        hits = local_vector_index.search_many([embeddings[i] for i in eligible], limit)
+    except Exception as e:
+        print(f"Local vector index error: {e}")
+        return candidates
+    for i, query_hits in zip(eligible, hits):
+        candidates[i] = dict(query_hits)
+    return candidates
+
 @app.post("/api/query", response_model=QueryResponse)
 async def query_rag(request: QueryRequest):
     """
     處理多維度搜尋查詢，支援語義搜尋與條件過濾
     """
+    validate_date_filters(request.date_from, request.date_to)
     try:
         query = request.query.strip()
         if not query:
             raise HTTPException(status_code=400, detail="Query cannot be empty")
 
-        # 使用多維度搜尋功能
-        search_results = await multi_dimensional_search(
-            query_text=query,
-            category=request.category,
-            tags=request.tags,
-            date_from=request.date_from,
-            date_to=request.date_to,
-            family_member=request.family_member,
-            amount_min=request.amount_min,
-            amount_max=request.amount_max,
-            search_mode=request.search_mode or "hybrid",
-            limit=4
-        )
+        cached, cache_vector, version = await lookup_cached_answer(request, query)
+        if cached is not None:
+            return QueryResponse(**cached)
 
-        # 準備來源資訊（包含更多元資料）
-        sources = []
-        for result in search_results:
-            source_metadata = {
-                "doc_id": result["doc_id"],
-                "distance": float(result.get("distance", 0)),
-                "filename": result.get("filename", ""),
-                "category": result.get("category", ""),
-                "document_date": str(result.get("document_date", "")),
-                "extracted_amount": result.get("extracted_amount"),
-                "family_member": result.get("family_member", "")
-            }
-            
-            sources.append({
-                "page_content": result["chunk"],
-                "metadata": source_metadata
-            })
+        # 使用多維度搜尋功能
+        started = time.perf_counter()
+        timings: Dict[str, Dict[str, float]] = {}
+        search_results = await search_for_request(request, query, timings=timings)
 
         # 生成增強的回應（考慮過濾條件）
-        answer = await generate_rag_response(query, search_results)
-        
-        # 添加搜尋統計資訊
-        search_summary = f"\n\n📊 搜尋結果統計：找到 {len(search_results)} 個相關文件片段"
-        if request.category:
-            search_summary += f"，分類：{request.category}"
-        if request.tags:
-            search_summary += f"，標籤：{', '.join(request.tags)}"
-        if request.date_from or request.date_to:
-            date_range = f"{request.date_from or '開始'} 至 {request.date_to or '現在'}"
-            search_summary += f"，日期範圍：{date_range}"
-        
-        answer += search_summary
-
-        return QueryResponse(
-            answer=answer,
-            sources=sources
+        generate_started = time.perf_counter()
+        answer, packing_stats = await answer_with_context(query, search_results)
+        timings["generate"] = stage_timing(started, generate_started)
+        response = build_query_response(
+            request, search_results, answer,
+            {"context_packing": packing_stats, "timings": timings}
         )
+        store_cached_answer(request, query, response, search_results, cache_vector, version)
+        return response
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
@@ -729,17 +1763,146 @@ async def chat_rag(request: QueryRequest):
     # 直接呼叫查詢功能，保持一致性
     return await query_rag(request)
 
+@app.post("/api/chat/stream")
+async def chat_rag_stream(request: QueryRequest):
+    """
+    串流聊天端點（Server-Sent Events），檢索與快取行為與 /api/chat 相同
+    事件依序為 sources（來源與組裝統計）、token（回答片段，可多個）、summary（搜尋統計）、done；
+    失敗時送出 error。非串流的 /api/chat 保留給 CLI 使用
+    """
+    query = request.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    validate_date_filters(request.date_from, request.date_to)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            cached, cache_vector, version = await lookup_cached_answer(request, query)
+            if cached is not None:
+                # 快取回答已包含搜尋統計
+                yield sse_event("sources", {"sources": cached["sources"], "metadata": cached.get("metadata")})
+                yield sse_event("token", {"text": cached["answer"]})
+                yield sse_event("done", {"cached": True})
+                return
+
+            timings: Dict[str, Dict[str, float]] = {}
+            search_results = await search_for_request(request, query, timings=timings)
+            contexts, packing_stats = context_packer.pack(search_results)
+            sources = build_sources(search_results)
+            metadata = {"context_packing": packing_stats, "timings": timings}
+            yield sse_event("sources", {"sources": sources, "metadata": metadata})
+
+            parts: List[str] = []
+            failed = False
+            try:
+                async for text in stream_rag_response(query, contexts):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+            except Exception as e:
+                print(f"GPT response error: {e}")
+                failed = True
+                yield sse_event("token", {"text": f"生成回應時發生錯誤：{str(e)}"})
+
+            summary = search_summary(request, search_results)
+            yield sse_event("summary", {"text": summary})
+            if not failed:
+                response = QueryResponse(answer="".join(parts).strip() + summary, sources=sources, metadata=metadata)
+                store_cached_answer(request, query, response, search_results, cache_vector, version)
+            yield sse_event("done", {"cached": False})
+
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield sse_event("error", {"detail": f"Query failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 關閉 nginx 代理緩衝，片段才能即時送達瀏覽器
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/query/batch", response_model=BatchQueryResponse)
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    批次查詢：所有查詢以單一多輸入請求取得 embedding，
+    無過濾條件者以單次矩陣搜尋取得候選；各查詢的檢索與回答生成以有限並行執行
+    評估集與定期摘要每次都需重新生成，因此不使用回答快取
+    """
+    try:
+        requests = request.queries
+        if not requests:
+            raise HTTPException(status_code=400, detail="Queries cannot be empty")
+        if len(requests) > BATCH_QUERY_MAX_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many queries: {len(requests)} (max {BATCH_QUERY_MAX_SIZE})"
+            )
+        queries = [item.query.strip() for item in requests]
+        if not all(queries):
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        for item in requests:
+            validate_date_filters(item.date_from, item.date_to)
+
+        # 只有語義與混合模式需要查詢向量；embedding 快取與批次處理器會合併為一次請求
+        needs_embedding = [
+            i for i, item in enumerate(requests)
+            if (item.search_mode or "hybrid") in ("semantic", "hybrid")
+        ]
+        embeddings: List[Optional[List[float]]] = [None] * len(requests)
+        vectors = await get_embeddings([queries[i] for i in needs_embedding])
+        for i, vector in zip(needs_embedding, vectors):
+            embeddings[i] = vector
+
+        limit = 4
+        # 無過濾條件者以單次矩陣搜尋取得候選；其餘查詢（過濾、詞彙）各自的規劃與資料庫往返並行執行
+        candidates = batch_local_candidates(requests, embeddings, limit)
+        semaphore = asyncio.Semaphore(max(1, request.max_concurrency or BATCH_QUERY_CONCURRENCY))
+
+        async def run(item: QueryRequest,
+                      query: str,
+                      embedding: Optional[List[float]],
+                      vector_candidates: Optional[Dict[int, float]]) -> QueryResponse:
+            async with semaphore:
+                timings: Dict[str, Dict[str, float]] = {}
+                results = await multi_dimensional_search(
+                    query_text=query,
+                    category=item.category,
+                    tags=item.tags,
+                    date_from=item.date_from,
+                    date_to=item.date_to,
+                    family_member=item.family_member,
+                    amount_min=item.amount_min,
+                    amount_max=item.amount_max,
+                    search_mode=item.search_mode or "hybrid",
+                    limit=limit,
+                    tag_mode=item.tag_mode or "any",
+                    query_embedding=embedding,
+                    vector_candidates=vector_candidates,
+                    timings=timings
+                )
+                answer, packing_stats = await answer_with_context(query, results)
+                return build_query_response(
+                    item, results, answer,
+                    {"context_packing": packing_stats, "timings": timings}
+                )
+
+        responses = await asyncio.gather(*[
+            run(item, query, embedding, vector_candidates)
+            for item, query, embedding, vector_candidates in zip(requests, queries, embeddings, candidates)
+        ])
+        return BatchQueryResponse(results=list(responses))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch query failed: {str(e)}")
+
 # --- Classification and Tagging API Endpoints ---
 
 @app.get("/api/categories", response_model=List[CategoryResponse])
-async def get_categories():
+async def get_categories(http_request: Request):
     """取得所有文件分類"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
         sql = """
         SELECT c.*, COUNT(d.id) as document_count
         FROM categories c
@@ -747,24 +1910,16 @@ async def get_categories():
         GROUP BY c.id, c.name, c.description, c.icon, c.color
         ORDER BY c.name
         """
-        cursor.execute(sql)
-        categories = cursor.fetchall()
-        
-        conn.close()
+        categories = await read_db(client_key(http_request)).fetch_all(sql)
         return [CategoryResponse(**category) for category in categories]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get categories: {str(e)}")
 
 @app.get("/api/tags", response_model=List[TagResponse])
-async def get_tags():
+async def get_tags(http_request: Request):
     """取得所有標籤"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
         sql = """
         SELECT t.*, COUNT(dt.document_id) as document_count
         FROM tags t
@@ -772,10 +1927,7 @@ async def get_tags():
         GROUP BY t.id, t.name, t.color
         ORDER BY document_count DESC, t.name
         """
-        cursor.execute(sql)
-        tags = cursor.fetchall()
-        
-        conn.close()
+        tags = await read_db(client_key(http_request)).fetch_all(sql)
         return [TagResponse(**tag) for tag in tags]
         
     except Exception as e:
@@ -790,12 +1942,9 @@ async def get_documents(
     limit: int = 50
 ):
     """根據條件查詢文件"""
+    validate_date_filters(date_from, date_to)
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
+        db = require_async_db()
         
         # 建構查詢條件
         conditions = []
@@ -803,7 +1952,7 @@ async def get_documents(
         
         base_sql = """
         SELECT DISTINCT d.id, d.filename, c.name as category, d.document_date, 
-               d.extracted_amount, d.confidence_score
+               d.extracted_amount, d.confidence_score, d.processing_status
         FROM documents d
         LEFT JOIN categories c ON d.category_id = c.id
         """
@@ -835,19 +1984,25 @@ async def get_documents(
         base_sql += " ORDER BY d.created_at DESC LIMIT %s"
         params.append(limit)
         
-        cursor.execute(base_sql, params)
-        documents = cursor.fetchall()
+        documents = await db.fetch_all(base_sql, params)
         
-        # 為每個文件取得標籤
-        for doc in documents:
-            cursor.execute("""
-                SELECT t.name FROM tags t
+        # 以單次查詢取得所有文件的標籤
+        doc_tags: Dict[int, List[str]] = {}
+        if documents:
+            doc_placeholders = ','.join(['%s'] * len(documents))
+            tag_rows = await db.fetch_all(f"""
+                SELECT dt.document_id, t.name FROM tags t
                 JOIN document_tags dt ON t.id = dt.tag_id
-                WHERE dt.document_id = %s
-            """, (doc['id'],))
-            doc['tags'] = [tag['name'] for tag in cursor.fetchall()]
+                WHERE dt.document_id IN ({doc_placeholders})
+            """, [doc['id'] for doc in documents])
+            for row in tag_rows:
+                doc_tags.setdefault(row['document_id'], []).append(row['name'])
+        for doc in documents:
+            doc['tags'] = doc_tags.get(doc['id'], [])
+            # 資料庫驅動以 date 物件回傳 DATE 欄位
+            if isinstance(doc['document_date'], date):
+                doc['document_date'] = doc['document_date'].isoformat()
         
-        conn.close()
         return [DocumentMetadata(**doc) for doc in documents]
         
     except Exception as e:
@@ -857,13 +2012,57 @@ async def get_documents(
 async def get_statistics():
     """取得分類統計資訊"""
     try:
-        stats = document_classifier.get_statistics()
+        # 分類器為阻塞式查詢，於執行緒中執行
+        stats = await asyncio.to_thread(document_classifier.get_statistics)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get statistics: {str(e)}")
 
 # --- Additional utility endpoints ---
 
+@app.get("/api/schema/capabilities")
+async def get_schema_capabilities():
+    """取得目前快取的資料表與欄位能力"""
+    return schema_registry.get().to_dict()
+
+@app.post("/api/schema/refresh")
+async def refresh_schema_capabilities():
+    """遷移後手動重新偵測 schema"""
+    capabilities = await asyncio.to_thread(schema_registry.refresh)
+    return capabilities.to_dict()
+
+@app.get("/api/db/pool")
+async def get_db_pool_stats():
+    """儲存後端連線池的使用量、重用與等待統計，非同步資料庫層的查詢統計與讀寫分離路由"""
+    if db_pool is None:
+        return {"enabled": False, "storage": storage.stats()}
+    return {
+        "enabled": True,
+        "storage": storage.stats(),
+        **db_pool.stats(),
+        "async": async_db.stats() if async_db is not None else None,
+        "router": db_router.stats() if db_router is not None else None,
+    }
+
+@app.get("/api/search/planner")
+async def get_query_planner_stats():
+    """查詢計畫的決策次數與基數統計"""
+    if query_planner is None:
+        return {"enabled": False}
+    return {"enabled": True, **query_planner.stats()}
+
+@app.get("/api/embeddings/cache/stats")
+async def get_embedding_cache_stats():
+    """取得 embedding 快取、回答快取、檢索快取、分類標籤快取與批次處理統計"""
+    return {
+        "cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "search_cache": search_cache.stats() if search_cache is not None else None,
+        "taxonomy_cache": document_classifier.taxonomy.stats(),
+        "batcher": embedding_batcher.stats,
+        "provider": llm_provider.stats if llm_provider else {}
+    }
+
 @app.get("/api/files")
 async def list_files():
     """List uploaded files."""
@@ -881,56 +2080,95 @@ async def list_files():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
+async def fetch_rows(sql: str, params: Tuple[Any, ...] = (), one: bool = False,
+                     client: Optional[str] = None) -> Any:
+    """以非同步資料庫層執行唯讀查詢，供同時執行的查詢階段使用（啟用讀寫分離時可由副本回應）"""
+    db = read_db(client)
+    if one:
+        return await db.fetch_one(sql, params)
+    return await db.fetch_all(sql, params)
+
+async def get_search_suggestions(q: str, limit: int = 5, client: Optional[str] = None) -> Dict[str, Any]:
+    """依前綴同時查詢分類、標籤、家庭成員與檔名建議"""
+    q = q.strip()
+    if not q:
+        return {"query": q, "categories": [], "tags": [], "family_members": [], "filenames": []}
+
+    pattern = f"{q}%"
+    stages = {
+        "categories": lambda _: fetch_rows(
+            "SELECT name FROM categories WHERE name LIKE %s ORDER BY name LIMIT %s", (pattern, limit), client=client),
+        "tags": lambda _: fetch_rows(
+            "SELECT name FROM tags WHERE name LIKE %s ORDER BY name LIMIT %s", (pattern, limit), client=client),
+        "family_members": lambda _: fetch_rows(
+            "SELECT name FROM family_members WHERE name LIKE %s ORDER BY name LIMIT %s", (pattern, limit),
+            client=client),
+    }
+    if schema_registry.get().has_table("documents"):
+        stages["filenames"] = lambda _: fetch_rows(
+            "SELECT DISTINCT filename AS name FROM documents WHERE filename LIKE %s ORDER BY filename LIMIT %s",
+            (f"%{q}%", limit), client=client)
+    results, timings = await gather_stages(stages, blocking=False)
+
+    suggestions: Dict[str, Any] = {"query": q, "filenames": []}
+    for name in stages:
+        suggestions[name] = [row["name"] for row in results[name]]
+    suggestions["timings"] = timings
+    return suggestions
+
 @app.get("/api/search/suggestions")
-async def get_search_suggestions_endpoint(q: str = ""):
+async def get_search_suggestions_endpoint(http_request: Request, q: str = ""):
     """取得搜尋建議"""
     try:
-        suggestions = await get_search_suggestions(q)
+        suggestions = await get_search_suggestions(q, client=client_key(http_request))
         return suggestions
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get search suggestions: {str(e)}")
 
 @app.get("/api/search/filters")
-async def get_search_filters():
-    """取得所有可用的搜尋過濾器選項"""
+async def get_search_filters(http_request: Request):
+    """取得所有可用的搜尋過濾器選項（各項查詢彼此獨立，同時執行）"""
+    client = client_key(http_request)
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
+        results, timings = await gather_stages({
+            # 取得所有分類
+            "categories": lambda _: fetch_rows("SELECT name, icon, color FROM categories ORDER BY name", client=client),
+            # 取得所有標籤
+            "tags": lambda _: fetch_rows("SELECT name, color FROM tags ORDER BY name", client=client),
+            # 取得所有家庭成員
+            "family_members": lambda _: fetch_rows("SELECT name FROM family_members ORDER BY name", client=client),
+            # 計算金額範圍
+            "amount_stats": lambda _: fetch_rows("""
+                SELECT 
+                    MIN(extracted_amount) as min_amount,
+                    MAX(extracted_amount) as max_amount,
+                    AVG(extracted_amount) as avg_amount
+                FROM documents 
+                WHERE extracted_amount IS NOT NULL
+            """, one=True, client=client),
+            # 取得日期範圍
+            "date_ranges": lambda _: fetch_rows("""
+                SELECT 
+                    DATE_FORMAT(document_date, '%Y-%m') as month,
+                    COUNT(*) as count
+                FROM documents 
+                WHERE document_date IS NOT NULL
+                GROUP BY month
+                ORDER BY month DESC
+                LIMIT 12
+            """, client=client),
+        }, blocking=False)
         
         filters = {
-            "categories": [],
-            "tags": [],
-            "family_members": [],
+            "categories": results["categories"],
+            "tags": results["tags"],
+            "family_members": [row["name"] for row in results["family_members"]],
             "amount_ranges": [],
-            "date_ranges": []
+            "date_ranges": results["date_ranges"],
+            "timings": timings
         }
         
-        # 取得所有分類
-        cursor.execute("SELECT name, icon, color FROM categories ORDER BY name")
-        filters["categories"] = cursor.fetchall()
-        
-        # 取得所有標籤
-        cursor.execute("SELECT name, color FROM tags ORDER BY name")
-        filters["tags"] = cursor.fetchall()
-        
-        # 取得所有家庭成員
-        cursor.execute("SELECT name FROM family_members ORDER BY name")
-        filters["family_members"] = [row["name"] for row in cursor.fetchall()]
-        
-        # 計算金額範圍
-        cursor.execute("""
-            SELECT 
-                MIN(extracted_amount) as min_amount,
-                MAX(extracted_amount) as max_amount,
-                AVG(extracted_amount) as avg_amount
-            FROM documents 
-            WHERE extracted_amount IS NOT NULL
-        """)
-        amount_stats = cursor.fetchone()
-        
+        amount_stats = results["amount_stats"]
         if amount_stats and amount_stats["min_amount"] is not None:
             min_amt = float(amount_stats["min_amount"])
             max_amt = float(amount_stats["max_amount"])
@@ -943,22 +2181,6 @@ async def get_search_filters():
                 {"label": f"大於 ${avg_amt*2:.0f}", "min": avg_amt*2, "max": max_amt}
             ]
         
-        # 取得日期範圍
-        cursor.execute("""
-            SELECT 
-                DATE_FORMAT(document_date, '%Y-%m') as month,
-                COUNT(*) as count
-            FROM documents 
-            WHERE document_date IS NOT NULL
-            GROUP BY month
-            ORDER BY month DESC
-            LIMIT 12
-        """)
-        filters["date_ranges"] = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
         return filters
         
     except Exception as e:
@@ -967,8 +2189,10 @@ async def get_search_filters():
 @app.post("/api/search/advanced")
 async def advanced_search(request: QueryRequest):
     """進階搜尋端點，返回更詳細的結果"""
+    validate_date_filters(request.date_from, request.date_to)
     try:
         # 使用多維度搜尋
+        timings: Dict[str, Dict[str, float]] = {}
         search_results = await multi_dimensional_search(
             query_text=request.query,
             category=request.category,
@@ -979,7 +2203,9 @@ async def advanced_search(request: QueryRequest):
             amount_min=request.amount_min,
             amount_max=request.amount_max,
             search_mode=request.search_mode or "hybrid",
-            limit=20  # 進階搜尋返回更多結果
+            limit=20,  # 進階搜尋返回更多結果
+            tag_mode=request.tag_mode or "any",
+            timings=timings
         )
         
         # 整理結果
@@ -1007,7 +2233,8 @@ async def advanced_search(request: QueryRequest):
             "amount_range": {
                 "min": min((r["extracted_amount"] for r in results if r["extracted_amount"]), default=0),
                 "max": max((r["extracted_amount"] for r in results if r["extracted_amount"]), default=0)
-            }
+            },
+            "timings": timings
         }
         
         return {
@@ -1017,6 +2244,7 @@ async def advanced_search(request: QueryRequest):
                 "query": request.query,
                 "category": request.category,
                 "tags": request.tags,
+                "tag_mode": request.tag_mode,
                 "date_from": request.date_from,
                 "date_to": request.date_to,
                 "family_member": request.family_member,
@@ -1031,22 +2259,40 @@ async def advanced_search(request: QueryRequest):
 
 # --- Time Series API Endpoints ---
 
+async def run_with_connection(fn: Callable[[Any], Any], client: Optional[str] = None) -> Any:
+    """
+    TimeSeriesAnalyzer 為阻塞式查詢：以連線池的連線在執行緒中執行，結束後歸還連線
+    fn 僅能讀取；啟用讀寫分離時可由本機副本回應
+    """
+    if db_router is not None:
+        return await asyncio.to_thread(db_router.read_with_connection, fn, client)
+    return await asyncio.to_thread(with_primary_connection, fn)
+
+def with_primary_connection(fn: Callable[[Any], Any]) -> Any:
+    """以主庫連線執行阻塞式工作，結束後歸還連線"""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        return fn(conn)
+    finally:
+        conn.close()
+
+async def write_with_connection(fn: Callable[[Any], Any], client: Optional[str] = None) -> Any:
+    """會寫入的 TimeSeriesAnalyzer 工作（例如 check_alerts 記錄警報日誌）一律在主庫執行"""
+    result = await asyncio.to_thread(with_primary_connection, fn)
+    record_write(client)
+    return result
+
 @app.get("/api/timeseries/types")
-async def get_time_series_types():
+async def get_time_series_types(http_request: Request):
     """取得所有時間序列類型"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
+        types = await read_db(client_key(http_request)).fetch_all("""
             SELECT id, name, description, unit, category, data_type, color, icon
             FROM time_series_types
             ORDER BY category, name
         """)
-        types = cursor.fetchall()
-        conn.close()
         
         return {"time_series_types": types}
         
@@ -1054,15 +2300,9 @@ async def get_time_series_types():
         raise HTTPException(status_code=500, detail=f"Failed to get time series types: {str(e)}")
 
 @app.post("/api/timeseries/data", response_model=TimeSeriesResponse)
-async def get_time_series_data(request: TimeSeriesRequest):
+async def get_time_series_data(request: TimeSeriesRequest, http_request: Request):
     """取得時間序列數據"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        analyzer = TimeSeriesAnalyzer(conn)
-        
         # 設定日期範圍
         end_date = date.today()
         if request.end_date:
@@ -1072,13 +2312,26 @@ async def get_time_series_data(request: TimeSeriesRequest):
         if request.start_date:
             start_date = datetime.strptime(request.start_date, "%Y-%m-%d").date()
         
-        # 取得數據點
-        data_points = analyzer.get_time_series_data(
-            request.series_type,
-            request.family_member_id,
-            start_date,
-            end_date
-        )
+        def analyze(conn):
+            analyzer = TimeSeriesAnalyzer(conn)
+            # 取得數據點
+            data_points = analyzer.get_time_series_data(
+                request.series_type,
+                request.family_member_id,
+                start_date,
+                end_date
+            )
+            # 取得統計摘要
+            statistics = analyzer.get_statistics_summary(
+                request.series_type,
+                request.family_member_id,
+                request.period_days or 90
+            )
+            # 趨勢分析
+            trend = analyzer.analyze_trend(data_points, request.period_days or 30)
+            return data_points, statistics, trend
+        
+        data_points, statistics, trend = await run_with_connection(analyze, client_key(http_request))
         
         # 轉換為回應格式
         response_data_points = [
@@ -1092,15 +2345,6 @@ async def get_time_series_data(request: TimeSeriesRequest):
             for point in data_points
         ]
         
-        # 取得統計摘要
-        statistics = analyzer.get_statistics_summary(
-            request.series_type,
-            request.family_member_id,
-            request.period_days or 90
-        )
-        
-        # 趨勢分析
-        trend = analyzer.analyze_trend(data_points, request.period_days or 30)
         trend_analysis = {
             "trend_type": trend.trend_type,
             "slope": trend.slope,
@@ -1109,8 +2353,6 @@ async def get_time_series_data(request: TimeSeriesRequest):
             "change_percentage": trend.change_percentage
         }
         
-        conn.close()
-        
         return TimeSeriesResponse(
             series_name=request.series_type,
             data_points=response_data_points,
@@ -1122,36 +2364,38 @@ async def get_time_series_data(request: TimeSeriesRequest):
         raise HTTPException(status_code=500, detail=f"Failed to get time series data: {str(e)}")
 
 @app.post("/api/timeseries/analysis")
-async def analyze_time_series_trend(request: TrendAnalysisRequest):
+async def analyze_time_series_trend(request: TrendAnalysisRequest, http_request: Request):
     """分析時間序列趨勢"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        analyzer = TimeSeriesAnalyzer(conn)
-        
         # 取得最近一段時間的數據
         end_date = date.today()
         start_date = end_date - timedelta(days=request.period_days or 30)
         
-        data_points = analyzer.get_time_series_data(
-            request.series_type,
-            request.family_member_id,
-            start_date,
-            end_date
-        )
+        def analyze(conn):
+            analyzer = TimeSeriesAnalyzer(conn)
+            data_points = analyzer.get_time_series_data(
+                request.series_type,
+                request.family_member_id,
+                start_date,
+                end_date
+            )
+            if not data_points:
+                return data_points, None
+            # 進行趨勢分析
+            trend = analyzer.analyze_trend(data_points, request.period_days or 30)
+            return data_points, trend
         
-        if not data_points:
-            raise HTTPException(status_code=404, detail="No data points found for analysis")
+        def check_alerts(conn):
+            # 觸發的警報寫入 time_series_alert_logs，不可在副本執行
+            return TimeSeriesAnalyzer(conn).check_alerts(request.series_type, request.family_member_id)
         
-        # 進行趨勢分析
-        trend = analyzer.analyze_trend(data_points, request.period_days or 30)
+        client = client_key(http_request)
+        data_points, trend = await run_with_connection(analyze, client)
         
-        # 檢查警報
-        alerts = analyzer.check_alerts(request.series_type, request.family_member_id)
+        if not data_points:
+            raise HTTPException(status_code=404, detail="No data points found for analysis")
         
-        conn.close()
+        alerts = await write_with_connection(check_alerts, client)
         
         return {
             "series_type": request.series_type,
@@ -1174,15 +2418,9 @@ async def analyze_time_series_trend(request: TrendAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"Failed to analyze trend: {str(e)}")
 
 @app.get("/api/timeseries/alerts")
-async def get_active_alerts():
+async def get_active_alerts(http_request: Request):
     """取得所有活躍的警報"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
-        
         # 取得最近7天的警報記錄
         sql = """
         SELECT tal.*, ta.alert_name, tst.name as series_name, fm.name as family_member_name
@@ -1196,8 +2434,7 @@ async def get_active_alerts():
         LIMIT 50
         """
         
-        cursor.execute(sql)
-        alert_logs = cursor.fetchall()
+        alert_logs = await read_db(client_key(http_request)).fetch_all(sql)
         
         alerts = []
         for log in alert_logs:
@@ -1212,30 +2449,21 @@ async def get_active_alerts():
                 triggered_date=log['triggered_date'].isoformat()
             ))
         
-        conn.close()
-        
         return {"alerts": alerts, "count": len(alerts)}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get alerts: {str(e)}")
 
 @app.post("/api/timeseries/alerts/{alert_id}/read")
-async def mark_alert_as_read(alert_id: int):
+async def mark_alert_as_read(alert_id: int, http_request: Request):
     """標記警報為已讀"""
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor()
-        cursor.execute("""
+        await require_async_db().execute("""
             UPDATE time_series_alert_logs 
             SET is_read = TRUE 
             WHERE alert_id = %s
         """, (alert_id,))
-        
-        conn.commit()
-        conn.close()
+        record_write(client_key(http_request))
         
         return {"message": "Alert marked as read", "alert_id": alert_id}
         
@@ -1243,14 +2471,11 @@ async def mark_alert_as_read(alert_id: int):
         raise HTTPException(status_code=500, detail=f"Failed to mark alert as read: {str(e)}")
 
 @app.get("/api/timeseries/dashboard")
-async def get_time_series_dashboard():
+async def get_time_series_dashboard(http_request: Request):
     """取得時間序列儀表板數據"""
+    client = client_key(http_request)
     try:
-        conn = get_tidb_cloud_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        analyzer = TimeSeriesAnalyzer(conn)
+        db = read_db(client)
         
         # 取得主要統計數據
         dashboard_data = {
@@ -1261,16 +2486,21 @@ async def get_time_series_dashboard():
         }
         
         # 取得各類別的最新數據和趨勢
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT name, category, color, icon FROM time_series_types")
-        series_types = cursor.fetchall()
+        series_types = await db.fetch_all("SELECT name, category, color, icon FROM time_series_types")
+        
+        def summarize(conn):
+            analyzer = TimeSeriesAnalyzer(conn)
+            return [
+                analyzer.get_statistics_summary(series_type['name'], period_days=30)
+                for series_type in series_types[:10]  # 限制數量避免過慢
+            ]
         
-        for series_type in series_types[:10]:  # 限制數量避免過慢
+        summaries = await run_with_connection(summarize, client)
+        
+        for series_type, stats in zip(series_types, summaries):
             series_name = series_type['name']
             category = series_type['category']
             
-            # 取得統計摘要
-            stats = analyzer.get_statistics_summary(series_name, period_days=30)
             if stats:
                 if category not in dashboard_data["categories"]:
                     dashboard_data["categories"][category] = []
@@ -1286,17 +2516,14 @@ async def get_time_series_dashboard():
                 })
         
         # 計算未讀警報數量
-        cursor.execute("""
+        alert_result = await db.fetch_one("""
             SELECT COUNT(*) as alert_count 
             FROM time_series_alert_logs 
             WHERE is_read = FALSE 
             AND triggered_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
         """)
-        alert_result = cursor.fetchone()
         dashboard_data["alerts_count"] = alert_result['alert_count'] if alert_result else 0
         
-        conn.close()
-        
         return dashboard_data
         
     except Exception as e:
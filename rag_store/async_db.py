@@ -0,0 +1,226 @@
+"""
+非同步資料庫存取層
+FastAPI 端點皆為 async def，直接呼叫阻塞式 mysql.connector 會讓單一慢查詢卡住
+同一 worker 上的所有請求；端點改為 await 本模組的查詢函式
+
+主要功能：
+1. fetch_all / fetch_one / execute：回傳與 cursor(dictionary=True) 相同的 dict 列
+2. aiomysql 後端：原生非同步協定，自有連線池（上限、借出逾時、max_lifetime 汰換），
+   查詢執行中發生連線錯誤時丟棄該連線
+3. thread 後端：未安裝 aiomysql 時，以 TiDB 連線池（db_pool）的連線在執行緒中查詢，
+   event loop 同樣不會被阻塞
+4. 統計：查詢數、錯誤數、平均耗時、同時進行中的查詢數
+
+aiomysql 為選用套件，未安裝時 AIOMYSQL_AVAILABLE 為 False。
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from .db_pool import ConnectionPool
+
+try:
+    import aiomysql
+    AIOMYSQL_AVAILABLE = True
+except ImportError:  # pragma: no cover - 選用套件
+    aiomysql = None
+    AIOMYSQL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+
+class AsyncDatabase:
+    """非同步查詢介面；子類別實作 _query"""
+
+    backend = "base"
+
+    def __init__(self):
+        self.queries = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _query(self, sql: str, params: Optional[Sequence[Any]], fetch: str) -> Any:
+        raise NotImplementedError
+
+    async def _run(self, sql: str, params: Optional[Sequence[Any]], fetch: str) -> Any:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            # 沒有參數時不做 % 格式化（DATE_FORMAT 的 %Y 等字面值保持原樣）
+            return await self._query(sql, tuple(params) if params else None, fetch)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.queries += 1
+            self.total_seconds += time.perf_counter() - started
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence[Any]] = None) -> List[Row]:
+        """執行查詢並回傳所有列（dict）"""
+        return await self._run(sql, params, "all")
+
+    async def fetch_one(self, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Row]:
+        """執行查詢並回傳第一列，沒有結果時回傳 None"""
+        return await self._run(sql, params, "one")
+
+    async def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> int:
+        """執行單一寫入語句並提交，回傳影響的列數"""
+        return await self._run(sql, params, "write")
+
+    async def close(self):
+        pass
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "queries": self.queries,
+            "errors": self.errors,
+            "avg_query_ms": round(self.total_seconds / self.queries * 1000, 2) if self.queries else 0.0,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "pool": self.pool_stats(),
+        }
+
+
+class AiomysqlDatabase(AsyncDatabase):
+    """以 aiomysql 連線池執行的原生非同步查詢"""
+
+    backend = "aiomysql"
+
+    def __init__(self,
+                 config: Dict[str, Any],
+                 max_size: int = 10,
+                 wait_timeout: float = 5.0,
+                 max_lifetime: float = 1800.0):
+        super().__init__()
+        if not AIOMYSQL_AVAILABLE:
+            raise RuntimeError("aiomysql 未安裝，請執行 poetry install -E async-db")
+        self.config = config
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.max_lifetime = max_lifetime
+        self._pool = None
+        self._pool_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool_lock: Optional[asyncio.Lock] = None
+
+    async def _get_pool(self):
+        # 連線池綁定建立時的 event loop，於第一次查詢時建立
+        loop = asyncio.get_running_loop()
+        if self._pool is not None and self._pool_loop is loop:
+            return self._pool
+        if self._pool_lock is None or self._pool_loop is not loop:
+            self._pool_lock = asyncio.Lock()
+            self._pool_loop = loop
+            self._pool = None
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    host=self.config["host"],
+                    user=self.config["user"],
+                    password=self.config["password"],
+                    db=self.config["database"],
+                    port=int(self.config.get("port", 3306)),
+                    ssl=None if self.config.get("ssl_disabled") else ssl.create_default_context(),
+                    charset="utf8mb4",
+                    autocommit=True,
+                    minsize=0,
+                    maxsize=self.max_size,
+                    pool_recycle=int(self.max_lifetime),
+                )
+        return self._pool
+
+    async def _query(self, sql: str, params: Optional[Sequence[Any]], fetch: str) -> Any:
+        pool = await self._get_pool()
+        conn = await asyncio.wait_for(pool.acquire(), self.wait_timeout)
+        try:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(sql, params)
+                if fetch == "all":
+                    return list(await cursor.fetchall())
+                if fetch == "one":
+                    return await cursor.fetchone()
+                return cursor.rowcount
+        except (aiomysql.OperationalError, aiomysql.InterfaceError):
+            # 連線已中斷，關閉後歸還，連線池不再借出此連線
+            conn.close()
+            raise
+        finally:
+            pool.release(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def pool_stats(self) -> Dict[str, Any]:
+        if self._pool is None:
+            return {"max_size": self.max_size, "size": 0, "idle": 0}
+        return {"max_size": self.max_size, "size": self._pool.size, "idle": self._pool.freesize}
+
+
+class ThreadedDatabase(AsyncDatabase):
+    """以 TiDB 連線池的阻塞式連線在執行緒中查詢"""
+
+    backend = "thread"
+
+    def __init__(self, pool: ConnectionPool):
+        super().__init__()
+        self.pool = pool
+        # 專用執行緒與連線數相同；預設 executor 依 CPU 數決定大小，會先於連線池成為瓶頸
+        self._executor = ThreadPoolExecutor(max_workers=pool.max_size, thread_name_prefix="async-db")
+
+    def _query_sync(self, sql: str, params: Optional[Sequence[Any]], fetch: str) -> Any:
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(sql, params)
+                if fetch == "all":
+                    return cursor.fetchall()
+                if fetch == "one":
+                    return cursor.fetchone()
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    async def _query(self, sql: str, params: Optional[Sequence[Any]], fetch: str) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._query_sync, sql, params, fetch)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.pool.stats()
+
+
+def create_async_database(config: Optional[Dict[str, Any]],
+                          pool: Optional[ConnectionPool],
+                          backend: str = "auto",
+                          max_size: int = 10) -> Optional[AsyncDatabase]:
+    """
+    backend 為 auto（安裝 aiomysql 時使用原生非同步，否則 thread）、aiomysql 或 thread
+    aiomysql 連線池沿用 TiDB 連線池的借出逾時與 max_lifetime；未設定連線參數時回傳 None
+    """
+    if config is None or pool is None:
+        return None
+    if backend == "aiomysql" or (backend == "auto" and AIOMYSQL_AVAILABLE):
+        if AIOMYSQL_AVAILABLE:
+            return AiomysqlDatabase(config, max_size=max_size,
+                                    wait_timeout=pool.wait_timeout, max_lifetime=pool.max_lifetime)
+        logger.warning("ASYNC_DB_BACKEND=aiomysql 但未安裝 aiomysql，改在執行緒中查詢")
+    return ThreadedDatabase(pool)
@@ -0,0 +1,92 @@
+"""
+批次寫入
+上傳流程、全量 embedding 腳本與文件標籤關聯原本逐列 INSERT，
+每一列都是一次 TiDB Cloud 往返；改為合併成多列 VALUES 語句，每批一次往返、一次提交
+
+主要功能：
+1. 依列數（batch_size）與語句大小（max_statement_bytes）切分批次，
+   embedding 的 VECTOR 字面值很大，單看列數容易超過封包上限
+2. 每列的 VALUES 樣板可自訂（例如 CAST(%s AS VECTOR(1536))）
+3. 需要新列主鍵時（本機索引增量更新）以 lastrowid 推算：
+   單一 INSERT 語句隱式配置的 AUTO_INCREMENT 值連續（TiDB 與 InnoDB simple insert 皆保證）
+4. commit=True 時每批提交一次；False 時由呼叫端在同一個交易中提交
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_STATEMENT_BYTES = 4 * 1024 * 1024
+
+
+def estimate_row_bytes(row: Sequence[Any]) -> int:
+    """粗估一列參數在 SQL 語句中的長度（字串與 VECTOR 字面值為主）"""
+    return sum(len(value) if isinstance(value, (str, bytes)) else 16 for value in row) + 8
+
+
+class BulkWriter:
+    """將多列寫入合併為多列 VALUES 語句"""
+
+    def __init__(self,
+                 conn,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_statement_bytes: int = DEFAULT_MAX_STATEMENT_BYTES,
+                 commit: bool = True):
+        if batch_size < 1:
+            raise ValueError("batch_size 必須至少為 1")
+        self.conn = conn
+        self.batch_size = batch_size
+        self.max_statement_bytes = max_statement_bytes
+        self.commit = commit
+        self.statements = 0
+        self.rows = 0
+        self.commits = 0
+
+    def batches(self, rows: Sequence[Sequence[Any]]) -> Iterator[List[Sequence[Any]]]:
+        batch: List[Sequence[Any]] = []
+        size = 0
+        for row in rows:
+            row_bytes = estimate_row_bytes(row)
+            if batch and (len(batch) >= self.batch_size or size + row_bytes > self.max_statement_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(row)
+            size += row_bytes
+        if batch:
+            yield batch
+
+    def insert(self,
+               table: str,
+               columns: Sequence[str],
+               rows: Sequence[Sequence[Any]],
+               row_template: Optional[str] = None,
+               ignore: bool = False,
+               returning_ids: bool = False) -> List[int]:
+        """
+        寫入多列；row_template 為單列的 VALUES 樣板，預設為 (%s, %s, ...)
+        returning_ids 為 True 時依序回傳新列的主鍵，否則回傳空列表
+        """
+        if ignore and returning_ids:
+            # 被略過的列不配置主鍵，無法由 lastrowid 推算
+            raise ValueError("ignore 與 returning_ids 不可同時使用")
+        template = row_template or "(" + ", ".join(["%s"] * len(columns)) + ")"
+        prefix = f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) VALUES "
+        ids: List[int] = []
+        cursor = self.conn.cursor()
+        try:
+            for batch in self.batches(rows):
+                params = [value for row in batch for value in row]
+                cursor.execute(prefix + ", ".join([template] * len(batch)), params)
+                if returning_ids:
+                    first = cursor.lastrowid
+                    ids.extend(range(first, first + len(batch)))
+                self.statements += 1
+                self.rows += len(batch)
+                if self.commit:
+                    self.conn.commit()
+                    self.commits += 1
+        finally:
+            cursor.close()
+        return ids
+
+    def stats(self) -> Dict[str, int]:
+        return {"statements": self.statements, "rows": self.rows, "commits": self.commits}
@@ -7,42 +7,48 @@
 python classification_system.py --file /path/to/document.pdf
 """
 
-import os
 import re
 import json
+import asyncio
 from datetime import datetime, date
 from typing import Dict, List, Optional, Tuple, Any
 from pathlib import Path
-import mysql.connector
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from .bulk_writer import BulkWriter
+from .db_pool import ConnectionPool
+from .llm_provider import AsyncLLMProvider
+from .storage import get_storage_backend
+from .taxonomy_cache import RETRYABLE_ERRNOS, TaxonomyCache
+
 # 載入環境變數
 load_dotenv()
 
 class DocumentClassifier:
     """文件分類器"""
     
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.db_config = {
-            'host': os.getenv("TIDB_HOST"),
-            'user': os.getenv("TIDB_USER"),
-            'password': os.getenv("TIDB_PASSWORD"),
-            'database': 'rag',
-            'ssl_disabled': False,
-            'use_unicode': True
-        }
+    def __init__(self,
+                 llm_provider: Optional[AsyncLLMProvider] = None,
+                 pool: Optional[ConnectionPool] = None,
+                 taxonomy: Optional[TaxonomyCache] = None):
+        self.llm_provider = llm_provider or AsyncLLMProvider.from_env()
+        # 未指定時使用程序內共用儲存後端（STORAGE_BACKEND）的連線池
+        self.pool = pool or get_storage_backend().pool
+        # 分類與標籤的名稱 → id 快取
+        self.taxonomy = taxonomy or TaxonomyCache()
     
     def get_db_connection(self):
-        """建立資料庫連線"""
+        """自連線池借出資料庫連線；close() 即歸還"""
+        if self.pool is None:
+            print("資料庫連線錯誤: 未設定 TIDB_HOST / TIDB_USER / TIDB_PASSWORD（或設定 STORAGE_BACKEND=sqlite）")
+            return None
         try:
-            return mysql.connector.connect(**self.db_config)
+            return self.pool.acquire()
         except Exception as e:
             print(f"資料庫連線錯誤: {e}")
             return None
     
-    def classify_document(self, text: str) -> Dict[str, Any]:
+    async def classify_document(self, text: str) -> Dict[str, Any]:
         """
         使用 OpenAI API 智能分類文件
         
@@ -53,6 +59,9 @@ class DocumentClassifier:
             Dict: 包含分類結果、信心度和提取資訊
         """
         try:
+            if not self.llm_provider:
+                raise ValueError("缺少 OPENAI_API_KEY 設定")
+
             prompt = f"""
 請分析以下文件內容，並提供詳細的分類資訊。請以JSON格式回答：
 
@@ -93,7 +102,7 @@ class DocumentClassifier:
 - 信心度範圍 0.0-1.0
 """
             
-            response = self.openai_client.chat.completions.create(
+            result_text = await self.llm_provider.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "你是專業的文件分類助手，擅長分析家庭文件並提取關鍵資訊。"},
@@ -103,7 +112,6 @@ class DocumentClassifier:
             )
             
             # 解析 JSON 回應
-            result_text = response.choices[0].message.content.strip()
             
             # 嘗試提取 JSON 內容
             json_start = result_text.find('{')
@@ -202,10 +210,7 @@ class DocumentClassifier:
             return None
             
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM categories WHERE name = %s", (category_name,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            return self.taxonomy.category_id(conn, category_name)
         except Exception as e:
             print(f"查詢分類 ID 錯誤: {e}")
             return None
@@ -218,26 +223,10 @@ class DocumentClassifier:
         if not conn:
             return []
             
-        tag_ids = []
         try:
-            cursor = conn.cursor()
-            
-            for tag_name in tag_names:
-                # 檢查標籤是否存在
-                cursor.execute("SELECT id FROM tags WHERE name = %s", (tag_name,))
-                result = cursor.fetchone()
-                
-                if result:
-                    tag_ids.append(result[0])
-                else:
-                    # 建立新標籤
-                    cursor.execute(
-                        "INSERT INTO tags (name, color, description) VALUES (%s, %s, %s)",
-                        (tag_name, '#808080', f'自動建立的標籤: {tag_name}')
-                    )
-                    tag_ids.append(cursor.lastrowid)
-            
+            tag_ids, created = self.taxonomy.resolve_tags(conn, tag_names)
             conn.commit()
+            self.taxonomy.remember_tags(created)
             return tag_ids
             
         except Exception as e:
@@ -247,34 +236,48 @@ class DocumentClassifier:
         finally:
             conn.close()
     
-    def save_document_metadata(self, 
-                             filename: str, 
-                             file_path: str, 
-                             classification_result: Dict[str, Any],
-                             ocr_text: str = "",
-                             file_size: int = 0,
-                             mime_type: str = "") -> Optional[int]:
+    def _insert_document(self,
+                         conn,
+                         filename: str,
+                         file_path: str,
+                         classification_result: Dict[str, Any],
+                         ocr_text: str,
+                         file_size: int,
+                         mime_type: str,
+                         document_id: Optional[int] = None,
+                         processing_status: str = 'completed') -> Tuple[int, Dict[str, int]]:
         """
-        儲存文件元資料到資料庫
-        
-        Returns:
-            int: 文件 ID，失敗時返回 None
+        在呼叫端的交易中寫入文件、分類與標籤，回傳 (文件 ID, 新建的標籤)
+        指定 document_id 時更新既有的文件記錄（上傳時建立的 pending 記錄）
         """
-        conn = self.get_db_connection()
-        if not conn:
-            return None
-            
+        cursor = conn.cursor()
         try:
-            cursor = conn.cursor()
-            
-            # 獲取分類 ID
-            category_id = self.get_category_id(classification_result.get('category', '其他'))
+            # 獲取分類 ID（快取命中時不需查詢）
+            category_id = self.taxonomy.category_id(conn, classification_result.get('category', '其他'))
             
             # 提取資料
             extracted = classification_result.get('extracted_data', {})
             amount = extracted.get('amount')
             extracted_date = extracted.get('date')
             
+            if document_id is not None:
+                cursor.execute("""
+                UPDATE documents SET
+                    category_id = %s, document_date = %s, extracted_amount = %s, extracted_date = %s,
+                    ocr_text = %s, processing_status = %s, confidence_score = %s
+                WHERE id = %s
+                """, (
+                    category_id,
+                    extracted_date,
+                    amount,
+                    extracted_date,
+                    ocr_text,
+                    processing_status,
+                    classification_result.get('confidence', 0.5),
+                    document_id
+                ))
+                return self._insert_document_tags(conn, document_id, classification_result, ignore=True)
+            
             # 插入文件記錄
             insert_sql = """
             INSERT INTO documents (
@@ -295,36 +298,139 @@ class DocumentClassifier:
                 amount,
                 extracted_date,
                 ocr_text,
-                'completed',
+                processing_status,
                 classification_result.get('confidence', 0.5)
             )
             
             cursor.execute(insert_sql, values)
             document_id = cursor.lastrowid
+        finally:
+            cursor.close()
+        
+        return self._insert_document_tags(conn, document_id, classification_result)
+    
+    def _insert_document_tags(self,
+                              conn,
+                              document_id: int,
+                              classification_result: Dict[str, Any],
+                              ignore: bool = False) -> Tuple[int, Dict[str, int]]:
+        """處理標籤：快取未命中者單次查詢，不存在者單次建立；ignore 時略過已存在的關聯（重試時）"""
+        created: Dict[str, int] = {}
+        suggested_tags = classification_result.get('suggested_tags', [])
+        if suggested_tags:
+            tag_ids, created = self.taxonomy.resolve_tags(conn, suggested_tags)
             
-            # 處理標籤
-            suggested_tags = classification_result.get('suggested_tags', [])
-            if suggested_tags:
-                tag_ids = self.get_or_create_tags(suggested_tags)
-                
-                # 建立文件-標籤關聯
-                for tag_id in tag_ids:
-                    cursor.execute(
-                        "INSERT INTO document_tags (document_id, tag_id) VALUES (%s, %s)",
-                        (document_id, tag_id)
-                    )
+            # 建立文件-標籤關聯（單一多列 INSERT）
+            BulkWriter(conn, commit=False).insert(
+                "document_tags", ["document_id", "tag_id"],
+                [(document_id, tag_id) for tag_id in tag_ids],
+                ignore=ignore
+            )
+        return document_id, created
+    
+    def create_pending_document(self,
+                                filename: str,
+                                file_path: str,
+                                file_size: int = 0,
+                                mime_type: str = "") -> Optional[int]:
+        """
+        上傳時建立處理中的文件記錄（processing_status = 'pending'），分類結果於處理完成後以
+        save_document_metadata(document_id=...) 補上
+        
+        Returns:
+            int: 文件 ID，失敗時返回 None
+        """
+        conn = self.get_db_connection()
+        if not conn:
+            return None
             
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+            INSERT INTO documents (
+                filename, original_filename, file_path, file_size, mime_type, processing_status
+            ) VALUES (%s, %s, %s, %s, %s, 'pending')
+            """, (filename, filename, file_path, file_size, mime_type))
+            document_id = cursor.lastrowid
+            cursor.close()
             conn.commit()
-            print(f"✅ 文件元資料已儲存，文件 ID: {document_id}")
             return document_id
             
         except Exception as e:
-            print(f"儲存文件元資料錯誤: {e}")
             conn.rollback()
+            print(f"建立文件記錄錯誤: {e}")
             return None
         finally:
             conn.close()
     
+    def update_processing_status(self, document_id: int, status: str) -> bool:
+        """更新文件處理狀態（pending / processing / completed / failed）"""
+        conn = self.get_db_connection()
+        if not conn:
+            return False
+            
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE documents SET processing_status = %s WHERE id = %s",
+                (status, document_id)
+            )
+            cursor.close()
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            conn.rollback()
+            print(f"更新文件處理狀態錯誤: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def save_document_metadata(self, 
+                             filename: str, 
+                             file_path: str, 
+                             classification_result: Dict[str, Any],
+                             ocr_text: str = "",
+                             file_size: int = 0,
+                             mime_type: str = "",
+                             document_id: Optional[int] = None,
+                             processing_status: str = 'completed') -> Optional[int]:
+        """
+        儲存文件元資料到資料庫
+        文件、分類與標籤在同一條連線的單一交易中寫入，失敗時全部回滾，不會留下孤立的標籤
+        指定 document_id 時更新 create_pending_document 建立的記錄（可重複執行）
+        
+        Returns:
+            int: 文件 ID，失敗時返回 None
+        """
+        for attempt in range(2):
+            conn = self.get_db_connection()
+            if not conn:
+                return None
+                
+            try:
+                saved_id, created = self._insert_document(
+                    conn, filename, file_path, classification_result, ocr_text, file_size, mime_type,
+                    document_id=document_id, processing_status=processing_status
+                )
+                conn.commit()
+                self.taxonomy.remember_tags(created)
+                print(f"✅ 文件元資料已儲存，文件 ID: {saved_id}")
+                return saved_id
+                
+            except Exception as e:
+                conn.rollback()
+                if attempt == 0 and getattr(e, "errno", None) in RETRYABLE_ERRNOS:
+                    # 其他 worker 剛建立同名標籤，或快取中的標籤已被刪除：清除快取後重試
+                    print(f"分類/標籤快取與資料庫不一致，重新載入後重試: {e}")
+                    self.taxonomy.invalidate()
+                    continue
+                print(f"儲存文件元資料錯誤: {e}")
+                return None
+            finally:
+                conn.close()
+        return None
+    
     def get_documents_by_category(self, category_name: str) -> List[Dict[str, Any]]:
         """根據分類查詢文件"""
         conn = self.get_db_connection()
@@ -447,7 +553,7 @@ def main():
     """
     
     print("🔍 測試文件分類...")
-    result = classifier.classify_document(test_text)
+    result = asyncio.run(classifier.classify_document(test_text))
     print(f"分類結果：{json.dumps(result, ensure_ascii=False, indent=2)}")
     
     print("\n📊 獲取統計資訊...")
@@ -0,0 +1,183 @@
+"""
+RAG 提示詞內容組裝
+檢索結果直接串接會重複相鄰 chunk 的重疊區段（CHUNK_OVERLAP）與幾乎相同的片段，
+組裝階段先合併、去重，再依相關度在 token 預算內挑選，縮短提示詞與生成延遲
+
+主要功能：
+1. 計算 token：安裝 tiktoken 時使用模型的實際編碼，否則沿用 embedding 批次處理器的粗估
+2. 同一文件的相鄰 chunk：尾端與開頭重疊（或互相包含）時合併為一段
+3. 近似重複：字元 3-gram 大多已出現在較相關片段中者捨棄
+4. 依相關度（檢索順序）貪婪填入 token 預算，最相關的一段超出預算時截斷
+
+tiktoken 為選用套件，未安裝時 TIKTOKEN_AVAILABLE 為 False。
+"""
+
+import functools
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .embedding_batcher import estimate_tokens
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:  # pragma: no cover - 選用套件
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+# 重疊合併時檢查的最長 / 最短重疊字元數（CHUNK_OVERLAP 為 50，切分點會落在分隔符號上）
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 20
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """計算文字的 token 數；未安裝 tiktoken 或未指定模型時粗估"""
+    if TIKTOKEN_AVAILABLE and model:
+        return len(_encoding(model).encode(text))
+    return estimate_tokens(text)
+
+
+def merge_overlapping(first: str, second: str,
+                      max_overlap: int = MAX_OVERLAP_CHARS,
+                      min_overlap: int = MIN_OVERLAP_CHARS) -> Optional[str]:
+    """first 的結尾與 second 的開頭重疊（或一段包含另一段）時回傳合併後的文字，否則回傳 None"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for size in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """正規化後的字元 n-gram 集合（忽略空白）"""
+    text = "".join(unicodedata.normalize("NFKC", text).lower().split())
+    if len(text) <= size:
+        return frozenset([text])
+    return frozenset(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def coverage(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """a 的 n-gram 有多少比例出現在 b 中"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a)
+
+
+@dataclass
+class _Passage:
+    """組裝中的片段；rank 為其中最相關 chunk 的檢索順序"""
+    rank: int
+    doc_id: Any
+    text: str
+    row: Dict[str, Any]
+    chunks: int = 1
+    shingles: FrozenSet[str] = field(default_factory=frozenset)
+
+
+class ContextPacker:
+    """將檢索結果整理為不超過 token 預算的提示詞內容"""
+
+    def __init__(self,
+                 token_budget: int = 3000,
+                 duplicate_threshold: float = 0.9,
+                 model: Optional[str] = None):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.model = model
+
+    def _merge_documents(self, passages: List[_Passage]) -> List[_Passage]:
+        """同一文件內反覆合併可銜接的片段，直到沒有可合併者"""
+        by_document: Dict[Any, List[_Passage]] = {}
+        for passage in passages:
+            by_document.setdefault(passage.doc_id, []).append(passage)
+
+        merged: List[_Passage] = []
+        for group in by_document.values():
+            changed = True
+            while changed and len(group) > 1:
+                changed = False
+                for i in range(len(group)):
+                    for j in range(len(group)):
+                        if i == j:
+                            continue
+                        text = merge_overlapping(group[i].text, group[j].text)
+                        if text is None:
+                            continue
+                        best = group[i] if group[i].rank <= group[j].rank else group[j]
+                        combined = _Passage(best.rank, best.doc_id, text, best.row,
+                                            group[i].chunks + group[j].chunks)
+                        group = [p for k, p in enumerate(group) if k not in (i, j)] + [combined]
+                        changed = True
+                        break
+                    if changed:
+                        break
+            merged.extend(group)
+        merged.sort(key=lambda passage: passage.rank)
+        return merged
+
+    def _drop_duplicates(self, passages: List[_Passage]) -> List[_Passage]:
+        kept: List[_Passage] = []
+        for passage in passages:
+            passage.shingles = shingles(passage.text)
+            if any(coverage(passage.shingles, other.shingles) >= self.duplicate_threshold for other in kept):
+                continue
+            kept.append(passage)
+        return kept
+
+    def pack(self, contexts: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        contexts 依相關度排序（檢索結果的順序），回傳 (組裝後的內容, 統計)
+        組裝後的每一項沿用最相關 chunk 的欄位，chunk 欄位替換為合併後的文字
+        """
+        passages = [
+            _Passage(rank, row.get("doc_id"), row.get("chunk") or "", row)
+            for rank, row in enumerate(contexts)
+            if row.get("chunk")
+        ]
+        input_tokens = sum(count_tokens(p.text, self.model) for p in passages)
+
+        merged = self._merge_documents(passages)
+        unique = self._drop_duplicates(merged)
+
+        packed: List[Dict[str, Any]] = []
+        used_tokens = 0
+        truncated = False
+        for passage in unique:
+            tokens = count_tokens(passage.text, self.model)
+            text = passage.text
+            if used_tokens + tokens > self.token_budget:
+                if packed:
+                    continue
+                # 最相關的片段本身就超出預算時依比例截斷，至少保留一段內容
+                while tokens > self.token_budget and len(text) > 1:
+                    text = text[:max(1, len(text) * self.token_budget // tokens)]
+                    tokens = count_tokens(text, self.model)
+                truncated = True
+            packed.append({**passage.row, "chunk": text, "merged_chunks": passage.chunks})
+            used_tokens += tokens
+
+        stats = {
+            "input_chunks": len(passages),
+            "merged_chunks": len(passages) - len(merged),
+            "duplicates_dropped": len(merged) - len(unique),
+            "over_budget_dropped": len(unique) - len(packed),
+            "packed_passages": len(packed),
+            "truncated": truncated,
+            "input_tokens": input_tokens,
+            "context_tokens": used_tokens,
+            "token_budget": self.token_budget,
+            "exact_token_count": TIKTOKEN_AVAILABLE and bool(self.model),
+        }
+        return packed, stats
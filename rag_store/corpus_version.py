@@ -0,0 +1,46 @@
+"""
+語料版本計數器
+上傳、標籤變更、刪除等寫入操作遞增計數器，檢索結果與回答快取以此判斷是否失效
+
+計數器存於檔案中（以檔案鎖序列化遞增），所有 uvicorn worker 讀取同一份，
+任一 worker 寫入後，其他 worker 的快取在下次讀取時自動失效。
+"""
+
+import fcntl
+import os
+from pathlib import Path
+
+
+class CorpusVersion:
+    """跨程序共用的語料世代計數器"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def current(self) -> int:
+        """讀取目前世代；檔案不存在時為 0"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self) -> int:
+        """遞增世代並回傳新值"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    version = int(f.read().strip() or 0) + 1
+                except ValueError:
+                    version = 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(version))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return version
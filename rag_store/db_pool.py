@@ -0,0 +1,327 @@
+"""
+TiDB 連線池
+API、文件分類器與時間序列分析每次操作都建立新的 TLS 連線再關閉，
+TiDB Cloud 的 TCP + TLS + 認證握手往往比查詢本身還慢；改由同一個連線池借出與歸還
+
+主要功能：
+1. 有上限的連線數；連線全部借出時等待歸還，超過等待時間拋出 PoolTimeout
+2. 借出前對閒置超過 health_check_interval 的連線 ping，失效時重新建立
+3. 連線存活超過 max_lifetime、閒置超過 idle_timeout 時淘汰（避開伺服器端的閒置斷線）
+4. 借出的連線呼叫 close() 即歸還，既有的 conn.close() 寫法不需修改；
+   歸還時 rollback 未提交的交易，下一個使用者不會看到舊的快照
+5. 統計：建立、重用、淘汰、健康檢查失敗、等待次數與時間、逾時、未歸還即被回收的連線
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """等待可用連線逾時"""
+
+
+class _Slot:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PooledConnection:
+    """借出的連線；屬性轉交底層連線，close() 歸還連線池"""
+
+    def __init__(self, pool: "ConnectionPool", slot: _Slot):
+        self._pool = pool
+        self._slot: Optional[_Slot] = slot
+
+    def __getattr__(self, name: str) -> Any:
+        slot = self.__dict__.get("_slot")
+        if slot is None:
+            raise AttributeError(f"連線已歸還連線池，無法使用 {name}")
+        return getattr(slot.raw, name)
+
+    def close(self):
+        """歸還連線池（重複呼叫無作用）"""
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot)
+
+    def discard(self):
+        """連線狀態不明時關閉底層連線，不放回連線池"""
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot, discard=True)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # 例外路徑上未呼叫 close() 的連線在回收時歸還名額，避免連線池逐漸耗盡
+        slot = self.__dict__.get("_slot")
+        if slot is not None:
+            self._slot = None
+            self._pool._release(slot, discard=True, leaked=True)
+
+
+class ConnectionPool:
+    """有上限、可健康檢查與定期汰換的執行緒安全連線池"""
+
+    def __init__(self,
+                 connect: Callable[[], Any],
+                 max_size: int = 10,
+                 wait_timeout: float = 5.0,
+                 max_lifetime: float = 1800.0,
+                 idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0,
+                 name: str = "tidb"):
+        if max_size < 1:
+            raise ValueError("max_size 必須至少為 1")
+        self.connect = connect
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.name = name
+
+        # 最近歸還的連線在尾端，借出時優先使用（連線較可能仍有效）
+        self._idle: List[_Slot] = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.idle_closed = 0
+        self.health_check_failures = 0
+        self.discarded = 0
+        self.leaked = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _expired(self, slot: _Slot, now: float) -> Optional[str]:
+        if self.max_lifetime and now - slot.created_at > self.max_lifetime:
+            return "lifetime"
+        if self.idle_timeout and now - slot.last_used > self.idle_timeout:
+            return "idle"
+        return None
+
+    def _prune_locked(self, now: float) -> List[_Slot]:
+        """移除過期的閒置連線（於鎖內），回傳待關閉的連線"""
+        stale: List[_Slot] = []
+        kept: List[_Slot] = []
+        for slot in self._idle:
+            reason = self._expired(slot, now)
+            if reason is None:
+                kept.append(slot)
+                continue
+            stale.append(slot)
+            if reason == "lifetime":
+                self.recycled += 1
+            else:
+                self.idle_closed += 1
+        if stale:
+            self._idle = kept
+            self._size -= len(stale)
+        return stale
+
+    @staticmethod
+    def _close_raw(slot: _Slot):
+        try:
+            slot.raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, slot: _Slot, now: float) -> bool:
+        if now - slot.last_used < self.health_check_interval:
+            return True
+        try:
+            slot.raw.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.info(f"連線池 {self.name} 健康檢查失敗，重新建立連線: {e}")
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """借出連線；連線數已達上限時最多等待 timeout 秒（預設 wait_timeout）"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        slot: Optional[_Slot] = None
+        stale: List[_Slot] = []
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"連線池 {self.name} 已關閉")
+                stale.extend(self._prune_locked(time.monotonic()))
+                if self._idle:
+                    slot = self._idle.pop()
+                    self.reused += 1
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"連線池 {self.name} 等待可用連線逾時（{timeout:.1f} 秒，上限 {self.max_size}）")
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            if waited:
+                elapsed = time.monotonic() - started
+                self.waits += 1
+                self.wait_seconds += elapsed
+                self.max_wait_seconds = max(self.max_wait_seconds, elapsed)
+
+        # 關閉連線與建立新連線都涉及網路往返，於鎖外進行
+        for old in stale:
+            self._close_raw(old)
+        if slot is not None and not self._healthy(slot, time.monotonic()):
+            with self._cond:
+                self.health_check_failures += 1
+            self._close_raw(slot)
+            slot = None
+        if slot is None:
+            try:
+                slot = _Slot(self.connect())
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.created += 1
+        return PooledConnection(self, slot)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[PooledConnection]:
+        """with 區塊結束時自動歸還"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _release(self, slot: _Slot, discard: bool = False, leaked: bool = False):
+        if not discard:
+            try:
+                # 結束 autocommit=False 下查詢隱含開啟的交易；有未讀取的結果時 rollback 會失敗，直接淘汰
+                slot.raw.rollback()
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if leaked:
+                self.leaked += 1
+            if discard or self._closed or self._expired(slot, now) == "lifetime":
+                self._size -= 1
+                if discard:
+                    self.discarded += 1
+                elif not self._closed:
+                    self.recycled += 1
+                close = True
+            else:
+                slot.last_used = now
+                self._idle.append(slot)
+                close = False
+            self._cond.notify()
+        if close:
+            self._close_raw(slot)
+        if leaked:
+            logger.warning(f"連線池 {self.name} 回收了未呼叫 close() 的連線")
+
+    def close(self):
+        """關閉所有閒置連線；借出中的連線歸還時關閉"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for slot in idle:
+            self._close_raw(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "name": self.name,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "recycled": self.recycled,
+                "idle_closed": self.idle_closed,
+                "health_check_failures": self.health_check_failures,
+                "discarded": self.discarded,
+                "leaked": self.leaked,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_seconds / self.waits * 1000, 2) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+
+
+def tidb_config_from_env() -> Optional[Dict[str, Any]]:
+    """TiDB Cloud 連線參數；未設定帳號密碼時回傳 None"""
+    host, user, password = os.getenv("TIDB_HOST"), os.getenv("TIDB_USER"), os.getenv("TIDB_PASSWORD")
+    if not all([host, user, password]):
+        return None
+    return {
+        "host": host,
+        "user": user,
+        "password": password,
+        "database": os.getenv("TIDB_DB", "rag"),
+        "ssl_disabled": False,
+        "use_unicode": True,
+    }
+
+
+_shared_pool: Optional[ConnectionPool] = None
+_shared_pid: Optional[int] = None
+_shared_lock = threading.Lock()
+
+
+def get_tidb_pool() -> Optional[ConnectionPool]:
+    """
+    同一程序內共用的 TiDB Cloud 連線池（API、分類器與時間序列分析共用）
+    未設定連線參數時回傳 None；fork 出的子程序會建立自己的連線池
+    """
+    global _shared_pool, _shared_pid
+    with _shared_lock:
+        if _shared_pool is not None and _shared_pid == os.getpid():
+            return _shared_pool
+        config = tidb_config_from_env()
+        if config is None:
+            return None
+        _shared_pool = ConnectionPool(
+            lambda: mysql.connector.connect(**config),
+            max_size=int(os.getenv("TIDB_POOL_SIZE", 10)),
+            wait_timeout=float(os.getenv("TIDB_POOL_WAIT_TIMEOUT", 5)),
+            max_lifetime=float(os.getenv("TIDB_POOL_MAX_LIFETIME", 1800)),
+            idle_timeout=float(os.getenv("TIDB_POOL_IDLE_TIMEOUT", 300)),
+            health_check_interval=float(os.getenv("TIDB_POOL_HEALTH_CHECK_INTERVAL", 30)),
+        )
+        _shared_pid = os.getpid()
+        return _shared_pool
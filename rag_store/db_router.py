@@ -0,0 +1,218 @@
+"""
+讀寫分離路由
+分類、標籤、過濾器與時間序列等讀取密集的端點改由本機 TiDB 副本回應，寫入仍送往 TiDB Cloud
+
+主要功能：
+1. 複寫延遲：定期在主庫寫入心跳時間戳（replication_heartbeat），讀取副本上的值計算延遲，
+   延遲超過 max_lag_seconds 時讀取改回主庫
+2. 讀取自己的寫入：記錄每個客戶端最後一次寫入的時間，副本的心跳尚未超過該時間前，
+   該客戶端的讀取送往主庫
+3. 故障轉移：副本查詢或借出連線失敗時，該次讀取改由主庫重試，並在 retry_seconds 內不再使用副本
+4. 統計：各路由的讀取次數、故障轉移次數、目前延遲
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .async_db import AsyncDatabase, Row
+from .db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS replication_heartbeat (
+    id INT PRIMARY KEY,
+    ts DOUBLE NOT NULL
+)
+"""
+
+# 寫入紀錄保留秒數：超過後副本必定已追上或已因延遲過大停用
+WRITE_MEMORY_SECONDS = 600
+
+
+class QueryRouter:
+    """依副本延遲、客戶端寫入紀錄與健康狀態決定讀取送往副本或主庫"""
+
+    def __init__(self,
+                 primary: AsyncDatabase,
+                 replica: AsyncDatabase,
+                 primary_connect: Callable[[], Any],
+                 replica_pool: ConnectionPool,
+                 max_lag_seconds: float = 10.0,
+                 heartbeat_seconds: float = 2.0,
+                 retry_seconds: float = 30.0):
+        self.primary = primary
+        self.replica = replica
+        self.primary_connect = primary_connect
+        self.replica_pool = replica_pool
+        self.max_lag_seconds = max_lag_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retry_seconds = retry_seconds
+
+        # 副本上最新的心跳時間戳（主庫寫入時的 time.time()）
+        self.replicated_at: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+        self._last_writes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.counts = {"replica": 0, "primary": 0, "failovers": 0, "read_your_writes": 0, "lagging": 0}
+
+    # --- 路由判斷 ---
+
+    @property
+    def lag_seconds(self) -> Optional[float]:
+        if self.replicated_at is None:
+            return None
+        return max(0.0, time.time() - self.replicated_at)
+
+    def record_write(self, client: Optional[str]):
+        """客戶端寫入後呼叫；副本追上此時間點前，該客戶端的讀取送往主庫"""
+        now = time.time()
+        with self._lock:
+            self._last_writes[client or ""] = now
+            if len(self._last_writes) > 1000:
+                cutoff = now - WRITE_MEMORY_SECONDS
+                self._last_writes = {key: ts for key, ts in self._last_writes.items() if ts >= cutoff}
+
+    def use_replica(self, client: Optional[str] = None) -> bool:
+        with self._lock:
+            if time.monotonic() < self.down_until:
+                return False
+            lag = self.lag_seconds
+            if lag is None or lag > self.max_lag_seconds:
+                self.counts["lagging"] += 1
+                return False
+            last_write = self._last_writes.get(client or "")
+            if last_write is not None and self.replicated_at < last_write:
+                self.counts["read_your_writes"] += 1
+                return False
+            return True
+
+    def mark_down(self, error: Exception):
+        with self._lock:
+            self.down_until = time.monotonic() + self.retry_seconds
+            self.last_error = str(error)
+            self.counts["failovers"] += 1
+        logger.warning(f"本機副本不可用，{self.retry_seconds:.0f} 秒內讀取改由 TiDB Cloud 回應: {error}")
+
+    def _count(self, target: str):
+        with self._lock:
+            self.counts[target] += 1
+
+    # --- 讀取 ---
+
+    async def _read(self, method: str, sql: str, params: Optional[Sequence[Any]], client: Optional[str]) -> Any:
+        if self.use_replica(client):
+            try:
+                result = await getattr(self.replica, method)(sql, params)
+                self._count("replica")
+                return result
+            except Exception as e:
+                # 讀取可安全重試，改由主庫回應
+                self.mark_down(e)
+        self._count("primary")
+        return await getattr(self.primary, method)(sql, params)
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence[Any]] = None,
+                        client: Optional[str] = None) -> list:
+        return await self._read("fetch_all", sql, params, client)
+
+    async def fetch_one(self, sql: str, params: Optional[Sequence[Any]] = None,
+                        client: Optional[str] = None) -> Optional[Row]:
+        return await self._read("fetch_one", sql, params, client)
+
+    async def execute(self, sql: str, params: Optional[Sequence[Any]] = None,
+                      client: Optional[str] = None) -> int:
+        """寫入一律送往主庫，並記錄客戶端的寫入時間"""
+        result = await self.primary.execute(sql, params)
+        self.record_write(client)
+        return result
+
+    def reader(self, client: Optional[str] = None) -> "RoutedReader":
+        """綁定客戶端的讀取介面（與 AsyncDatabase 的 fetch_all / fetch_one 相同）"""
+        return RoutedReader(self, client)
+
+    def read_with_connection(self, fn: Callable[[Any], Any], client: Optional[str] = None) -> Any:
+        """以阻塞式連線執行唯讀工作（TimeSeriesAnalyzer）；副本失敗時改由主庫重試"""
+        if self.use_replica(client):
+            try:
+                with self.replica_pool.connection() as conn:
+                    result = fn(conn)
+                self._count("replica")
+                return result
+            except Exception as e:
+                self.mark_down(e)
+        self._count("primary")
+        conn = self.primary_connect()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+    # --- 心跳 ---
+
+    async def heartbeat_once(self):
+        """在主庫寫入心跳並讀取副本上的最新值"""
+        await self.primary.execute(
+            "INSERT INTO replication_heartbeat (id, ts) VALUES (1, %s) ON DUPLICATE KEY UPDATE ts = VALUES(ts)",
+            (time.time(),)
+        )
+        try:
+            row = await self.replica.fetch_one("SELECT ts FROM replication_heartbeat WHERE id = 1")
+        except Exception as e:
+            self.mark_down(e)
+            return
+        with self._lock:
+            self.replicated_at = float(row["ts"]) if row else None
+            self.checked_at = time.time()
+            if row and time.monotonic() >= self.down_until:
+                self.last_error = None
+
+    async def run_heartbeat(self):
+        """背景工作：建立心跳表後定期更新延遲"""
+        try:
+            await self.primary.execute(HEARTBEAT_TABLE_SQL)
+        except Exception as e:
+            logger.warning(f"建立 replication_heartbeat 失敗: {e}")
+        while True:
+            try:
+                await self.heartbeat_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"複寫心跳失敗: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        lag = self.lag_seconds
+        with self._lock:
+            return {
+                "replica_available": time.monotonic() >= self.down_until,
+                "lag_seconds": round(lag, 3) if lag is not None else None,
+                "max_lag_seconds": self.max_lag_seconds,
+                "last_heartbeat_check": self.checked_at,
+                "last_error": self.last_error,
+                "reads": dict(self.counts),
+                "tracked_clients": len(self._last_writes),
+                "replica_pool": self.replica_pool.stats(),
+            }
+
+
+class RoutedReader:
+    """以固定客戶端身分透過 QueryRouter 讀取"""
+
+    def __init__(self, router: QueryRouter, client: Optional[str]):
+        self.router = router
+        self.client = client
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence[Any]] = None) -> list:
+        return await self.router.fetch_all(sql, params, self.client)
+
+    async def fetch_one(self, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Row]:
+        return await self.router.fetch_one(sql, params, self.client)
@@ -0,0 +1,168 @@
+"""
+Embedding 微批次處理器
+將所有進行中上傳所產生的 chunk 合併為多輸入的 embedding 請求
+
+主要功能：
+1. 以最大批次數量、最大 token 預算與最長等待時間控制批次大小
+2. 跨請求合併（coalescing），多個上傳共用同一批次
+3. 提供同步的分批工具供 scripts/embed_upload.py 重複使用
+"""
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# OpenAI embeddings API 單次請求上限為 2048 個輸入、單一輸入 8192 tokens
+DEFAULT_MAX_BATCH_SIZE = 128
+DEFAULT_MAX_BATCH_TOKENS = 100_000
+DEFAULT_MAX_WAIT_MS = 20.0
+
+# CJK 字元（中日韓文字、全形標點）
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估文字的 token 數（CJK 字元約 1.5 token，其餘約 4 字元 1 token）"""
+    cjk_count = len(_CJK_RE.findall(text))
+    other_count = len(text) - cjk_count
+    return int(cjk_count * 1.5) + other_count // 4 + 1
+
+
+def iter_batches(texts: List[str],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS) -> Iterator[List[str]]:
+    """依批次數量與 token 預算將文字切分為多個批次（同步版本）"""
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+@dataclass
+class _PendingItem:
+    """等待 embedding 的單一輸入"""
+    text: str
+    tokens: int
+    future: asyncio.Future
+
+
+class EmbeddingBatcher:
+    """跨請求合併 embedding 輸入的微批次處理器"""
+
+    def __init__(self,
+                 embed_fn: EmbedFn,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._carry: Optional[_PendingItem] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+        self.stats = {"requests": 0, "inputs": 0, "errors": 0}
+
+    def _ensure_worker(self):
+        """確保背景批次工作在目前的 event loop 上執行"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """取得單一文字的 embedding（會與其他請求合併）"""
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """取得多段文字的 embedding，依輸入順序回傳"""
+        if not texts:
+            return []
+        self._ensure_worker()
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait(_PendingItem(text, estimate_tokens(text), future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _next_item(self, timeout: Optional[float]) -> Optional[_PendingItem]:
+        """取出下一個輸入；timeout 為 None 時無限等待"""
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        if timeout is None:
+            return await self._queue.get()
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        if timeout <= 0:
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _run(self):
+        """收集輸入並組成批次，批次之間可並行送出"""
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._next_item(None)
+            batch = [first]
+            batch_tokens = first.tokens
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                item = await self._next_item(deadline - loop.time())
+                if item is None:
+                    break
+                if batch_tokens + item.tokens > self.max_batch_tokens:
+                    # 超出 token 預算，留給下一個批次
+                    self._carry = item
+                    break
+                batch.append(item)
+                batch_tokens += item.tokens
+
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[_PendingItem]):
+        """送出一個批次並將結果分派回各個等待者"""
+        self.stats["requests"] += 1
+        self.stats["inputs"] += len(batch)
+        try:
+            embeddings = await self.embed_fn([item.text for item in batch])
+            if len(embeddings) != len(batch):
+                raise ValueError(f"預期 {len(batch)} 個 embedding，實際收到 {len(embeddings)} 個")
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Embedding 批次請求失敗: {e}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item, embedding in zip(batch, embeddings):
+            if not item.future.done():
+                item.future.set_result(embedding)
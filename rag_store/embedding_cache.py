@@ -0,0 +1,207 @@
+"""
+內容定址的 embedding 快取
+以 (模型名稱, 正規化後的 chunk 文字) 的雜湊作為鍵，將 embedding 保存在本機磁碟
+
+主要功能：
+1. SQLite 儲存，跨程序與重新啟動保留
+2. 依最後存取時間進行 LRU 淘汰，並限制總容量（項目數與總位元組由觸發程序維護於資料表中，
+   多個程序共用同一個快取檔案時也以實際總量判斷是否淘汰）
+3. 命中/未命中計數，用於調整快取大小
+"""
+
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .vector_codec import VectorLike, from_bytes, to_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """正規化 chunk 文字（NFKC、合併空白、去除前後空白）"""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    """計算 (模型, 正規化文字) 的內容雜湊"""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """持久化、具容量上限的 LRU embedding 快取"""
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access ON embedding_cache (last_access)"
+        )
+        # 總量以單列資料表保存：寫入與淘汰都在同一交易中更新，不依賴各程序自己的計數
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER NOT NULL,
+                nbytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            INSERT OR IGNORE INTO embedding_cache_totals (id, entries, nbytes)
+            SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) FROM embedding_cache
+        """)
+        self._conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS embedding_cache_after_insert AFTER INSERT ON embedding_cache
+            BEGIN
+                UPDATE embedding_cache_totals SET entries = entries + 1, nbytes = nbytes + NEW.nbytes WHERE id = 0;
+            END
+        """)
+        self._conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS embedding_cache_after_delete AFTER DELETE ON embedding_cache
+            BEGIN
+                UPDATE embedding_cache_totals SET entries = entries - 1, nbytes = nbytes - OLD.nbytes WHERE id = 0;
+            END
+        """)
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """查詢單一文字的 embedding"""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """批次查詢，未命中的位置為 None"""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[str, bytes] = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self._lock:
+            # SQLite 預設最多 999 個參數，分段查詢
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                placeholders = ','.join(['?'] * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embedding_cache WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(from_bytes(blob).tolist())
+        return results
+
+    def put(self, model: str, text: str, vector: VectorLike):
+        """寫入單一 embedding"""
+        self.put_many(model, [(text, vector)])
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, VectorLike]]):
+        """批次寫入 embedding，並在超過容量時淘汰最久未使用的項目"""
+        now = time.time()
+        rows = {}
+        for text, vector in items:
+            blob = to_bytes(vector)
+            rows[cache_key(model, text)] = (model, blob, len(blob), now)
+        if not rows:
+            return
+
+        with self._lock:
+            try:
+                # 先取得寫入鎖：其他程序的寫入與淘汰在此交易結束前不會改變總量
+                self._conn.execute("BEGIN IMMEDIATE")
+                # 內容定址：相同鍵的向量相同，已存在時只需略過
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embedding_cache (key, model, vec, nbytes, last_access) VALUES (?, ?, ?, ?, ?)",
+                    [(key, *row) for key, row in rows.items()]
+                )
+                self._evict_locked()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"寫入 embedding 快取失敗: {e}")
+                self._conn.rollback()
+
+    def _totals_locked(self) -> Tuple[int, int]:
+        """資料表中的 (項目數, 總位元組)，包含其他程序的寫入（需持有鎖）"""
+        return self._conn.execute("SELECT entries, nbytes FROM embedding_cache_totals WHERE id = 0").fetchone()
+
+    def _evict_locked(self):
+        """淘汰最久未使用的項目直到低於容量上限（需持有鎖，並於寫入交易中呼叫）"""
+        entries, total_bytes = self._totals_locked()
+        while total_bytes > self.max_bytes and entries > 0:
+            rows = self._conn.execute(
+                "SELECT key, nbytes FROM embedding_cache ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            freed = 0
+            victims = []
+            for key, nbytes in rows:
+                victims.append((key,))
+                freed += nbytes
+                if total_bytes - freed <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embedding_cache WHERE key = ?", victims)
+            self.evictions += len(victims)
+            entries, total_bytes = self._totals_locked()
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embedding_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """取得快取統計資訊"""
+        with self._lock:
+            entries, total_bytes = self._totals_locked()
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "size_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
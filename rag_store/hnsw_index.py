@@ -0,0 +1,216 @@
+"""
+程序內 HNSW 向量索引
+以 embeddings.id 為標籤，在記憶體中提供毫秒級 top-k 查詢；TiDB 仍為唯一資料來源
+
+主要功能：
+1. 以 hnswlib 建立 cosine 距離的 HNSW 圖（距離定義與 VEC_COSINE_DISTANCE 相同）
+2. 上傳新 chunk 時增量加入
+3. 儲存至磁碟並於啟動時重新載入，再從 TiDB 補齊尚未加入的資料列
+4. 刪除的 chunk 以 mark_deleted 標記，查詢時略過
+
+hnswlib 為選用套件，未安裝時 HNSW_AVAILABLE 為 False。
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Collection, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .mmap_index import id_array
+from .vector_codec import EMBEDDING_DIM, VectorLike, normalize, to_array, to_matrix
+
+try:
+    import hnswlib
+    HNSW_AVAILABLE = True
+except ImportError:  # pragma: no cover - 選用套件
+    hnswlib = None
+    HNSW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SearchHit = Tuple[int, float]
+
+# 允許清單小於此數量時直接取出向量精確評分，避免在圖上走訪大量被過濾的節點
+FILTER_BRUTE_FORCE_LIMIT = 5000
+
+
+class HNSWIndex:
+    """以 embeddings.id 為標籤的 HNSW 近似最近鄰索引"""
+
+    def __init__(self,
+                 path: Path,
+                 dim: int = EMBEDDING_DIM,
+                 m: int = 16,
+                 ef_construction: int = 200,
+                 ef_search: int = 64,
+                 initial_capacity: int = 10_000):
+        if not HNSW_AVAILABLE:
+            raise RuntimeError("hnswlib 未安裝，無法使用 HNSW 索引")
+        self.path = Path(path)
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.initial_capacity = initial_capacity
+
+        self.max_id = 0  # 已同步的最大 embeddings.id
+        self.dirty = 0   # 上次儲存後新增或刪除的向量數
+        self._deleted: Set[int] = set()
+        self._lock = threading.RLock()
+        self._index = self._new_index(initial_capacity)
+
+    @property
+    def index_file(self) -> Path:
+        return self.path / "index.bin"
+
+    @property
+    def meta_file(self) -> Path:
+        return self.path / "meta.json"
+
+    def _new_index(self, capacity: int):
+        index = hnswlib.Index(space='cosine', dim=self.dim)
+        index.init_index(max_elements=capacity, ef_construction=self.ef_construction, M=self.m)
+        index.set_ef(self.ef_search)
+        return index
+
+    def __len__(self) -> int:
+        return self._index.get_current_count()
+
+    def load(self) -> bool:
+        """從磁碟載入索引，檔案不存在或損毀時回傳 False"""
+        if not self.index_file.exists() or not self.meta_file.exists():
+            return False
+        try:
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dim") != self.dim:
+                logger.warning(f"HNSW 索引維度不符（{meta.get('dim')} != {self.dim}），將重新建立")
+                return False
+            with self._lock:
+                index = hnswlib.Index(space='cosine', dim=self.dim)
+                index.load_index(str(self.index_file), max_elements=max(meta.get("count", 0), self.initial_capacity))
+                index.set_ef(self.ef_search)
+                self._index = index
+                self.max_id = int(meta.get("max_id", 0))
+                self._deleted = set(meta.get("deleted", []))
+                self.dirty = 0
+            logger.info(f"已載入 HNSW 索引：{len(self)} 個向量，max_id={self.max_id}")
+            return True
+        except Exception as e:
+            logger.error(f"載入 HNSW 索引失敗: {e}")
+            return False
+
+    def save(self):
+        """儲存索引與中繼資料（先寫暫存檔再取代，避免中途中斷造成損毀）"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp_index = self.index_file.with_suffix(".tmp")
+            self._index.save_index(str(tmp_index))
+            tmp_index.replace(self.index_file)
+            meta = {"dim": self.dim, "m": self.m, "count": len(self), "max_id": self.max_id,
+                    "deleted": sorted(self._deleted)}
+            tmp_meta = self.meta_file.with_suffix(".tmp")
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            tmp_meta.replace(self.meta_file)
+            self.dirty = 0
+
+    def add(self, ids: Sequence[int], vectors: Sequence[VectorLike]):
+        """增量加入向量，容量不足時自動擴充"""
+        if len(ids) == 0:
+            return
+        matrix = to_matrix(vectors)
+        labels = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            needed = len(self) + len(labels)
+            capacity = self._index.get_max_elements()
+            if needed > capacity:
+                self._index.resize_index(max(needed, capacity * 2))
+            self._index.add_items(matrix, labels)
+            self.max_id = max(self.max_id, int(labels.max()))
+            self.dirty += len(labels)
+
+    def indexed_ids(self) -> np.ndarray:
+        """目前索引中（未被刪除）的 embeddings.id"""
+        with self._lock:
+            ids = np.asarray(self._index.get_ids_list(), dtype=np.int64)
+            if self._deleted:
+                ids = np.setdiff1d(ids, np.fromiter(self._deleted, dtype=np.int64))
+        return ids
+
+    def remove(self, ids: Sequence[int]):
+        """標記刪除；不在索引中的 id 略過"""
+        with self._lock:
+            for label in ids:
+                label = int(label)
+                if label in self._deleted:
+                    continue
+                try:
+                    self._index.mark_deleted(label)
+                except RuntimeError:
+                    continue
+                self._deleted.add(label)
+                self.dirty += 1
+
+    def search(self, vector: VectorLike, k: int, allow_ids: Optional[Collection[int]] = None) -> List[SearchHit]:
+        """查詢單一向量的 top-k，回傳 (embeddings.id, cosine 距離)"""
+        return self.search_many([to_array(vector)], k, allow_ids)[0]
+
+    def search_many(self,
+                    vectors: Sequence[VectorLike],
+                    k: int,
+                    allow_ids: Optional[Collection[int]] = None) -> List[List[SearchHit]]:
+        """以單次呼叫查詢多個向量；allow_ids 限定結果只包含允許的 id"""
+        if allow_ids is not None and len(allow_ids) <= FILTER_BRUTE_FORCE_LIMIT:
+            return self._search_allowed(vectors, k, allow_ids)
+        with self._lock:
+            count = len(self) - len(self._deleted)
+            if count <= 0:
+                return [[] for _ in vectors]
+            k = min(k, count)
+            # ef 至少需大於 k 才能取得 k 個結果
+            self._index.set_ef(max(self.ef_search, k))
+            if allow_ids is None:
+                labels, distances = self._index.knn_query(to_matrix(vectors), k=k)
+            else:
+                allowed = allow_ids if isinstance(allow_ids, (set, frozenset)) else set(int(i) for i in allow_ids)
+                k = min(k, len(allowed))
+                if k == 0:
+                    return [[] for _ in vectors]
+                labels, distances = self._index.knn_query(
+                    to_matrix(vectors), k=k, filter=lambda label: label in allowed
+                )
+        return [
+            [(int(label), float(distance)) for label, distance in zip(row_labels, row_distances)]
+            for row_labels, row_distances in zip(labels, distances)
+        ]
+
+    def _search_allowed(self,
+                        vectors: Sequence[VectorLike],
+                        k: int,
+                        allow_ids: Collection[int]) -> List[List[SearchHit]]:
+        """小型允許清單：取出向量後以矩陣乘法精確評分"""
+        queries = normalize(to_matrix(vectors))
+        labels = id_array(allow_ids)
+        with self._lock:
+            if self._deleted:
+                labels = np.setdiff1d(labels, np.fromiter(self._deleted, dtype=np.int64))
+            try:
+                items = self._index.get_items(labels) if len(labels) else []
+            except RuntimeError:
+                # 允許清單含有尚未加入索引的 id 時，只保留索引中存在的部分
+                labels = np.intersect1d(labels, np.asarray(self._index.get_ids_list(), dtype=np.int64))
+                items = self._index.get_items(labels) if len(labels) else []
+        if len(labels) == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        matrix = normalize(np.asarray(items, dtype=np.float32))
+        scores = queries @ matrix.T
+        k = min(k, len(labels))
+        results = []
+        for row in scores:
+            top = np.argsort(-row)[:k]
+            results.append([(int(labels[i]), float(1.0 - row[i])) for i in top])
+        return results
@@ -0,0 +1,526 @@
+"""
+上傳處理工作佇列
+/api/upload 原本在請求中依序執行 OCR、分類、分塊、向量化與時間序列擷取，每個檔案需等待數十秒；
+改為寫入本機 SQLite 佇列後立即回傳工作 ID，由背景 worker 依階段處理
+
+主要功能：
+1. 持久化：工作、各階段狀態與階段輸出保存在 SQLite，重新啟動後未完成的工作繼續執行；
+   多個 API 程序可共用同一個佇列檔案（領取工作於 BEGIN IMMEDIATE 交易中進行）
+2. 分階段：已完成階段的輸出保存在工作狀態中，重試時從失敗的階段繼續，不重做先前的階段
+3. 重試與死信：階段失敗後依指數退避重新排程，同一階段失敗 max_attempts 次後工作移入死信（dead），
+   不再自動重試，可手動 retry；worker 程序中斷或租約逾時的工作視為該階段失敗一次
+   （階段執行期間每 lease_seconds / 3 續約一次，執行較久的階段不會被誤判為逾時）
+4. worker 數量可設定；進度（各階段狀態、嘗試次數、錯誤）可隨時查詢
+5. 已完成的工作保留 retention_seconds 後刪除（死信保留至手動處理）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 工作狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_DEAD = "dead"
+
+# 階段狀態
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_COMPLETED = "completed"
+STAGE_FAILED = "failed"
+
+# 錯誤訊息保留長度
+MAX_ERROR_CHARS = 2000
+
+# 閒置的 worker 清除過期工作的間隔
+PURGE_INTERVAL_SECONDS = 3600
+
+
+@dataclass
+class Job:
+    """已領取的工作；state 為先前階段的輸出（JSON 可序列化）"""
+
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    state: Dict[str, Any] = field(default_factory=dict)
+    completed_stages: List[str] = field(default_factory=list)
+    # 目前階段與其第幾次嘗試（start_stage 時更新）
+    stage: Optional[str] = None
+    attempt: int = 0
+
+
+# 階段處理函式：回傳的 dict 併入工作狀態
+StageHandler = Callable[[Job], Awaitable[Optional[Dict[str, Any]]]]
+Pipeline = Sequence[Tuple[str, StageHandler]]
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """同一主機上的 worker 程序是否仍存在；其他主機無法判斷，視為存在（以租約逾時處理）"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+class JobQueue:
+    """以 SQLite 保存的分階段工作佇列"""
+
+    def __init__(self,
+                 path: Path,
+                 max_attempts: int = 3,
+                 retry_base_seconds: float = 5.0,
+                 lease_seconds: float = 600.0,
+                 retention_seconds: float = 7 * 86400):
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.owner = _owner()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 自行控制交易：領取與狀態轉換以 BEGIN IMMEDIATE 與其他程序互斥
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT '{}',
+                current_stage TEXT,
+                error TEXT,
+                owner TEXT,
+                lease_until REAL,
+                next_run_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, next_run_at);
+            CREATE TABLE IF NOT EXISTS job_stages (
+                job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                started_at REAL,
+                finished_at REAL,
+                PRIMARY KEY (job_id, position)
+            );
+        """)
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    # --- 寫入 ---
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], stages: Sequence[str]) -> str:
+        """新增工作，回傳工作 ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, next_run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, json.dumps(payload, default=str), now, now, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_stages (job_id, position, name) VALUES (?, ?, ?)",
+                [(job_id, position, name) for position, name in enumerate(stages)]
+            )
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """領取一個到期的工作（最早排程者優先）；沒有可執行的工作時回傳 None"""
+        now = time.time()
+        with self._lock, self._transaction():
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND next_run_at <= ? "
+                "ORDER BY next_run_at, created_at LIMIT 1",
+                (JOB_QUEUED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (JOB_RUNNING, self.owner, now + self.lease_seconds, now, row["id"])
+            )
+            completed = [stage["name"] for stage in self._conn.execute(
+                "SELECT name FROM job_stages WHERE job_id = ? AND status = ? ORDER BY position",
+                (row["id"], STAGE_COMPLETED)
+            )]
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            state=json.loads(row["state"]),
+            completed_stages=completed,
+        )
+
+    def start_stage(self, job: Job, stage: str):
+        """開始階段：增加嘗試次數並延長租約"""
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE job_stages SET status = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL "
+                "WHERE job_id = ? AND name = ?",
+                (STAGE_RUNNING, now, job.id, stage)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET current_stage = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (stage, now + self.lease_seconds, now, job.id)
+            )
+            attempts = self._conn.execute(
+                "SELECT attempts FROM job_stages WHERE job_id = ? AND name = ?", (job.id, stage)
+            ).fetchone()[0]
+        job.stage = stage
+        job.attempt = attempts
+
+    def renew_lease(self, job: Job) -> bool:
+        """延長執行中工作的租約；工作已不屬於本程序時回傳 False"""
+        now = time.time()
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (now + self.lease_seconds, now, job.id, JOB_RUNNING, self.owner)
+            )
+        return cursor.rowcount > 0
+
+    def complete_stage(self, job: Job, stage: str, output: Optional[Dict[str, Any]] = None):
+        """階段完成：輸出併入工作狀態，與階段狀態於同一交易寫入"""
+        if output:
+            job.state.update(output)
+        job.completed_stages.append(stage)
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE job_stages SET status = ?, error = NULL, finished_at = ? WHERE job_id = ? AND name = ?",
+                (STAGE_COMPLETED, now, job.id, stage)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(job.state, default=str), now, job.id)
+            )
+
+    def complete(self, job: Job):
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, current_stage = NULL, error = NULL, owner = NULL, "
+                "lease_until = NULL, updated_at = ?, finished_at = ? WHERE id = ?",
+                (JOB_COMPLETED, now, now, job.id)
+            )
+
+    def fail_stage(self, job: Job, stage: Optional[str], error: str) -> bool:
+        """階段失敗：未達上限時依指數退避重新排程，否則移入死信；回傳是否已移入死信"""
+        with self._lock, self._transaction():
+            return self._fail(job.id, stage, error, time.time())
+
+    def _fail(self, job_id: str, stage: Optional[str], error: str, now: float) -> bool:
+        error = error[:MAX_ERROR_CHARS]
+        attempts = 0
+        if stage is not None:
+            row = self._conn.execute(
+                "SELECT attempts FROM job_stages WHERE job_id = ? AND name = ?", (job_id, stage)
+            ).fetchone()
+            attempts = row[0] if row else 0
+        # 沒有可重試的階段（未知的工作類型）時直接移入死信
+        dead = stage is None or attempts >= self.max_attempts
+        self._conn.execute(
+            "UPDATE job_stages SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND name = ?",
+            (STAGE_FAILED if dead else STAGE_PENDING, error, now, job_id, stage)
+        )
+        if dead:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner = NULL, lease_until = NULL, "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                (JOB_DEAD, error, now, now, job_id)
+            )
+        else:
+            delay = self.retry_base_seconds * (2 ** max(0, attempts - 1))
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner = NULL, lease_until = NULL, "
+                "next_run_at = ?, updated_at = ? WHERE id = ?",
+                (JOB_QUEUED, error, now + delay, now, job_id)
+            )
+        return dead
+
+    def requeue_abandoned(self) -> List[Job]:
+        """
+        worker 程序已結束或租約逾時的執行中工作，視為目前階段失敗一次後重新排程
+        回傳因此移入死信的工作
+        """
+        now = time.time()
+        dead: List[Job] = []
+        with self._lock, self._transaction():
+            rows = self._conn.execute("SELECT * FROM jobs WHERE status = ?", (JOB_RUNNING,)).fetchall()
+            for row in rows:
+                if row["owner"] == self.owner:
+                    continue
+                expired = row["lease_until"] is not None and row["lease_until"] < now
+                if not expired and _owner_alive(row["owner"]):
+                    continue
+                logger.warning(f"工作 {row['id']} 的 worker 已中斷（{row['owner']}），重新排程")
+                if row["current_stage"] is None:
+                    # 尚未開始任何階段
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                        (JOB_QUEUED, now, row["id"])
+                    )
+                elif self._fail(row["id"], row["current_stage"], "worker 中斷", now):
+                    dead.append(Job(id=row["id"], kind=row["kind"], payload=json.loads(row["payload"]),
+                                    state=json.loads(row["state"]), stage=row["current_stage"]))
+        return dead
+
+    def release_owned(self):
+        """關閉時將本程序執行中的工作放回佇列（不計為失敗）"""
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "UPDATE job_stages SET status = ?, attempts = MAX(attempts - 1, 0) "
+                "WHERE status = ? AND job_id IN (SELECT id FROM jobs WHERE status = ? AND owner = ?)",
+                (STAGE_PENDING, STAGE_RUNNING, JOB_RUNNING, self.owner)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, next_run_at = ?, updated_at = ? "
+                "WHERE status = ? AND owner = ?",
+                (JOB_QUEUED, now, now, JOB_RUNNING, self.owner)
+            )
+
+    def retry(self, job_id: str) -> bool:
+        """將死信工作重新排入佇列，失敗的階段重新計算嘗試次數；工作不在死信中時回傳 False"""
+        now = time.time()
+        with self._lock, self._transaction():
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, next_run_at = ?, updated_at = ?, finished_at = NULL "
+                "WHERE id = ? AND status = ?",
+                (JOB_QUEUED, now, now, job_id, JOB_DEAD)
+            ).rowcount
+            if updated:
+                self._conn.execute(
+                    "UPDATE job_stages SET status = ?, attempts = 0 WHERE job_id = ? AND status = ?",
+                    (STAGE_PENDING, job_id, STAGE_FAILED)
+                )
+        return bool(updated)
+
+    def purge(self) -> int:
+        """刪除超過保留期限的已完成工作，回傳刪除筆數"""
+        with self._lock, self._transaction():
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status = ? AND finished_at < ?",
+                (JOB_COMPLETED, time.time() - self.retention_seconds)
+            ).rowcount
+
+    # --- 查詢 ---
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """工作狀態與各階段進度；工作不存在時回傳 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            stages = self._conn.execute(
+                "SELECT name, status, attempts, error, started_at, finished_at FROM job_stages "
+                "WHERE job_id = ? ORDER BY position",
+                (job_id,)
+            ).fetchall()
+        job = {key: row[key] for key in (
+            "id", "kind", "status", "current_stage", "error", "created_at", "updated_at", "finished_at"
+        )}
+        job["payload"] = json.loads(row["payload"])
+        job["state"] = json.loads(row["state"])
+        job["next_run_at"] = row["next_run_at"] if row["status"] == JOB_QUEUED else None
+        job["stages"] = [dict(stage) for stage in stages]
+        completed = sum(1 for stage in stages if stage["status"] == STAGE_COMPLETED)
+        job["progress"] = completed / len(stages) if stages else 1.0
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            ready = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND next_run_at <= ?", (JOB_QUEUED, time.time())
+            ).fetchone()[0]
+        return {
+            "path": str(self.path),
+            "jobs": {status: counts.get(status, 0) for status in (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_DEAD)},
+            "ready": ready,
+            "max_attempts": self.max_attempts,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT；例外時回滾"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class JobWorkerPool:
+    """在 event loop 中執行佇列工作的 worker；各種工作依 kind 對應到階段序列"""
+
+    def __init__(self,
+                 queue: JobQueue,
+                 pipelines: Dict[str, Pipeline],
+                 workers: int = 2,
+                 poll_seconds: float = 1.0,
+                 on_dead: Optional[Callable[[Job], Awaitable[None]]] = None):
+        self.queue = queue
+        self.pipelines = pipelines
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.on_dead = on_dead
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._purged_at = 0.0
+        self.active = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead = 0
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        """新增工作並喚醒閒置的 worker"""
+        job_id = self.queue.enqueue(kind, payload, [name for name, _ in self.pipelines[kind]])
+        self.notify()
+        return job_id
+
+    def notify(self):
+        """有新的（或重新排入的）工作時喚醒閒置的 worker"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 中斷的階段下次啟動時重新執行，不計為失敗
+        self.queue.release_owned()
+
+    async def _dead_letter(self, job: Job):
+        self.dead += 1
+        logger.error(f"工作 {job.id} 於階段 {job.stage} 失敗 {self.queue.max_attempts} 次，移入死信")
+        if self.on_dead is not None:
+            try:
+                await self.on_dead(job)
+            except Exception as e:
+                logger.error(f"死信處理失敗（工作 {job.id}）: {e}")
+
+    async def _worker(self):
+        while True:
+            for job in await asyncio.to_thread(self.queue.requeue_abandoned):
+                await self._dead_letter(job)
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                if time.monotonic() - self._purged_at > PURGE_INTERVAL_SECONDS:
+                    self._purged_at = time.monotonic()
+                    await asyncio.to_thread(self.queue.purge)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.active += 1
+            try:
+                await self._run(job)
+            finally:
+                self.active -= 1
+
+    async def _heartbeat(self, job: Job):
+        """階段執行期間定期續約，避免其他程序將執行中的工作視為逾時"""
+        interval = self.queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self.queue.renew_lease, job):
+                    logger.warning(f"工作 {job.id} 的租約已被其他程序取回，停止續約")
+                    return
+            except Exception as e:
+                logger.warning(f"工作 {job.id} 續約失敗: {e}")
+
+    async def _run(self, job: Job):
+        pipeline = self.pipelines.get(job.kind)
+        if pipeline is None:
+            job.stage = None
+            if await asyncio.to_thread(self.queue.fail_stage, job, None, f"未知的工作類型 '{job.kind}'"):
+                await self._dead_letter(job)
+            return
+        for name, handler in pipeline:
+            if name in job.completed_stages:
+                continue
+            await asyncio.to_thread(self.queue.start_stage, job, name)
+            heartbeat = asyncio.create_task(self._heartbeat(job))
+            try:
+                output = await handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"工作 {job.id} 階段 {name} 第 {job.attempt} 次失敗: {e}")
+                if await asyncio.to_thread(self.queue.fail_stage, job, name, f"{type(e).__name__}: {e}"):
+                    await self._dead_letter(job)
+                else:
+                    self.retried += 1
+                return
+            finally:
+                heartbeat.cancel()
+            await asyncio.to_thread(self.queue.complete_stage, job, name, output)
+        await asyncio.to_thread(self.queue.complete, job)
+        self.processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.queue.stats(),
+            "workers": self.workers,
+            "active": self.active,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead,
+        }
@@ -0,0 +1,187 @@
+"""
+本機詞彙倒排索引
+以 CJK 字元二元組（bigram）與英數詞切分 embeddings.chunk，BM25 評分，
+帳單編號、「電費」、公司名稱這類精確詞彙查詢不需呼叫 OpenAI embedding
+
+主要功能：
+1. 斷詞：中文連續字元切為 bigram（單字則保留單字），英數詞保留連字號 / 點號組成的編號
+2. 增量維護：上傳時直接加入新 chunk，啟動時從 TiDB 補齊
+3. 倒數排名融合（RRF）：與向量搜尋結果合併排序
+4. 關鍵字查詢判斷：短、含編號或專有名詞、非問句的查詢直接走詞彙索引
+"""
+
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .mmap_index import missing_ids
+
+logger = logging.getLogger(__name__)
+
+SearchHit = Tuple[int, float]
+
+_CJK_CLASS = r'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'[{_CJK_CLASS}]+|[0-9a-z]+(?:[-_./][0-9a-z]+)*')
+_CJK_RUN_RE = re.compile(rf'[{_CJK_CLASS}]+')
+
+# 問句或敘述型查詢的特徵，這類查詢仍需語義搜尋
+_QUESTION_RE = re.compile(r'[?？]|什麼|甚麼|為什麼|如何|怎麼|怎樣|哪些|哪裡|多少|是否|嗎|呢|\b(?:what|how|why|which|when|where)\b')
+_IDENTIFIER_RE = re.compile(r'[0-9]')
+
+# RRF 常數，採原論文建議值
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """NFKC 正規化後切分為 CJK bigram 與英數詞"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text):
+        if _CJK_RUN_RE.fullmatch(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def looks_like_keyword_query(query: str, max_length: int = 16) -> bool:
+    """判斷查詢是否為精確詞彙查詢（短、非問句，或含編號）"""
+    query = unicodedata.normalize("NFKC", query).strip().lower()
+    if not query or _QUESTION_RE.search(query):
+        return False
+    if _IDENTIFIER_RE.search(query) and len(query.split()) <= 3:
+        return True
+    return len(query) <= max_length and len(query.split()) <= 3
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[SearchHit]:
+    """合併多個依相關度排序的 id 清單，回傳 (id, RRF 分數)，分數高者在前"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """以 embeddings.id 為文件編號的 BM25 倒排索引"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.max_id = 0  # 已同步的最大 embeddings.id
+        self.ready = False
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]):
+        """加入 chunk；已存在的 id 略過"""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                chunk_id = int(chunk_id)
+                if chunk_id in self._lengths:
+                    continue
+                counts = Counter(tokenize(text or ""))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = tf
+                length = sum(counts.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                self.max_id = max(self.max_id, chunk_id)
+
+    def remove(self, ids: Sequence[int]):
+        """移除 chunk 與其倒排項目"""
+        with self._lock:
+            removed = {int(chunk_id) for chunk_id in ids} & self._lengths.keys()
+            if not removed:
+                return
+            for chunk_id in removed:
+                self._total_length -= self._lengths.pop(chunk_id)
+            for term in list(self._postings):
+                postings = self._postings[term]
+                for chunk_id in removed & postings.keys():
+                    del postings[chunk_id]
+                if not postings:
+                    del self._postings[term]
+
+    def sync(self, conn, batch_size: int = 5000) -> int:
+        """
+        從 TiDB 載入索引中缺少的 chunk
+        以 id 集合比對而非 id > max_id：TiDB 的 AUTO_INCREMENT 由各節點分段配發，
+        較晚提交的列 id 可能小於已同步的最大 id
+        """
+        added = 0
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM embeddings")
+            with self._lock:
+                indexed = np.fromiter(self._lengths.keys(), dtype=np.int64, count=len(self._lengths))
+            missing = missing_ids([row[0] for row in cursor.fetchall()], indexed)
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size].tolist()
+                placeholders = ','.join(['%s'] * len(batch))
+                cursor.execute(f"SELECT id, chunk FROM embeddings WHERE id IN ({placeholders})", batch)
+                rows = cursor.fetchall()
+                self.add([row[0] for row in rows], [row[1] for row in rows])
+                added += len(rows)
+        finally:
+            cursor.close()
+        self.ready = True
+        return added
+
+    def search(self,
+               query: str,
+               k: int,
+               allow_ids: Optional[Collection[int]] = None) -> List[SearchHit]:
+        """BM25 top-k，回傳 (embeddings.id, 分數)，分數高者在前"""
+        terms = set(tokenize(query))
+        if not terms or k <= 0:
+            return []
+        allowed = None
+        if allow_ids is not None:
+            allowed = allow_ids if isinstance(allow_ids, (set, frozenset)) else set(np.asarray(allow_ids).tolist())
+
+        with self._lock:
+            count = len(self._lengths)
+            if count == 0:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    if allowed is not None and chunk_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if len(scores) > k:
+            ids = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+            values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+            top = np.argpartition(-values, k - 1)[:k]
+            hits = [(int(ids[i]), float(values[i])) for i in top]
+        else:
+            hits = list(scores.items())
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"chunks": len(self._lengths), "terms": len(self._postings), "max_id": self.max_id}
@@ -0,0 +1,218 @@
+"""
+非同步 OpenAI 服務層
+所有 embedding 與 chat completion 請求皆經由此層送出，不阻塞 uvicorn event loop
+
+主要功能：
+1. 以 AsyncOpenAI 發送請求，並限制同時進行的請求數量
+2. 每個模型各自的 token bucket 限流（每分鐘請求數與 token 數）
+3. 逾時控制與帶隨機抖動（full jitter）的指數退避重試
+4. 串流 chat completion：開始輸出前的失敗可重試，輸出期間以逐段逾時偵測停滯
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+from .embedding_batcher import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每個模型預設的限流設定：(每分鐘請求數, 每分鐘 token 數)
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "text-embedding-3-small": (3000, 1_000_000),
+    "gpt-3.5-turbo": (3500, 160_000),
+}
+FALLBACK_RATE_LIMIT = (500, 60_000)
+
+# 可重試的錯誤類型
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+def parse_rate_limits(spec: Optional[str]) -> Dict[str, Tuple[int, int]]:
+    """解析限流設定字串，格式：model=rpm:tpm,model=rpm:tpm"""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    if not spec:
+        return limits
+    for item in spec.split(','):
+        item = item.strip()
+        if not item or '=' not in item:
+            continue
+        model, values = item.split('=', 1)
+        rpm, _, tpm = values.partition(':')
+        try:
+            limits[model.strip()] = (int(rpm), int(tpm or FALLBACK_RATE_LIMIT[1]))
+        except ValueError:
+            logger.warning(f"無法解析限流設定: {item}")
+    return limits
+
+
+class TokenBucket:
+    """Token bucket 限流器"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(rate_per_minute / 60.0, 1.0) * 10
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0):
+        """取得指定數量的 token，不足時等待補充"""
+        # 超過容量的單次請求只要求補滿整個 bucket，避免永遠等待
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AsyncLLMProvider:
+    """具並行上限、限流、逾時與重試的非同步 OpenAI 用戶端"""
+
+    def __init__(self,
+                 api_key: Optional[str],
+                 max_concurrency: int = 8,
+                 timeout: float = 30.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 rate_limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        # 重試由本層處理，關閉 SDK 內建重試以免重複退避
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = rate_limits or dict(DEFAULT_RATE_LIMITS)
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+
+        self.stats = {"requests": 0, "retries": 0, "timeouts": 0, "failures": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["AsyncLLMProvider"]:
+        """依環境變數建立服務層，缺少 API 金鑰時回傳 None"""
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        return cls(
+            api_key=api_key,
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", 8)),
+            timeout=float(os.getenv("OPENAI_TIMEOUT_SECONDS", 30)),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", 3)),
+            rate_limits=parse_rate_limits(os.getenv("OPENAI_RATE_LIMITS")),
+        )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _get_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            rpm, tpm = self.rate_limits.get(model, FALLBACK_RATE_LIMIT)
+            self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm, capacity=tpm))
+        return self._buckets[model]
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full jitter 指數退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _call(self, model: str, token_cost: int, request_fn):
+        """以限流、並行上限、逾時與重試包裝單一 API 請求"""
+        request_bucket, token_bucket = self._get_buckets(model)
+        semaphore = self._get_semaphore()
+
+        for attempt in range(self.max_retries + 1):
+            await request_bucket.acquire(1)
+            await token_bucket.acquire(token_cost)
+            self.stats["requests"] += 1
+            try:
+                async with semaphore:
+                    return await asyncio.wait_for(request_fn(), timeout=self.timeout)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    self.stats["timeouts"] += 1
+                if attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                delay = self._backoff_delay(attempt)
+                self.stats["retries"] += 1
+                logger.warning(f"{model} 請求失敗（{type(e).__name__}），{delay:.2f} 秒後重試 ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """以單一多輸入請求取得 embedding，依輸入順序回傳"""
+        token_cost = sum(estimate_tokens(text) for text in texts)
+        response = await self._call(
+            model, token_cost,
+            lambda: self.client.embeddings.create(input=texts, model=model)
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs: Any) -> str:
+        """取得 chat completion 的回覆文字"""
+        token_cost = sum(estimate_tokens(message["content"]) for message in messages)
+        token_cost += kwargs.get("max_tokens") or 0
+        response = await self._call(
+            model, token_cost,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    async def chat_stream(self, messages: List[Dict[str, str]], model: str, **kwargs: Any) -> AsyncIterator[str]:
+        """
+        串流 chat completion，逐段產生回覆文字
+        建立串流時套用限流與重試；已開始輸出後不重試，兩段之間超過 timeout 視為逾時
+        """
+        token_cost = sum(estimate_tokens(message["content"]) for message in messages)
+        token_cost += kwargs.get("max_tokens") or 0
+        stream = await self._call(
+            model, token_cost,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+        )
+        # 串流期間仍佔用一個並行名額
+        async with self._get_semaphore():
+            iterator = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        self.stats["timeouts"] += 1
+                        self.stats["failures"] += 1
+                        raise
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
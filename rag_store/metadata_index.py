@@ -0,0 +1,292 @@
+"""
+文件中繼資料點陣圖索引
+將分類、標籤、家庭成員、月份與金額區間對應到 embeddings.id 的點陣圖，
+過濾條件以位元運算在記憶體中求出允許清單，再交給本機向量索引評分，
+TiDB 不必為每種過濾組合執行大型 JOIN
+
+點陣圖以遞增、不重複的 int64 id 陣列表示（稀疏點陣圖），AND / OR 分別為
+np.intersect1d / np.union1d；記憶體與運算量只隨符合的 chunk 數成長，
+不受 TiDB AUTO_INCREMENT 在多節點間跳號造成的稀疏 id 影響。
+
+範圍條件（日期、金額）先以完整涵蓋的區間點陣圖取聯集，
+邊界區間再以文件層級的實際值逐一檢查，結果與 SQL 條件一致。
+"""
+
+import bisect
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .mmap_index import missing_ids
+
+logger = logging.getLogger(__name__)
+
+# 金額區間邊界（元），區間 i 為 [EDGES[i-1], EDGES[i])
+AMOUNT_BUCKET_EDGES = (0, 100, 500, 1_000, 2_000, 5_000, 10_000, 20_000, 50_000, 100_000)
+
+TAG_MODES = ("any", "all")
+
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def ids_to_bitmap(ids: Iterable[int]) -> np.ndarray:
+    """將 id 集合轉換為遞增、不重複的 int64 陣列"""
+    if isinstance(ids, np.ndarray):
+        return np.unique(ids.astype(np.int64, copy=False))
+    return np.unique(np.fromiter(ids, dtype=np.int64))
+
+
+def bitmap_or(bitmaps: Iterable[np.ndarray]) -> np.ndarray:
+    """多個點陣圖的聯集；一次合併排序，比逐一 np.union1d 快"""
+    bitmaps = [bitmap for bitmap in bitmaps if len(bitmap)]
+    if not bitmaps:
+        return EMPTY
+    if len(bitmaps) == 1:
+        return bitmaps[0]
+    return np.unique(np.concatenate(bitmaps))
+
+
+def bitmap_and(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    return np.intersect1d(left, right, assume_unique=True)
+
+
+def bitmap_to_ids(bitmap: np.ndarray) -> np.ndarray:
+    """點陣圖即遞增的 int64 id 陣列"""
+    return bitmap
+
+
+def month_bucket(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def amount_bucket(amount: float) -> int:
+    return bisect.bisect_right(AMOUNT_BUCKET_EDGES, amount)
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """接受 date / datetime / 'YYYY-MM-DD' 字串"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+class MetadataBitmapIndex:
+    """以點陣圖求出符合過濾條件的 embeddings.id"""
+
+    def __init__(self):
+        self.max_id = 0  # 已同步的最大 embeddings.id
+        self.ready = False
+        self._lock = threading.RLock()
+        self._all = EMPTY
+        self._categories: Dict[str, np.ndarray] = {}
+        self._tags: Dict[str, np.ndarray] = {}
+        self._members: Dict[str, np.ndarray] = {}
+        self._months: Dict[int, np.ndarray] = {}
+        self._amounts: Dict[int, np.ndarray] = {}
+        # 文件層級資料，用於邊界區間的精確檢查與標籤對應
+        self._document_chunks: Dict[int, np.ndarray] = {}
+        self._document_dates: Dict[int, date] = {}
+        self._document_amounts: Dict[int, float] = {}
+        self._month_documents: Dict[int, Set[int]] = {}
+        self._amount_documents: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    @staticmethod
+    def _merge(bitmaps: Dict[Any, np.ndarray], grouped: Dict[Any, List[int]]):
+        """每個鍵只做一次聯集，避免逐列合併"""
+        for key, ids in grouped.items():
+            bitmaps[key] = bitmap_or([bitmaps.get(key, EMPTY), ids_to_bitmap(ids)])
+
+    def add_chunks(self, rows: Sequence[Tuple[int, int, Optional[str], Optional[str], Any, Any]]):
+        """加入 (embeddings.id, document_id, 分類, 家庭成員, 文件日期, 金額) 列"""
+        chunks: Dict[int, List[int]] = {}
+        categories: Dict[str, List[int]] = {}
+        members: Dict[str, List[int]] = {}
+        months: Dict[int, List[int]] = {}
+        amounts: Dict[int, List[int]] = {}
+        with self._lock:
+            for chunk_id, document_id, category, member, document_date, amount in rows:
+                chunks.setdefault(document_id, []).append(chunk_id)
+                if category:
+                    categories.setdefault(category, []).append(chunk_id)
+                if member:
+                    members.setdefault(member, []).append(chunk_id)
+                document_date = parse_date(document_date)
+                if document_date:
+                    bucket = month_bucket(document_date)
+                    months.setdefault(bucket, []).append(chunk_id)
+                    self._document_dates[document_id] = document_date
+                    self._month_documents.setdefault(bucket, set()).add(document_id)
+                if amount is not None:
+                    amount = float(amount)
+                    bucket = amount_bucket(amount)
+                    amounts.setdefault(bucket, []).append(chunk_id)
+                    self._document_amounts[document_id] = amount
+                    self._amount_documents.setdefault(bucket, set()).add(document_id)
+
+            all_ids = [chunk_id for ids in chunks.values() for chunk_id in ids]
+            if all_ids:
+                self._all = bitmap_or([self._all, ids_to_bitmap(all_ids)])
+                self.max_id = max(self.max_id, max(all_ids))
+            self._merge(self._document_chunks, chunks)
+            self._merge(self._categories, categories)
+            self._merge(self._members, members)
+            self._merge(self._months, months)
+            self._merge(self._amounts, amounts)
+
+    def add_document_tags(self, rows: Sequence[Tuple[int, str]]):
+        """加入 (document_id, 標籤名稱) 列；需在該文件的 chunk 加入後呼叫"""
+        grouped: Dict[str, List[np.ndarray]] = {}
+        with self._lock:
+            for document_id, tag in rows:
+                chunks = self._document_chunks.get(document_id, EMPTY)
+                if len(chunks) and tag:
+                    grouped.setdefault(tag, []).append(chunks)
+            for tag, parts in grouped.items():
+                self._tags[tag] = bitmap_or([self._tags.get(tag, EMPTY), *parts])
+
+    def remove(self, ids: Iterable[int]):
+        """自所有點陣圖移除 chunk；文件層級資料保留，供之後重新加入的 chunk 使用"""
+        removed = ids_to_bitmap(ids)
+        if len(removed) == 0:
+            return
+        with self._lock:
+            self._all = np.setdiff1d(self._all, removed, assume_unique=True)
+            for bitmaps in (self._categories, self._tags, self._members, self._months, self._amounts,
+                            self._document_chunks):
+                for key, bitmap in bitmaps.items():
+                    bitmaps[key] = np.setdiff1d(bitmap, removed, assume_unique=True)
+
+    def sync(self, conn, batch_size: int = 5000) -> int:
+        """
+        從 TiDB 載入索引中缺少的 chunk 與其文件中繼資料
+        以 id 集合比對而非 id > max_id：TiDB 的 AUTO_INCREMENT 由各節點分段配發，
+        較晚提交的列 id 可能小於已同步的最大 id
+        """
+        added = 0
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT e.id FROM embeddings e JOIN documents d ON e.document_id = d.id")
+            with self._lock:
+                indexed = self._all
+            missing = missing_ids([row[0] for row in cursor.fetchall()], indexed)
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size].tolist()
+                placeholders = ','.join(['%s'] * len(batch))
+                cursor.execute(f"""
+                    SELECT e.id, e.document_id, c.name, fm.name, d.document_date, d.extracted_amount
+                    FROM embeddings e
+                    JOIN documents d ON e.document_id = d.id
+                    LEFT JOIN categories c ON d.category_id = c.id
+                    LEFT JOIN family_members fm ON d.family_member_id = fm.id
+                    WHERE e.id IN ({placeholders})
+                """, batch)
+                rows = cursor.fetchall()
+                if not rows:
+                    continue
+                self.add_chunks(rows)
+
+                document_ids = sorted({row[1] for row in rows})
+                placeholders = ','.join(['%s'] * len(document_ids))
+                cursor.execute(f"""
+                    SELECT dt.document_id, t.name
+                    FROM document_tags dt
+                    JOIN tags t ON dt.tag_id = t.id
+                    WHERE dt.document_id IN ({placeholders})
+                """, document_ids)
+                self.add_document_tags(cursor.fetchall())
+                added += len(rows)
+        finally:
+            cursor.close()
+        self.ready = True
+        return added
+
+    def _range(self,
+               bitmaps: Dict[int, np.ndarray],
+               documents: Dict[int, Set[int]],
+               values: Dict[int, Any],
+               low_bucket: Optional[int],
+               high_bucket: Optional[int],
+               matches) -> np.ndarray:
+        """完整涵蓋的區間直接取聯集，邊界區間逐文件檢查實際值"""
+        parts = []
+        for bucket, bitmap in bitmaps.items():
+            if low_bucket is not None and bucket < low_bucket:
+                continue
+            if high_bucket is not None and bucket > high_bucket:
+                continue
+            if bucket == low_bucket or bucket == high_bucket:
+                for document_id in documents.get(bucket, ()):
+                    if matches(values[document_id]):
+                        parts.append(self._document_chunks[document_id])
+            else:
+                parts.append(bitmap)
+        return bitmap_or(parts)
+
+    def allowed(self,
+                category: Optional[str] = None,
+                tags: Optional[List[str]] = None,
+                tag_mode: str = "any",
+                family_member: Optional[str] = None,
+                date_from: Optional[str] = None,
+                date_to: Optional[str] = None,
+                amount_min: Optional[float] = None,
+                amount_max: Optional[float] = None) -> np.ndarray:
+        """回傳符合所有條件的 chunk 點陣圖"""
+        if tag_mode not in TAG_MODES:
+            raise ValueError(f"未知的標籤模式: {tag_mode}")
+        with self._lock:
+            result = self._all
+            if category:
+                result = bitmap_and(result, self._categories.get(category, EMPTY))
+            if family_member:
+                result = bitmap_and(result, self._members.get(family_member, EMPTY))
+            if tags:
+                tag_bitmaps = [self._tags.get(tag, EMPTY) for tag in tags]
+                if tag_mode == "all":
+                    for bitmap in tag_bitmaps:
+                        result = bitmap_and(result, bitmap)
+                else:
+                    result = bitmap_and(result, bitmap_or(tag_bitmaps))
+            low, high = parse_date(date_from), parse_date(date_to)
+            if low or high:
+                result = bitmap_and(result, self._range(
+                    self._months, self._month_documents, self._document_dates,
+                    month_bucket(low) if low else None,
+                    month_bucket(high) if high else None,
+                    lambda value: (not low or value >= low) and (not high or value <= high),
+                ))
+            if amount_min is not None or amount_max is not None:
+                result = bitmap_and(result, self._range(
+                    self._amounts, self._amount_documents, self._document_amounts,
+                    amount_bucket(amount_min) if amount_min is not None else None,
+                    amount_bucket(amount_max) if amount_max is not None else None,
+                    lambda value: ((amount_min is None or value >= amount_min)
+                                   and (amount_max is None or value <= amount_max)),
+                ))
+            return result
+
+    def allowed_ids(self, **filters) -> np.ndarray:
+        """回傳符合條件的 embeddings.id 陣列"""
+        return bitmap_to_ids(self.allowed(**filters))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "chunks": len(self),
+                "max_id": self.max_id,
+                "categories": len(self._categories),
+                "tags": len(self._tags),
+                "family_members": len(self._members),
+                "months": len(self._months),
+            }
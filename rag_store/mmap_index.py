@@ -0,0 +1,311 @@
+"""
+記憶體映射的精確向量搜尋引擎
+適用於數萬個 chunk 的家庭資料量：以 NumPy 批次內積暴力搜尋，省去每次查詢對 TiDB 的網路往返
+
+檔案格式（皆為 append-only）：
+1. vectors.f32：float32 row-major 矩陣，每列 dim 維；預設先 L2 正規化，cosine 即為內積
+2. ids.i64：對應的 embeddings.id（int64）
+3. 列數由兩個檔案的大小推得，因此多個 uvicorn worker 可共用同一份唯讀映射，
+   任一 worker 追加後，其他 worker 在下次查詢時自動看到新資料
+4. deleted.i64：已刪除的 embeddings.id（墓碑，append-only），搜尋時排除
+5. 追加、刪除、重設與載入時的修復皆持有同一個檔案鎖；兩次寫入之間中斷留下的多餘列於載入時截斷
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Collection, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .vector_codec import DTYPE, EMBEDDING_DIM, VectorLike, normalize, to_array, to_matrix
+
+logger = logging.getLogger(__name__)
+
+SearchHit = Tuple[int, float]
+
+
+def id_array(ids: Collection[int]) -> np.ndarray:
+    """將 id 集合轉換為 int64 陣列"""
+    if isinstance(ids, np.ndarray):
+        return ids.astype(np.int64, copy=False)
+    return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+
+def missing_ids(ids: Collection[int], indexed: np.ndarray) -> np.ndarray:
+    """資料庫中存在、索引中缺少的 id（遞增）"""
+    return np.setdiff1d(id_array(ids), indexed)
+
+# 每次矩陣乘法處理的列數上限，限制暫存分數矩陣的大小
+SCAN_BLOCK_ROWS = 65_536
+
+
+class MmapVectorIndex:
+    """以記憶體映射檔案保存向量、以矩陣乘法進行精確 top-k 搜尋的索引"""
+
+    def __init__(self, path: Path, dim: int = EMBEDDING_DIM, normalized: bool = True):
+        self.path = Path(path)
+        self.dim = dim
+        self.normalized = normalized
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.max_id = 0
+        self.dirty = 0
+        self._count = 0
+        self._vectors = np.zeros((0, dim), dtype=DTYPE)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._id_set: Set[int] = set()
+        self._deleted_count = 0
+        self._deleted = np.zeros(0, dtype=np.int64)
+        self._live: Optional[np.ndarray] = None  # 有墓碑時為各列是否有效的遮罩
+        self._lock = threading.RLock()
+
+    @property
+    def vectors_file(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def ids_file(self) -> Path:
+        return self.path / "ids.i64"
+
+    @property
+    def meta_file(self) -> Path:
+        return self.path / "meta.json"
+
+    @property
+    def deleted_file(self) -> Path:
+        return self.path / "deleted.i64"
+
+    @property
+    def lock_file(self) -> Path:
+        return self.path / ".lock"
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self._count
+
+    @contextmanager
+    def _file_lock(self):
+        """跨 worker 的排他檔案鎖（追加、重設與修復檔案時持有）"""
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self) -> bool:
+        """開啟既有檔案，版面設定不符時清除重建，不完整的列截斷"""
+        with self._lock, self._file_lock():
+            if self.meta_file.exists():
+                with open(self.meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("dim") != self.dim or meta.get("normalized") != self.normalized:
+                    logger.warning("mmap 索引版面設定不符，將重新建立")
+                    self._reset_files()
+                else:
+                    self._truncate_partial_rows()
+            else:
+                self._reset_files()
+            self._refresh()
+            return self._count > 0
+
+    def _truncate_partial_rows(self):
+        """
+        向量與 id 分兩次寫入，中途中斷會留下只有向量（或不完整）的列；
+        兩個檔案截斷為較少的完整列數，之後的追加才能維持列對齊
+        """
+        vector_row_bytes = DTYPE.itemsize * self.dim
+        try:
+            vector_size = os.path.getsize(self.vectors_file)
+            id_size = os.path.getsize(self.ids_file)
+        except OSError:
+            # 任一檔案不存在時無法對齊，清除重建
+            self._reset_files()
+            return
+        rows = min(vector_size // vector_row_bytes, id_size // 8)
+        if vector_size != rows * vector_row_bytes or id_size != rows * 8:
+            logger.warning(f"mmap 索引有不完整的列，截斷為 {rows} 列")
+            os.truncate(self.vectors_file, rows * vector_row_bytes)
+            os.truncate(self.ids_file, rows * 8)
+        if self.deleted_file.exists():
+            deleted_size = os.path.getsize(self.deleted_file)
+            if deleted_size % 8:
+                os.truncate(self.deleted_file, deleted_size - deleted_size % 8)
+
+    def _reset_files(self):
+        for file in (self.vectors_file, self.ids_file, self.deleted_file):
+            if file.exists():
+                file.unlink()
+        with open(self.meta_file, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "normalized": self.normalized, "dtype": "float32"}, f)
+        self._count = 0
+        self._vectors = np.zeros((0, self.dim), dtype=DTYPE)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._id_set = set()
+        self._deleted_count = 0
+        self._deleted = np.zeros(0, dtype=np.int64)
+        self._live = None
+        self.max_id = 0
+
+    def _refresh(self):
+        """依檔案大小重新映射，以看到其他 worker 追加或刪除的資料"""
+        with self._lock:
+            try:
+                vector_rows = os.path.getsize(self.vectors_file) // (DTYPE.itemsize * self.dim)
+                id_rows = os.path.getsize(self.ids_file) // 8
+            except OSError:
+                return
+            try:
+                deleted_count = os.path.getsize(self.deleted_file) // 8
+            except OSError:
+                deleted_count = 0
+            count = min(vector_rows, id_rows)
+            if count == self._count and deleted_count == self._deleted_count:
+                return
+            if deleted_count != self._deleted_count:
+                self._deleted = np.unique(np.fromfile(self.deleted_file, dtype=np.int64, count=deleted_count))
+                self._deleted_count = deleted_count
+            if count == 0:
+                self._count = 0
+                self._live = None
+                return
+            if count != self._count:
+                self._vectors = np.memmap(self.vectors_file, dtype=DTYPE, mode='r', shape=(count, self.dim))
+                ids = np.memmap(self.ids_file, dtype=np.int64, mode='r', shape=(count,))
+                new_ids = ids[min(self._count, count):count]
+                self._id_set.update(new_ids.tolist())
+                if len(new_ids):
+                    self.max_id = max(self.max_id, int(new_ids.max()))
+                self._ids = ids
+                self._count = count
+            self._live = ~np.isin(self._ids[:count], self._deleted) if len(self._deleted) else None
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """取得目前的 (向量矩陣, embeddings.id 陣列) 唯讀映射（含已刪除的列）"""
+        self._refresh()
+        with self._lock:
+            return self._vectors[:self._count], self._ids[:self._count]
+
+    def indexed_ids(self) -> np.ndarray:
+        """目前索引中（未被刪除）的 embeddings.id"""
+        self._refresh()
+        with self._lock:
+            ids = np.asarray(self._ids[:self._count])
+            return ids if self._live is None else ids[self._live]
+
+    def live_rows(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        """snapshot() 各列是否未被刪除的遮罩；沒有墓碑時回傳 None"""
+        with self._lock:
+            live = self._live
+        return None if live is None else live[:len(ids)]
+
+    def save(self):
+        """資料於追加時即寫入檔案，此處只需確保落盤"""
+        with self._lock:
+            for file in (self.vectors_file, self.ids_file):
+                if file.exists():
+                    with open(file, "rb+") as f:
+                        os.fsync(f.fileno())
+            self.dirty = 0
+
+    def add(self, ids: Sequence[int], vectors: Sequence[VectorLike]):
+        """追加向量；以檔案鎖序列化多個 worker 的寫入，並略過已存在的 id"""
+        if len(ids) == 0:
+            return
+        matrix = to_matrix(vectors)
+        if self.normalized:
+            matrix = normalize(matrix)
+        labels = np.asarray(ids, dtype=np.int64)
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            keep = np.array([int(i) not in self._id_set for i in labels], dtype=bool)
+            if not keep.any():
+                return
+            # 先寫向量再寫 id，讀取端以較少者為準，不會看到不完整的列
+            with open(self.vectors_file, "ab") as f:
+                f.write(np.ascontiguousarray(matrix[keep], dtype=DTYPE).tobytes())
+            with open(self.ids_file, "ab") as f:
+                f.write(labels[keep].tobytes())
+            self.dirty += int(keep.sum())
+            self._refresh()
+
+    def remove(self, ids: Sequence[int]):
+        """以墓碑標記刪除的 id；向量列保留在檔案中，搜尋時排除"""
+        if len(ids) == 0:
+            return
+        labels = np.asarray(ids, dtype=np.int64)
+        with self._lock, self._file_lock():
+            with open(self.deleted_file, "ab") as f:
+                f.write(labels.tobytes())
+            self._refresh()
+
+    def search(self, vector: VectorLike, k: int, allow_ids: Optional[Collection[int]] = None) -> List[SearchHit]:
+        """查詢單一向量的精確 top-k，回傳 (embeddings.id, cosine 距離)"""
+        return self.search_many([to_array(vector)], k, allow_ids)[0]
+
+    def search_many(self,
+                    vectors: Sequence[VectorLike],
+                    k: int,
+                    allow_ids: Optional[Collection[int]] = None) -> List[List[SearchHit]]:
+        """以單次矩陣乘法查詢多個向量的精確 top-k；allow_ids 限定只評分允許的 id"""
+        self._refresh()
+        with self._lock:
+            count = self._count
+            matrix = self._vectors[:count]
+            ids = self._ids[:count]
+            live = self._live
+        queries = normalize(to_matrix(vectors))
+        selected = None
+        if allow_ids is not None:
+            allowed = np.isin(ids, id_array(allow_ids))
+            selected = np.flatnonzero(allowed if live is None else allowed & live)
+            count = len(selected)
+        elif live is not None:
+            selected = np.flatnonzero(live)
+            count = len(selected)
+        if count == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        k = min(k, count)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=DTYPE)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            if selected is None:
+                rows = np.arange(start, min(start + SCAN_BLOCK_ROWS, count), dtype=np.int64)
+                block = matrix[start:start + SCAN_BLOCK_ROWS]
+            else:
+                # 只讀取允許清單中的列
+                rows = selected[start:start + SCAN_BLOCK_ROWS]
+                block = matrix[rows]
+            scores = queries @ block.T
+            if not self.normalized:
+                norms = np.linalg.norm(block, axis=1)
+                norms[norms == 0] = 1.0
+                scores = scores / norms
+            # 與目前最佳結果合併後再取 top-k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1)
+            top = self._top_k(scores, k)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(int(ids[row]), float(1.0 - score)) for row, score in zip(row_list, score_list)]
+            for row_list, score_list in zip(best_rows, best_scores)
+        ]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """取每列分數最高的 k 個位置（未排序）"""
+        if scores.shape[1] <= k:
+            return np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+        return np.argpartition(-scores, k - 1, axis=1)[:, :k]
@@ -0,0 +1,266 @@
+"""
+常駐 OCR worker 程序池
+上傳處理原本每個檔案以 subprocess 執行 scripts/ocr_extract.py：每次都啟動新的直譯器並冷載入
+unstructured、pytesseract 與 PIL，OCR 開始前就需數秒，擷取的文字還要經由 ocr_txt/*.txt 往返
+
+主要功能：
+1. 常駐程序：worker 啟動時預先載入 OCR 函式庫，之後的檔案直接處理
+2. IPC：檔案路徑經由 pipe 送入閒置的 worker，擷取的文字直接回傳，不寫入文字檔
+3. 回收：每個 worker 處理 max_jobs_per_worker 個檔案後結束並由新程序取代，限制記憶體成長
+4. 逾時與異常：單一檔案超過 timeout 或 worker 異常結束時終止該 worker 並補上新程序，
+   呼叫端收到 OCRError（上傳處理佇列據此重試）
+
+擷取邏輯（unstructured，失敗時圖片改以 Tesseract 辨識）與 scripts/ocr_extract.py 共用
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')
+TESSERACT_LANG = 'chi_tra+eng'
+
+# 確保 Tesseract 在系統 PATH 中，或於 tesseract_text 中指定 pytesseract.pytesseract.tesseract_cmd
+
+
+# --- 擷取邏輯（worker 程序與 scripts/ocr_extract.py 共用） ---
+
+def preload():
+    """載入 OCR 函式庫；各檔案類型的 partition 模組在未安裝對應額外套件時略過"""
+    import pytesseract  # noqa: F401
+    from PIL import Image  # noqa: F401
+    from unstructured.partition.auto import partition  # noqa: F401
+
+    for module in ("unstructured.partition.pdf", "unstructured.partition.image",
+                   "unstructured.partition.docx", "unstructured.partition.text"):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def partition_text(file_path: str) -> str:
+    """以 unstructured 擷取文字，合併所有元素"""
+    from unstructured.partition.auto import partition
+
+    elements = partition(filename=file_path)
+    return "\n\n".join([str(el) for el in elements])
+
+
+def tesseract_text(file_path: str, lang: str = TESSERACT_LANG) -> str:
+    """以 Tesseract 直接辨識圖片"""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
+
+def extract_text(file_path: str) -> str:
+    """擷取檔案文字；unstructured 失敗時，圖片改以 Tesseract 辨識，其他檔案類型拋出原例外"""
+    try:
+        return partition_text(file_path)
+    except Exception as e:
+        if not file_path.lower().endswith(IMAGE_EXTENSIONS):
+            raise
+        logger.warning(f"unstructured 擷取失敗，改以 Tesseract 辨識 {file_path}: {e}")
+        return tesseract_text(file_path)
+
+
+# --- worker 程序 ---
+
+def _worker_main(conn: Connection, max_jobs: int):
+    """worker 程序：預先載入函式庫後回報就緒，逐一處理檔案，達到上限後結束"""
+    try:
+        preload()
+        conn.send(("ready", None))
+    except Exception as e:
+        # 仍可處理請求；擷取時會以相同錯誤失敗
+        conn.send(("ready", f"{type(e).__name__}: {e}"))
+
+    for _ in range(max_jobs):
+        try:
+            file_path = conn.recv()
+        except (EOFError, OSError):
+            return
+        if file_path is None:
+            return
+        try:
+            conn.send(("ok", extract_text(file_path)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class OCRError(RuntimeError):
+    """OCR 擷取失敗、逾時或 worker 異常結束"""
+
+
+class _Worker:
+    """單一 worker 程序與其 pipe"""
+
+    def __init__(self, context, max_jobs: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, max_jobs), name="ocr-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.max_jobs = max_jobs
+        self.jobs = 0
+        self.ready = False
+        self.broken = False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.jobs >= self.max_jobs
+
+    def _receive(self, timeout: float) -> tuple:
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"OCR 逾時（{timeout:.0f} 秒）")
+        return self.conn.recv()
+
+    def wait_ready(self, timeout: float):
+        if self.ready:
+            return
+        _, error = self._receive(timeout)
+        if error:
+            logger.warning(f"OCR worker {self.process.pid} 預先載入失敗: {error}")
+        self.ready = True
+
+    def extract(self, file_path: str, timeout: float) -> str:
+        """送出檔案並等待文字（阻塞，於執行緒中呼叫）"""
+        try:
+            self.wait_ready(timeout)
+            self.conn.send(file_path)
+            self.jobs += 1
+            status, value = self._receive(timeout)
+        except (TimeoutError, EOFError, OSError) as e:
+            self.broken = True
+            # worker 異常結束時 EOFError 沒有訊息
+            raise OCRError(f"OCR worker {self.process.pid} 失敗: {str(e) or type(e).__name__}") from e
+        if status != "ok":
+            raise OCRError(value)
+        return value
+
+    def stop(self, timeout: float = 5.0):
+        """正常結束（已達上限者會自行結束）；未在時限內結束或已故障時強制終止"""
+        if not self.broken and not self.exhausted:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(0 if self.broken else timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class OCRWorkerPool:
+    """常駐 OCR worker 程序池；extract() 取得閒置的 worker 處理檔案"""
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_jobs_per_worker: int = 50,
+                 timeout: float = 300.0,
+                 start_method: str = "spawn"):
+        self.size = max(1, workers)
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+        self.timeout = timeout
+        # 預設 spawn：不複製 API 程序的執行緒與資料庫連線
+        self._context = multiprocessing.get_context(start_method)
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.jobs = 0
+        self.failures = 0
+        self.recycled = 0
+        self.replaced = 0
+        self.total_seconds = 0.0
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.max_jobs_per_worker)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop()
+
+    async def start(self):
+        """啟動 worker 程序；預先載入於各程序中同時進行，不等待完成"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(await asyncio.to_thread(self._spawn))
+
+    async def extract(self, file_path: Union[str, Path]) -> str:
+        """擷取檔案文字；失敗時拋出 OCRError"""
+        if self._closed:
+            raise OCRError("OCR worker pool 已關閉")
+        if self._idle is None:
+            await self.start()
+        worker = await self._idle.get()
+        started = time.perf_counter()
+        try:
+            text = await asyncio.to_thread(worker.extract, str(file_path), self.timeout)
+        except OCRError:
+            self.failures += 1
+            raise
+        except asyncio.CancelledError:
+            # 執行緒仍在等待此 worker，終止後由新程序取代
+            worker.broken = True
+            raise
+        finally:
+            self.jobs += 1
+            self.total_seconds += time.perf_counter() - started
+            await self._release(worker)
+        return text
+
+    async def _release(self, worker: _Worker):
+        """worker 歸還閒置佇列；已達上限或故障者以新程序取代"""
+        if self._closed:
+            await asyncio.to_thread(self._retire, worker)
+            return
+        if not worker.broken and not worker.exhausted:
+            self._idle.put_nowait(worker)
+            return
+        if worker.broken:
+            self.replaced += 1
+            logger.warning(f"OCR worker {worker.process.pid} 故障，以新程序取代")
+        else:
+            self.recycled += 1
+        await asyncio.to_thread(self._retire, worker)
+        self._idle.put_nowait(await asyncio.to_thread(self._spawn))
+
+    async def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            await asyncio.to_thread(self._retire, worker)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            alive = sum(1 for worker in self._workers if worker.process.is_alive())
+        return {
+            "workers": self.size,
+            "alive": alive,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "max_jobs_per_worker": self.max_jobs_per_worker,
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "recycled": self.recycled,
+            "replaced": self.replaced,
+            "avg_seconds": self.total_seconds / self.jobs if self.jobs else 0.0,
+        }
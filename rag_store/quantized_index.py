@@ -0,0 +1,375 @@
+"""
+量化向量索引：壓縮碼候選搜尋 + 全精度重新評分
+1536 維 float32 向量每個 chunk 佔 6 KB；候選階段改掃描記憶體中的壓縮碼，
+只對前 N 名候選讀取記憶體映射檔中的全精度向量重新排序
+
+支援的量化方式：
+1. int8 純量量化（每維 1 byte，約 4 倍壓縮）
+2. 乘積量化 PQ（每個子空間 1 byte，預設 384 個子空間，約 16 倍壓縮）
+
+全精度向量保存在 MmapVectorIndex 中，為唯一的向量來源；壓縮碼可隨時由其重建。
+量化器於背景執行緒訓練（PQ 的 k-means 需數秒至數十秒），訓練完成前以全精度向量精確搜尋。
+
+注意：量化的目的是降低常駐記憶體，而非加速。資料可完整放入記憶體時，NumPy 對 mmap
+全精度向量的暴力掃描通常比「壓縮碼評分 + 重新評分」更快（見 scripts/bench_quantization.py）。
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .mmap_index import MmapVectorIndex, SearchHit, id_array
+from .vector_codec import DTYPE, VectorLike, normalize, to_array, to_matrix
+
+logger = logging.getLogger(__name__)
+
+# 訓練量化器時使用的最大樣本數
+TRAIN_SAMPLE_SIZE = 20_000
+
+# 候選階段每次評分的列數，避免一次還原整個碼矩陣
+SCORE_BLOCK_ROWS = 8192
+
+
+class ScalarQuantizer:
+    """每維 min/max 的 int8 純量量化"""
+
+    method = "int8"
+
+    def __init__(self):
+        self.mins: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.mins is not None
+
+    def fit(self, matrix: np.ndarray):
+        self.mins = matrix.min(axis=0).astype(DTYPE)
+        spans = matrix.max(axis=0) - self.mins
+        spans[spans == 0] = 1.0
+        self.scales = (spans / 255.0).astype(DTYPE)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        codes = np.rint((matrix - self.mins) / self.scales)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def code_size(self, dim: int) -> int:
+        return dim
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """非對稱內積：query 保持 float，碼在乘法中還原（q·x ≈ codes·(q*scale) + q·min）"""
+        weighted = (queries * self.scales).astype(DTYPE)
+        offsets = queries @ self.mins
+        return codes.astype(DTYPE) @ weighted.T + offsets
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"mins": self.mins, "scales": self.scales}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.mins = state["mins"].astype(DTYPE)
+        self.scales = state["scales"].astype(DTYPE)
+
+
+class ProductQuantizer:
+    """乘積量化：每個子空間以 k-means 學出 256 個中心點，向量以中心點編號表示"""
+
+    method = "pq"
+
+    def __init__(self, subspaces: int = 384, centroids: int = 256, iterations: int = 10, seed: int = 42):
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (subspaces, centroids, sub_dim)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        """(n, dim) → (subspaces, n, sub_dim)"""
+        n, dim = matrix.shape
+        if dim % self.subspaces:
+            raise ValueError(f"維度 {dim} 無法被子空間數 {self.subspaces} 整除")
+        return np.ascontiguousarray(matrix.reshape(n, self.subspaces, dim // self.subspaces).transpose(1, 0, 2))
+
+    def _assign(self, parts: np.ndarray) -> np.ndarray:
+        """批次計算每個子空間最近的中心點，回傳 (subspaces, n)"""
+        # ||x - c||² = ||x||² - 2x·c + ||c||²，||x||² 不影響 argmin；
+        # 逐子空間計算，暫存矩陣只需 (n, centroids)
+        centroid_norms = np.sum(self.codebooks ** 2, axis=2)
+        assignments = np.empty(parts.shape[:2], dtype=np.int64)
+        for s in range(self.subspaces):
+            distances = parts[s] @ self.codebooks[s].T
+            distances *= -2
+            distances += centroid_norms[s]
+            assignments[s] = np.argmin(distances, axis=1)
+        return assignments
+
+    def fit(self, matrix: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        parts = self._split(matrix.astype(DTYPE))
+        n = parts.shape[1]
+        k = min(self.centroids, n)
+        init = rng.choice(n, size=k, replace=False)
+        self.codebooks = np.ascontiguousarray(parts[:, init, :])
+
+        for _ in range(self.iterations):
+            assignments = self._assign(parts)
+            for s in range(self.subspaces):
+                counts = np.bincount(assignments[s], minlength=k)
+                # 以 one-hot 矩陣乘法加總各群集，比 np.add.at 快一個數量級
+                one_hot = np.zeros((n, k), dtype=DTYPE)
+                one_hot[np.arange(n), assignments[s]] = 1.0
+                sums = one_hot.T @ parts[s]
+                filled = counts > 0
+                self.codebooks[s][filled] = sums[filled] / counts[filled, None]
+                # 空群集以隨機樣本重新初始化
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    self.codebooks[s][empty] = parts[s][rng.choice(n, size=len(empty))]
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return self._assign(self._split(matrix.astype(DTYPE))).T.astype(np.uint8)
+
+    def code_size(self, dim: int) -> int:
+        return self.subspaces
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """非對稱距離計算（ADC）：先算每個子空間的 query·中心點查表，再依碼加總"""
+        query_parts = self._split(queries)  # (subspaces, q, sub_dim)
+        tables = np.matmul(query_parts, self.codebooks.transpose(0, 2, 1))  # (subspaces, q, centroids)
+        result = np.zeros((len(codes), len(queries)), dtype=DTYPE)
+        for s in range(self.subspaces):
+            result += tables[s][:, codes[:, s]].T
+        return result
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.codebooks = state["codebooks"].astype(DTYPE)
+        self.subspaces, self.centroids = self.codebooks.shape[:2]
+
+
+def create_quantizer(method: str, pq_subspaces: int = 384):
+    """依名稱建立量化器"""
+    if method == "int8":
+        return ScalarQuantizer()
+    if method == "pq":
+        return ProductQuantizer(subspaces=pq_subspaces)
+    raise ValueError(f"未知的量化方式: {method}")
+
+
+class QuantizedVectorIndex:
+    """壓縮碼候選 + 全精度重新評分的向量索引"""
+
+    def __init__(self,
+                 full_precision: MmapVectorIndex,
+                 path: Path,
+                 method: str = "int8",
+                 rescore_factor: int = 8,
+                 min_train_size: int = 1000,
+                 pq_subspaces: int = 384):
+        if not full_precision.normalized:
+            raise ValueError("量化索引需要正規化的全精度向量")
+        self.full_precision = full_precision
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.method = method
+        self.rescore_factor = rescore_factor
+        self.min_train_size = min_train_size
+        self.pq_subspaces = pq_subspaces
+
+        self.quantizer = create_quantizer(method, pq_subspaces)
+        self.dim = full_precision.dim
+        self.dirty = 0
+        self._codes = np.zeros((0, self.quantizer.code_size(self.dim)), dtype=np.uint8)
+        self._lock = threading.RLock()
+        self._training: Optional[threading.Thread] = None
+
+    @property
+    def quantizer_file(self) -> Path:
+        return self.path / f"{self.method}_quantizer.npz"
+
+    @property
+    def codes_file(self) -> Path:
+        return self.path / f"{self.method}_codes.npy"
+
+    @property
+    def max_id(self) -> int:
+        return self.full_precision.max_id
+
+    def __len__(self) -> int:
+        return len(self.full_precision)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """壓縮碼與全精度向量的大小比較"""
+        count = len(self)
+        return {
+            "codes_bytes": int(self._codes.nbytes),
+            "full_precision_bytes": count * self.dim * DTYPE.itemsize,
+        }
+
+    def load(self) -> bool:
+        """載入全精度向量、量化器與壓縮碼，並補齊尚未編碼的列"""
+        loaded = self.full_precision.load()
+        with self._lock:
+            if self.quantizer_file.exists():
+                with np.load(self.quantizer_file) as state:
+                    self.quantizer.load_state(dict(state))
+                if self.codes_file.exists():
+                    codes = np.load(self.codes_file)
+                    if codes.shape[1] == self._codes.shape[1] and len(codes) <= len(self.full_precision):
+                        self._codes = codes
+            self._sync_codes()
+        return loaded
+
+    def save(self):
+        self.full_precision.save()
+        with self._lock:
+            if self.quantizer.trained:
+                np.savez(self.quantizer_file, **self.quantizer.state())
+                np.save(self.codes_file, self._codes)
+            self.dirty = 0
+
+    @property
+    def training(self) -> bool:
+        return self._training is not None and self._training.is_alive()
+
+    def train(self):
+        """以既有全精度向量的樣本訓練新的量化器並重新編碼全部資料
+
+        訓練與編碼不持有鎖，期間搜尋照常進行；完成後才替換量化器與壓縮碼
+        """
+        vectors, _ = self.full_precision.snapshot()
+        count = len(vectors)
+        if count == 0:
+            return
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(count, size=min(count, TRAIN_SAMPLE_SIZE), replace=False))
+        sample = np.asarray(vectors[rows], dtype=DTYPE)
+        quantizer = create_quantizer(self.method, self.pq_subspaces)
+        quantizer.fit(sample)
+        codes = np.concatenate([
+            quantizer.encode(np.asarray(vectors[start:start + SCORE_BLOCK_ROWS], dtype=DTYPE))
+            for start in range(0, count, SCORE_BLOCK_ROWS)
+        ])
+        with self._lock:
+            self.quantizer = quantizer
+            self._codes = codes
+            # 補上訓練期間追加的列
+            self._sync_codes()
+        logger.info(f"{self.method} 量化器訓練完成（{len(sample)} 個樣本、{count} 個向量）")
+
+    def _run_training(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error(f"{self.method} 量化器訓練失敗: {e}")
+
+    def _start_training(self):
+        """於背景執行緒訓練量化器；已在訓練中則略過"""
+        with self._lock:
+            if self.training:
+                return
+            self._training = threading.Thread(
+                target=self._run_training, name=f"{self.method}-quantizer-train", daemon=True
+            )
+            self._training.start()
+
+    def wait_trained(self, timeout: Optional[float] = None) -> bool:
+        """等待背景訓練結束，回傳量化器是否已訓練"""
+        thread = self._training
+        if thread is not None:
+            thread.join(timeout)
+        return self.quantizer.trained
+
+    def _sync_codes(self):
+        """編碼其他 worker 或本程序新追加、尚未有壓縮碼的列；資料量足夠時啟動背景訓練"""
+        with self._lock:
+            vectors, _ = self.full_precision.snapshot()
+            count = len(vectors)
+            if not self.quantizer.trained:
+                if count >= self.min_train_size:
+                    self._start_training()
+                return
+            if len(self._codes) >= count:
+                return
+            new_rows = np.asarray(vectors[len(self._codes):count], dtype=DTYPE)
+            self._codes = np.concatenate([self._codes, self.quantizer.encode(new_rows)])
+
+    def add(self, ids: Sequence[int], vectors: Sequence[VectorLike]):
+        before = len(self.full_precision)
+        self.full_precision.add(ids, vectors)
+        self._sync_codes()
+        self.dirty += len(self.full_precision) - before
+
+    def indexed_ids(self) -> np.ndarray:
+        return self.full_precision.indexed_ids()
+
+    def remove(self, ids: Sequence[int]):
+        """刪除由全精度索引的墓碑處理；壓縮碼維持與列對齊"""
+        self.full_precision.remove(ids)
+
+    def search(self, vector: VectorLike, k: int, allow_ids: Optional[Collection[int]] = None) -> List[SearchHit]:
+        return self.search_many([to_array(vector)], k, allow_ids)[0]
+
+    def search_many(self,
+                    vectors: Sequence[VectorLike],
+                    k: int,
+                    allow_ids: Optional[Collection[int]] = None) -> List[List[SearchHit]]:
+        """候選階段掃描壓縮碼，重新評分階段以全精度向量排序前 N 名"""
+        self._sync_codes()
+        with self._lock:
+            quantizer = self.quantizer
+            codes = self._codes
+        if not quantizer.trained or len(codes) == 0:
+            # 資料量不足或量化器仍在背景訓練時直接精確搜尋
+            return self.full_precision.search_many(vectors, k, allow_ids)
+
+        queries = normalize(to_matrix(vectors))
+        full_vectors, ids = self.full_precision.snapshot()
+        codes = codes[:len(ids)]
+        rows = np.arange(len(codes))
+        live = self.full_precision.live_rows(ids[:len(codes)])
+        if allow_ids is not None or live is not None:
+            # 只評分允許清單中、未被刪除的列
+            selected = np.ones(len(codes), dtype=bool) if live is None else live
+            if allow_ids is not None:
+                selected = selected & np.isin(ids[:len(codes)], id_array(allow_ids))
+            rows = np.flatnonzero(selected)
+            codes = codes[rows]
+            if len(rows) == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+        approx = np.concatenate([
+            quantizer.scores(queries, codes[start:start + SCORE_BLOCK_ROWS])
+            for start in range(0, len(codes), SCORE_BLOCK_ROWS)
+        ])  # (n, q)
+        candidates_n = min(len(codes), max(k, k * self.rescore_factor))
+
+        results = []
+        for qi, query in enumerate(queries):
+            column = approx[:, qi]
+            if candidates_n < len(column):
+                candidates = np.argpartition(-column, candidates_n - 1)[:candidates_n]
+            else:
+                candidates = np.arange(len(column))
+            # 只讀取候選列的全精度向量
+            candidates = np.sort(rows[candidates])
+            exact = np.asarray(full_vectors[candidates], dtype=DTYPE) @ query
+            order = np.argsort(-exact)[:k]
+            results.append([(int(ids[candidates[i]]), float(1.0 - exact[i])) for i in order])
+        return results
+
+
+def evaluate_recall(index, exact_index, queries: np.ndarray, k: int = 10) -> float:
+    """以精確搜尋為基準計算 recall@k"""
+    approx = index.search_many(queries, k)
+    exact = exact_index.search_many(queries, k)
+    hits = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approx, exact))
+    total = sum(len(e) for e in exact)
+    return hits / total if total else 0.0
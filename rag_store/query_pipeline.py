@@ -0,0 +1,106 @@
+"""
+非同步查詢階段圖
+查詢流程拆為具名階段並宣告相依關係，彼此獨立的階段（查詢向量、資料庫連線、
+過濾候選、詞彙搜尋、統計查詢）同時執行，端到端延遲接近最慢的階段而非各階段總和
+
+主要功能：
+1. 階段宣告：名稱、執行函式、相依階段；阻塞式函式（資料庫查詢）於執行緒中執行
+2. 各階段在相依階段完成後立即開始，任一階段失敗時取消其餘階段
+3. 記錄各階段相對於起點的開始時間與耗時（毫秒）
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+StageResults = Dict[str, Any]
+StageFn = Callable[[StageResults], Any]
+Timings = Dict[str, Dict[str, float]]
+
+
+def stage_timing(origin: float, begin: float, end: Optional[float] = None) -> Dict[str, float]:
+    """以 perf_counter 時間點計算相對於 origin 的開始時間與耗時（毫秒）"""
+    end = time.perf_counter() if end is None else end
+    return {"start_ms": round((begin - origin) * 1000, 2), "duration_ms": round((end - begin) * 1000, 2)}
+
+
+class _Stage:
+    __slots__ = ("name", "fn", "after", "blocking")
+
+    def __init__(self, name: str, fn: StageFn, after: Sequence[str], blocking: bool):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.blocking = blocking
+
+
+class StageGraph:
+    """以相依關係排程的非同步階段集合"""
+
+    def __init__(self):
+        self._stages: Dict[str, _Stage] = {}
+
+    def add(self,
+            name: str,
+            fn: StageFn,
+            after: Sequence[str] = (),
+            blocking: bool = False) -> "StageGraph":
+        """
+        加入階段；fn 接收已完成階段的結果字典，可為協程函式或一般函式
+        blocking 為 True 時以 asyncio.to_thread 執行，不阻塞 event loop
+        """
+        if name in self._stages:
+            raise ValueError(f"重複的階段名稱: {name}")
+        missing = [dependency for dependency in after if dependency not in self._stages]
+        if missing:
+            # 相依階段必須先加入，確保圖中沒有循環
+            raise ValueError(f"階段 {name} 的相依階段尚未定義: {', '.join(missing)}")
+        self._stages[name] = _Stage(name, fn, after, blocking)
+        return self
+
+    async def run(self, initial: Optional[StageResults] = None) -> Tuple[StageResults, Timings]:
+        """執行所有階段，回傳 (各階段結果, 各階段計時)；initial 為預先提供的結果"""
+        results: StageResults = dict(initial or {})
+        timings: Timings = {}
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(stage: _Stage):
+            if stage.after:
+                await asyncio.gather(*(tasks[dependency] for dependency in stage.after))
+            begin = time.perf_counter()
+            if stage.blocking:
+                value = await asyncio.to_thread(stage.fn, results)
+            else:
+                value = stage.fn(results)
+                if asyncio.iscoroutine(value):
+                    value = await value
+            results[stage.name] = value
+            timings[stage.name] = stage_timing(started, begin)
+
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(execute(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        timings["total"] = stage_timing(started, started)
+        return results, timings
+
+
+async def gather_stages(stages: Dict[str, StageFn], blocking: bool = True) -> Tuple[StageResults, Timings]:
+    """同時執行互不相依的階段"""
+    graph = StageGraph()
+    for name, fn in stages.items():
+        graph.add(name, fn, blocking=blocking)
+    return await graph.run()
+
+
+def merge_timings(target: Optional[Timings], timings: Timings, prefix: str = ""):
+    """將計時併入呼叫端提供的字典（未提供時略過）"""
+    if target is None:
+        return
+    for name, value in timings.items():
+        target[f"{prefix}{name}"] = value
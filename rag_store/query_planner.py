@@ -0,0 +1,290 @@
+"""
+過濾向量搜尋的查詢計畫
+預先過濾或事後過濾何者較快取決於過濾條件的選擇性：
+單一家庭成員某年度的報稅文件應先求出允許清單再精確評分，
+「帳單」這類涵蓋大量文件的分類則應先走向量索引、再由資料庫過濾
+
+主要功能：
+1. 點陣圖索引可用時以允許清單的實際數量決定計畫（精確）
+2. 否則以 TiDB 彙總的分類 / 標籤 / 家庭成員 / 月份 chunk 數量，在獨立性假設下估計符合數量；
+   統計隨語料世代更新
+3. 三種計畫：prefilter（允許清單內評分）、postfilter（依選擇性調整超量取回倍數）、
+   metadata_scan（符合數量很少或沒有本機索引時，交由 TiDB 過濾並計算距離）
+4. 每次決策寫入 log，並累計各計畫的使用次數
+"""
+
+import logging
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from .corpus_version import CorpusVersion
+from .metadata_index import MetadataBitmapIndex, bitmap_to_ids, month_bucket, parse_date
+
+logger = logging.getLogger(__name__)
+
+PLAN_PREFILTER = "prefilter"
+PLAN_POSTFILTER = "postfilter"
+PLAN_METADATA_SCAN = "metadata_scan"
+
+# 金額條件沒有分布統計時採用的預設選擇性（單邊 / 雙邊）
+DEFAULT_AMOUNT_SELECTIVITY = 0.5
+DEFAULT_AMOUNT_RANGE_SELECTIVITY = 0.25
+
+
+class QueryPlan:
+    """單次查詢的過濾策略"""
+
+    def __init__(self,
+                 strategy: str,
+                 candidate_k: int,
+                 estimated_matches: float,
+                 total: int,
+                 exact: bool,
+                 reason: str,
+                 allowed_ids: Optional[Any] = None):
+        self.strategy = strategy
+        self.candidate_k = candidate_k
+        self.estimated_matches = estimated_matches
+        self.total = total
+        self.exact = exact
+        self.reason = reason
+        self.allowed_ids = allowed_ids
+
+    @property
+    def selectivity(self) -> float:
+        return self.estimated_matches / self.total if self.total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "candidate_k": self.candidate_k,
+            "estimated_matches": round(self.estimated_matches, 1),
+            "selectivity": round(self.selectivity, 6),
+            "exact": self.exact,
+            "reason": self.reason,
+        }
+
+
+class CardinalityStats:
+    """各過濾維度的 chunk 數量"""
+
+    def __init__(self,
+                 total: int = 0,
+                 categories: Optional[Dict[str, int]] = None,
+                 tags: Optional[Dict[str, int]] = None,
+                 members: Optional[Dict[str, int]] = None,
+                 months: Optional[Dict[int, int]] = None):
+        self.total = total
+        self.categories = categories or {}
+        self.tags = tags or {}
+        self.members = members or {}
+        self.months = months or {}
+
+    @classmethod
+    def from_database(cls, conn, tag_filter: bool = True) -> "CardinalityStats":
+        """以 GROUP BY 彙總各維度的 chunk 數量"""
+        cursor = conn.cursor()
+        try:
+            base = """
+                FROM embeddings e
+                JOIN documents d ON e.document_id = d.id
+            """
+            cursor.execute(f"SELECT COUNT(*) {base}")
+            total = int(cursor.fetchone()[0] or 0)
+            cursor.execute(f"""
+                SELECT c.name, COUNT(*) {base}
+                JOIN categories c ON d.category_id = c.id
+                GROUP BY c.name
+            """)
+            categories = {name: int(count) for name, count in cursor.fetchall()}
+            cursor.execute(f"""
+                SELECT fm.name, COUNT(*) {base}
+                JOIN family_members fm ON d.family_member_id = fm.id
+                GROUP BY fm.name
+            """)
+            members = {name: int(count) for name, count in cursor.fetchall()}
+            cursor.execute(f"""
+                SELECT YEAR(d.document_date) * 12 + MONTH(d.document_date) - 1 AS bucket, COUNT(*) {base}
+                WHERE d.document_date IS NOT NULL
+                GROUP BY bucket
+            """)
+            months = {int(bucket): int(count) for bucket, count in cursor.fetchall()}
+            tags: Dict[str, int] = {}
+            if tag_filter:
+                cursor.execute(f"""
+                    SELECT t.name, COUNT(*) {base}
+                    JOIN document_tags dt ON dt.document_id = d.id
+                    JOIN tags t ON dt.tag_id = t.id
+                    GROUP BY t.name
+                """)
+                tags = {name: int(count) for name, count in cursor.fetchall()}
+        finally:
+            cursor.close()
+        return cls(total, categories, tags, members, months)
+
+    def estimate(self,
+                 category: Optional[str] = None,
+                 tags: Optional[List[str]] = None,
+                 tag_mode: str = "any",
+                 family_member: Optional[str] = None,
+                 date_from: Optional[str] = None,
+                 date_to: Optional[str] = None,
+                 amount_min: Optional[float] = None,
+                 amount_max: Optional[float] = None) -> float:
+        """在各條件互相獨立的假設下估計符合的 chunk 數"""
+        if self.total == 0:
+            return 0.0
+        selectivity = 1.0
+        if category:
+            selectivity *= self.categories.get(category, 0) / self.total
+        if family_member:
+            selectivity *= self.members.get(family_member, 0) / self.total
+        if tags:
+            fractions = [self.tags.get(tag, 0) / self.total for tag in tags]
+            if tag_mode == "all":
+                selectivity *= math.prod(fractions)
+            else:
+                selectivity *= min(1.0, sum(fractions))
+        low, high = parse_date(date_from), parse_date(date_to)
+        if low or high:
+            # 邊界月份整月計入，估計值偏高
+            low_bucket = month_bucket(low) if low else None
+            high_bucket = month_bucket(high) if high else None
+            in_range = sum(
+                count for bucket, count in self.months.items()
+                if (low_bucket is None or bucket >= low_bucket) and (high_bucket is None or bucket <= high_bucket)
+            )
+            selectivity *= in_range / self.total
+        if amount_min is not None and amount_max is not None:
+            selectivity *= DEFAULT_AMOUNT_RANGE_SELECTIVITY
+        elif amount_min is not None or amount_max is not None:
+            selectivity *= DEFAULT_AMOUNT_SELECTIVITY
+        return self.total * selectivity
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "categories": len(self.categories),
+            "tags": len(self.tags),
+            "family_members": len(self.members),
+            "months": len(self.months),
+        }
+
+
+class QueryPlanner:
+    """依過濾條件的選擇性選擇 prefilter、postfilter 或 metadata_scan"""
+
+    def __init__(self,
+                 metadata_index: Optional[MetadataBitmapIndex],
+                 version: CorpusVersion,
+                 connection_factory: Callable[[], Any],
+                 prefilter_max_matches: int = 5000,
+                 prefilter_max_selectivity: float = 0.2,
+                 scan_max_matches: int = 200,
+                 overfetch_safety: float = 2.0,
+                 max_overfetch: int = 50,
+                 default_overfetch: int = 10):
+        self.metadata_index = metadata_index
+        self.version = version
+        self.connection_factory = connection_factory
+        self.prefilter_max_matches = prefilter_max_matches
+        self.prefilter_max_selectivity = prefilter_max_selectivity
+        self.scan_max_matches = scan_max_matches
+        self.overfetch_safety = overfetch_safety
+        self.max_overfetch = max_overfetch
+        self.default_overfetch = default_overfetch
+
+        self._stats: Optional[CardinalityStats] = None
+        self._stats_generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.decisions: Dict[str, int] = {PLAN_PREFILTER: 0, PLAN_POSTFILTER: 0, PLAN_METADATA_SCAN: 0}
+
+    def statistics(self, tag_filter: bool = True) -> Optional[CardinalityStats]:
+        """取得目前語料世代的基數統計；查詢失敗時回傳 None（下次重試）"""
+        generation = self.version.current()
+        with self._lock:
+            if self._stats is not None and self._stats_generation == generation:
+                return self._stats
+        conn = self.connection_factory()
+        if not conn:
+            return None
+        try:
+            stats = CardinalityStats.from_database(conn, tag_filter=tag_filter)
+        except Exception as e:
+            logger.warning(f"基數統計失敗: {e}")
+            return None
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats = stats
+            self._stats_generation = generation
+        return stats
+
+    def _postfilter_k(self, limit: int, selectivity: Optional[float]) -> int:
+        """選擇性越低需取回越多候選，才能在過濾後仍有 limit 筆"""
+        if not selectivity:
+            return limit * self.default_overfetch
+        k = math.ceil(limit / selectivity * self.overfetch_safety)
+        return max(limit, min(k, limit * self.max_overfetch))
+
+    def plan(self,
+             limit: int,
+             has_local_index: bool,
+             tag_filter: bool = True,
+             **filters) -> QueryPlan:
+        """
+        filters 與 MetadataBitmapIndex.allowed 的參數相同
+        has_local_index 為 False 時只能交由 TiDB 過濾並計算距離
+        """
+        index = self.metadata_index
+        if not has_local_index:
+            # 沒有本機索引可評分，不需要估計
+            return self._record(QueryPlan(PLAN_METADATA_SCAN, limit, 0, 0, False, "本機索引不可用"))
+        try:
+            if index is not None and index.ready:
+                bitmap = index.allowed(**filters)
+                matches, total, exact = len(bitmap), len(index), True
+            else:
+                bitmap = None
+                stats = self.statistics(tag_filter=tag_filter)
+                matches = stats.estimate(**filters) if stats else None
+                total, exact = (stats.total if stats else 0), False
+        except ValueError as e:
+            # 無法解析的日期條件（API 已驗證，其他呼叫端仍可能傳入）：交由 TiDB 比對
+            return self._record(QueryPlan(PLAN_METADATA_SCAN, limit, 0, 0, False, f"無法解析過濾條件（{e}）"))
+
+        selectivity = matches / total if matches is not None and total else None
+        if exact and matches <= self.prefilter_max_matches:
+            plan = QueryPlan(PLAN_PREFILTER, limit, matches, total, exact,
+                             f"符合 {matches} 筆，不超過 {self.prefilter_max_matches}",
+                             allowed_ids=bitmap_to_ids(bitmap))
+        elif exact and selectivity <= self.prefilter_max_selectivity:
+            plan = QueryPlan(PLAN_PREFILTER, limit, matches, total, exact,
+                             f"選擇性 {selectivity:.3f} 不超過 {self.prefilter_max_selectivity}",
+                             allowed_ids=bitmap_to_ids(bitmap))
+        elif not exact and matches is not None and matches <= self.scan_max_matches:
+            # 詞彙搜尋無法交由 TiDB 評分，仍以事後過濾的候選數取回
+            plan = QueryPlan(PLAN_METADATA_SCAN, self._postfilter_k(limit, selectivity), matches, total, exact,
+                             f"估計符合 {matches:.0f} 筆，由 TiDB 直接過濾")
+        else:
+            k = self._postfilter_k(limit, selectivity)
+            reason = (f"選擇性 {selectivity:.3f}，超量取回 {k} 筆" if selectivity
+                      else f"無基數統計，採預設超量取回 {k} 筆")
+            plan = QueryPlan(PLAN_POSTFILTER, k, matches or 0, total, exact, reason)
+        return self._record(plan)
+
+    def _record(self, plan: QueryPlan) -> QueryPlan:
+        with self._lock:
+            self.decisions[plan.strategy] += 1
+        logger.info(f"查詢計畫 {plan.strategy}: {plan.reason}"
+                    f"（{'實際' if plan.exact else '估計'}符合 {plan.estimated_matches:.0f} / {plan.total} 筆）")
+        return plan
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "decisions": dict(self.decisions),
+                "cardinality": self._stats.to_dict() if self._stats else None,
+                "cardinality_generation": self._stats_generation,
+            }
@@ -0,0 +1,155 @@
+"""
+資料庫 schema 能力偵測
+啟動時以單次 information_schema 查詢偵測資料表與欄位，快取為能力對照表，
+查詢建構時直接讀取，不再於每次搜尋執行 DESCRIBE
+
+主要功能：
+1. 偵測 embeddings.document_id、分類系統表與時間序列表是否存在
+2. setup_*.py 執行遷移後更新標記檔，服務在下次讀取時自動重新偵測
+3. 偵測失敗時不快取結果，下次讀取重試
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CLASSIFICATION_TABLES = ("documents", "categories", "family_members", "tags", "document_tags")
+TIME_SERIES_TABLES = (
+    "time_series_types",
+    "time_series_data",
+    "time_series_analysis",
+    "time_series_alerts",
+    "time_series_alert_logs",
+)
+TRACKED_TABLES = ("embeddings",) + CLASSIFICATION_TABLES + TIME_SERIES_TABLES
+
+
+def default_marker_path() -> Path:
+    """遷移腳本執行後更新此檔案的修改時間（呼叫時才讀取環境變數，以便先載入 .env）"""
+    return Path(os.getenv("SCHEMA_MARKER_PATH", "cache/schema_version"))
+
+
+def mark_schema_changed(marker_path: Optional[Path] = None):
+    """通知執行中的服務 schema 已變更（由遷移腳本呼叫）"""
+    marker_path = Path(marker_path or default_marker_path())
+    marker_path.parent.mkdir(parents=True, exist_ok=True)
+    marker_path.touch()
+
+
+def describe_columns(conn, tables: Sequence[str]) -> Dict[str, set]:
+    """以單次 information_schema 查詢取得資料表欄位（TiDB / MySQL）"""
+    cursor = conn.cursor()
+    try:
+        placeholders = ','.join(['%s'] * len(tables))
+        cursor.execute(f"""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        """, tuple(tables))
+        columns: Dict[str, set] = {}
+        for table, column in cursor.fetchall():
+            columns.setdefault(table, set()).add(column)
+        return columns
+    finally:
+        cursor.close()
+
+
+class SchemaCapabilities:
+    """某一時間點的資料表 / 欄位對照表"""
+
+    def __init__(self, tables: Optional[Dict[str, FrozenSet[str]]] = None):
+        self.tables = tables or {}
+
+    def has_table(self, table: str) -> bool:
+        return table in self.tables
+
+    def has_tables(self, tables: Iterable[str]) -> bool:
+        return all(table in self.tables for table in tables)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.tables.get(table, ())
+
+    @property
+    def embeddings_has_document_id(self) -> bool:
+        return self.has_column("embeddings", "document_id")
+
+    @property
+    def metadata_join(self) -> bool:
+        """可以 embeddings → documents → categories / family_members 連接過濾"""
+        return self.embeddings_has_document_id and self.has_tables(("documents", "categories", "family_members"))
+
+    @property
+    def tag_filter(self) -> bool:
+        return self.metadata_join and self.has_tables(("tags", "document_tags"))
+
+    @property
+    def time_series(self) -> bool:
+        return self.has_tables(TIME_SERIES_TABLES)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "tables": {table: sorted(columns) for table, columns in sorted(self.tables.items())},
+            "embeddings_has_document_id": self.embeddings_has_document_id,
+            "metadata_join": self.metadata_join,
+            "tag_filter": self.tag_filter,
+            "time_series": self.time_series,
+        }
+
+
+class SchemaRegistry:
+    """快取 schema 能力，標記檔變更時重新偵測；describe 依儲存後端查詢欄位"""
+
+    def __init__(self,
+                 connection_factory: Callable[[], object],
+                 marker_path: Optional[Path] = None,
+                 tables: Iterable[str] = TRACKED_TABLES,
+                 describe: Callable[[object, Sequence[str]], Dict[str, set]] = describe_columns):
+        self.connection_factory = connection_factory
+        self.describe = describe
+        self.marker_path = Path(marker_path or default_marker_path())
+        self.tracked_tables = tuple(tables)
+        self._capabilities: Optional[SchemaCapabilities] = None
+        self._marker_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.refresh_count = 0
+
+    def _current_marker_mtime(self) -> Optional[float]:
+        try:
+            return self.marker_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def get(self) -> SchemaCapabilities:
+        """取得能力對照表；尚未偵測或遷移後才會查詢資料庫"""
+        capabilities = self._capabilities
+        if capabilities is not None and self._current_marker_mtime() == self._marker_mtime:
+            return capabilities
+        return self.refresh()
+
+    def refresh(self) -> SchemaCapabilities:
+        """重新偵測（TiDB 為單次 information_schema 查詢）"""
+        with self._lock:
+            marker_mtime = self._current_marker_mtime()
+            conn = self.connection_factory()
+            if not conn:
+                return self._capabilities or SchemaCapabilities()
+            try:
+                columns = self.describe(conn, self.tracked_tables)
+            except Exception as e:
+                logger.error(f"Schema 偵測失敗: {e}")
+                return self._capabilities or SchemaCapabilities()
+            finally:
+                conn.close()
+
+            self._capabilities = SchemaCapabilities(
+                {table: frozenset(names) for table, names in columns.items()}
+            )
+            self._marker_mtime = marker_mtime
+            self.refresh_count += 1
+            missing = [table for table in self.tracked_tables if table not in columns]
+            logger.info(f"Schema 能力已更新：{len(columns)} 個資料表，缺少 {missing or '無'}")
+            return self._capabilities
@@ -0,0 +1,106 @@
+"""
+檢索結果快取
+以正規化後的查詢參數為鍵，記住 multi_dimensional_search 的結果；
+前端搜尋頁在切換過濾條件、換頁時會重送相同的搜尋，命中時不需 embedding 與資料庫查詢
+
+主要功能：
+1. 鍵為 (正規化查詢文字, 分類, 標籤, 標籤模式, 日期範圍, 家庭成員, 金額範圍, 搜尋模式, 數量)
+2. 有上限的 LRU，另設 TTL 作為保險
+3. 與 CorpusVersion 世代計數器連動：上傳、標籤變更、刪除遞增世代後整個快取失效
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from .corpus_version import CorpusVersion
+from .embedding_cache import normalize_text
+
+
+def search_cache_key(query_text: str,
+                     category: Optional[str] = None,
+                     tags: Optional[Sequence[str]] = None,
+                     tag_mode: str = "any",
+                     date_from: Optional[str] = None,
+                     date_to: Optional[str] = None,
+                     family_member: Optional[str] = None,
+                     amount_min: Optional[float] = None,
+                     amount_max: Optional[float] = None,
+                     search_mode: str = "hybrid",
+                     limit: int = 4) -> Tuple[Hashable, ...]:
+    """將查詢參數正規化為快取鍵（空字串視同未指定、標籤不分順序）"""
+    return (
+        normalize_text(query_text),
+        category or None,
+        tuple(sorted(set(tags))) if tags else None,
+        tag_mode if tags else None,
+        date_from or None,
+        date_to or None,
+        family_member or None,
+        float(amount_min) if amount_min is not None else None,
+        float(amount_max) if amount_max is not None else None,
+        search_mode,
+        limit,
+    )
+
+
+class SearchResultCache:
+    """以世代計數器失效的 LRU 檢索結果快取"""
+
+    def __init__(self, version: CorpusVersion, max_entries: int = 512, ttl_seconds: float = 600):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_generation_locked(self) -> int:
+        generation = self.version.current()
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+        return generation
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """命中時回傳結果的副本，呼叫端可自由修改"""
+        with self._lock:
+            self._check_generation_locked()
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(row) for row in entry[1]]
+
+    def put(self, key: Hashable, results: List[Dict[str, Any]], generation: int):
+        """generation 為檢索開始時的世代，期間語料已變動則不快取"""
+        with self._lock:
+            if self._check_generation_locked() != generation:
+                return
+            self._entries[key] = (time.monotonic(), [dict(row) for row in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "generation": self._generation,
+            }
@@ -0,0 +1,292 @@
+"""
+內嵌 SQLite 連線
+單機部署以本機 SQLite 檔案取代 TiDB，查詢不經網路；連線介面與 mysql.connector 相同，
+分類、時間序列與 API 的既有 SQL 不需改寫
+
+主要功能：
+1. SQL 轉換：%s 佔位符、CAST(... AS VECTOR(n))、DATE_SUB(..., INTERVAL n DAY)、
+   INSERT IGNORE 與 ON DUPLICATE KEY UPDATE 轉為 SQLite 語法（轉換結果快取）
+2. 自訂函式：VEC_COSINE_DISTANCE、DATE_FORMAT、CURDATE、NOW、YEAR、MONTH
+3. 與 mysql.connector 相同的語意：cursor(dictionary=True)、多列 INSERT 的 lastrowid 為第一列、
+   重複鍵與外鍵錯誤帶有 MySQL errno（1062 / 1452），DATE / TIMESTAMP 欄位回傳 date / datetime
+4. 交易於第一個寫入語句時以 BEGIN IMMEDIATE 開始，多條連線同時寫入時依 busy timeout 排隊，
+   唯讀查詢不持有交易（WAL 模式下讀寫互不阻塞）
+"""
+
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .vector_codec import from_sql_literal
+
+# 對應的 MySQL errno，呼叫端據此判斷可重試的錯誤（taxonomy_cache.RETRYABLE_ERRNOS）
+ER_DUP_ENTRY = 1062
+ER_NO_REFERENCED_ROW_2 = 1452
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|%s")
+_CAST_VECTOR = re.compile(r"CAST\(\s*([\w.%]+)\s+AS\s+VECTOR\(\d+\)\s*\)", re.IGNORECASE)
+_DATE_SUB = re.compile(r"DATE_SUB\(\s*(CURDATE\(\)|[\w.]+)\s*,\s*INTERVAL\s+(\d+)\s+DAY\s*\)", re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r"\bINSERT\s+IGNORE\s+INTO\b", re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_REF = re.compile(r"\bVALUES\(\s*(\w+)\s*\)", re.IGNORECASE)
+# MySQL 接受 2026/10/01、2026.10.1 等分隔符號，於讀取時同樣接受
+_LOOSE_DATETIME = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[ T](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?")
+_WRITE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+_INSERT = re.compile(r"^\s*INSERT\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql: str) -> str:
+    """將本專案使用的 MySQL / TiDB 語法轉為 SQLite 語法"""
+    sql = _CAST_VECTOR.sub(r"\1", sql)
+    sql = _DATE_SUB.sub(r"DATE(\1, '-\2 day')", sql)
+    sql = _INSERT_IGNORE.sub("INSERT OR IGNORE INTO", sql)
+    match = _ON_DUPLICATE.search(sql)
+    if match:
+        # 不指定衝突目標：任一唯一鍵衝突皆更新（SQLite 3.35+）
+        head, tail = sql[:match.start()], sql[match.end():]
+        sql = head + "ON CONFLICT DO UPDATE SET" + _VALUES_REF.sub(r"excluded.\1", tail)
+    # 字串字面值內的 % 保持原樣（DATE_FORMAT 的 %Y 等）
+    return _TOKEN.sub(lambda m: "?" if m.group(0) == "%s" else m.group(0), sql)
+
+
+# --- 自訂函式 ---
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    return str(value)
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    text = _text(value)
+    match = _LOOSE_DATETIME.match(text.strip()) if text else None
+    if match is None:
+        return None
+    try:
+        return datetime(*[int(part) for part in match.groups() if part is not None])
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8)
+def _query_vector(literal: str) -> np.ndarray:
+    # 同一次查詢中每列都以相同的查詢向量比較，只解碼一次
+    return from_sql_literal(literal)
+
+
+def vec_cosine_distance(a: Any, b: Any) -> Optional[float]:
+    if a is None or b is None:
+        return None
+    left = from_sql_literal(a)
+    right = _query_vector(_text(b))
+    denominator = float(np.linalg.norm(left) * np.linalg.norm(right))
+    if denominator == 0:
+        return None
+    return 1.0 - float(np.dot(left, right)) / denominator
+
+
+def date_format(value: Any, fmt: Any) -> Optional[str]:
+    parsed = _parse_datetime(value)
+    if parsed is None or fmt is None:
+        return None
+    # MySQL 的分鐘與秒為 %i / %s
+    return parsed.strftime(_text(fmt).replace("%i", "%M").replace("%s", "%S"))
+
+
+def _date_part(attribute: str):
+    def part(value: Any) -> Optional[int]:
+        parsed = _parse_datetime(value)
+        return getattr(parsed, attribute) if parsed is not None else None
+    return part
+
+
+def _register_functions(conn: sqlite3.Connection):
+    conn.create_function("VEC_COSINE_DISTANCE", 2, vec_cosine_distance, deterministic=True)
+    conn.create_function("DATE_FORMAT", 2, date_format, deterministic=True)
+    conn.create_function("YEAR", 1, _date_part("year"), deterministic=True)
+    conn.create_function("MONTH", 1, _date_part("month"), deterministic=True)
+    conn.create_function("CURDATE", 0, lambda: date.today().isoformat())
+    conn.create_function("NOW", 0, lambda: datetime.now().isoformat(sep=" ", timespec="seconds"))
+
+
+# --- 型別轉換 ---
+
+def _convert_date(value: bytes) -> Any:
+    parsed = _parse_datetime(value)
+    # 文件擷取的日期格式不一，無法解析時維持原字串
+    return parsed.date() if parsed is not None else value.decode()
+
+
+def _convert_datetime(value: bytes) -> Any:
+    parsed = _parse_datetime(value)
+    return parsed if parsed is not None else value.decode()
+
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("TIMESTAMP", _convert_datetime)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+# --- 連線 ---
+
+def _mysql_errno(error: sqlite3.IntegrityError) -> Optional[int]:
+    message = str(error)
+    if "UNIQUE constraint failed" in message or "PRIMARY KEY" in message:
+        return ER_DUP_ENTRY
+    if "FOREIGN KEY constraint failed" in message:
+        return ER_NO_REFERENCED_ROW_2
+    return None
+
+
+class SQLiteCursor:
+    """與 mysql.connector cursor 相同介面的 SQLite cursor"""
+
+    def __init__(self, connection: "SQLiteConnection", dictionary: bool = False):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+        self._dictionary = dictionary
+        self.lastrowid: Optional[int] = None
+        self.rowcount = -1
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None):
+        statement = translate_sql(sql)
+        if _WRITE.match(statement):
+            self._connection.begin()
+        try:
+            self._cursor.execute(statement, tuple(params) if params else ())
+        except sqlite3.IntegrityError as e:
+            e.errno = _mysql_errno(e)
+            raise
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        if _INSERT.match(statement) and self.rowcount and self.rowcount > 1 and self.lastrowid:
+            # SQLite 回傳最後一列；單一語句內配置的 rowid 連續
+            self.lastrowid -= self.rowcount - 1
+        return self
+
+    def _row(self, row: Optional[tuple]) -> Any:
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self) -> Any:
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self) -> list:
+        rows = self._cursor.fetchall()
+        if not self._dictionary:
+            return rows
+        columns = [column[0] for column in self._cursor.description or ()]
+        return [dict(zip(columns, row)) for row in rows]
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self) -> "SQLiteCursor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SQLiteConnection:
+    """與 mysql.connector 連線相同介面（cursor / commit / rollback / ping / close）的 SQLite 連線"""
+
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+
+    def cursor(self, dictionary: bool = False) -> SQLiteCursor:
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def begin(self):
+        """第一個寫入語句前取得寫入鎖，避免讀取後升級寫入時因快照過期而失敗"""
+        if not self.raw.in_transaction:
+            self.raw.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def ping(self, reconnect: bool = False):
+        self.raw.execute("SELECT 1").fetchone()
+
+    def is_connected(self) -> bool:
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self.raw.close()
+
+
+_schema_lock = threading.Lock()
+
+
+def connect_sqlite(path: Path, busy_timeout: float = 30.0) -> SQLiteConnection:
+    """開啟 SQLite 連線（WAL、外鍵檢查、自訂函式）；連線可由連線池在不同執行緒間借出"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    raw = sqlite3.connect(
+        str(path),
+        timeout=busy_timeout,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+        isolation_level=None,
+    )
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    raw.execute("PRAGMA foreign_keys=ON")
+    _register_functions(raw)
+    return SQLiteConnection(raw)
+
+
+def initialize_schema(path: Path, schema_path: Path):
+    """建立資料表與預設資料（CREATE TABLE IF NOT EXISTS / INSERT OR IGNORE，可重複執行）"""
+    with _schema_lock:
+        conn = connect_sqlite(path)
+        try:
+            conn.raw.executescript(Path(schema_path).read_text(encoding="utf-8"))
+        finally:
+            conn.close()
+
+
+def describe_columns(conn, tables: Sequence[str]) -> Dict[str, set]:
+    """以 sqlite_master 與 PRAGMA table_info 偵測資料表欄位"""
+    cursor = conn.cursor()
+    try:
+        placeholders = ','.join(['%s'] * len(tables))
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})",
+            list(tables)
+        )
+        existing = [row[0] for row in cursor.fetchall()]
+        columns: Dict[str, set] = {}
+        for table in existing:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns[table] = {row[1] for row in cursor.fetchall()}
+        return columns
+    finally:
+        cursor.close()
@@ -0,0 +1,161 @@
+"""
+儲存後端
+documents、categories、tags、embeddings 與 time_series_* 的存取統一經由儲存後端取得連線，
+API、分類器與時間序列分析不再直接連線 TiDB
+
+後端：
+1. tidb：TiDB Cloud（既有行為），阻塞式連線池 + 非同步資料庫層（aiomysql 或執行緒）
+2. sqlite：內嵌 SQLite 檔案（sqlite_store），單機部署查詢不經網路，也可離線做基準測試；
+   向量檢索由本機向量索引提供候選，VEC_COSINE_DISTANCE 自訂函式負責過濾掃描的精確評分
+
+兩種後端提供相同介面：pool（阻塞式連線，cursor / commit / rollback 與 mysql.connector 相同）、
+async_db（非同步查詢）與 describe_columns（schema 能力偵測）；以 STORAGE_BACKEND 選擇。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import mysql.connector
+
+from .async_db import AsyncDatabase, ThreadedDatabase, create_async_database
+from .db_pool import ConnectionPool, get_tidb_pool, tidb_config_from_env
+from .schema_capabilities import describe_columns as describe_information_schema
+from .sqlite_store import connect_sqlite, describe_columns as describe_sqlite_columns, initialize_schema
+
+logger = logging.getLogger(__name__)
+
+# 兩種後端的資料庫錯誤（呼叫端以此取代 mysql.connector.Error）
+DATABASE_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+SQLITE_SCHEMA_PATH = Path(__file__).resolve().parent.parent / "scripts" / "sqlite_schema.sql"
+
+
+class StorageBackend(ABC):
+    """儲存後端介面；pool 與 async_db 為 None 表示未設定連線參數"""
+
+    name = "base"
+    # 內嵌於本程序、不經網路（讀寫分離等遠端最佳化不適用）
+    embedded = False
+
+    def __init__(self, pool: Optional[ConnectionPool], async_db: Optional[AsyncDatabase]):
+        self.pool = pool
+        self.async_db = async_db
+
+    def connection(self):
+        """自連線池借出連線；呼叫 close() 即歸還，無法連線時回傳 None"""
+        if self.pool is None:
+            return None
+        try:
+            return self.pool.acquire()
+        except Exception as e:
+            logger.error(f"{self.name} 連線錯誤: {e}")
+            return None
+
+    @abstractmethod
+    def describe_columns(self, conn, tables: Sequence[str]) -> Dict[str, set]:
+        """回傳 {資料表: 欄位名稱集合}，不存在的資料表不列出"""
+
+    async def close(self):
+        if self.async_db is not None:
+            await self.async_db.close()
+        if self.pool is not None:
+            self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "embedded": self.embedded}
+
+
+class TiDBStorage(StorageBackend):
+    """TiDB Cloud：共用的 TiDB 連線池與非同步資料庫層"""
+
+    name = "tidb"
+
+    def __init__(self,
+                 config: Optional[Dict[str, Any]],
+                 pool: Optional[ConnectionPool],
+                 async_backend: str = "auto",
+                 async_pool_size: int = 10):
+        super().__init__(pool, create_async_database(config, pool, backend=async_backend, max_size=async_pool_size))
+        self.config = config
+
+    def describe_columns(self, conn, tables: Sequence[str]) -> Dict[str, set]:
+        return describe_information_schema(conn, tables)
+
+
+class SQLiteStorage(StorageBackend):
+    """內嵌 SQLite：啟動時建立資料表，連線池的連線於執行緒中查詢"""
+
+    name = "sqlite"
+    embedded = True
+
+    def __init__(self,
+                 path: Path,
+                 pool_size: int = 4,
+                 wait_timeout: float = 5.0,
+                 schema_path: Path = SQLITE_SCHEMA_PATH):
+        self.path = Path(path)
+        initialize_schema(self.path, schema_path)
+        # 本機檔案不需定期汰換或健康檢查
+        pool = ConnectionPool(
+            lambda: connect_sqlite(self.path),
+            max_size=pool_size,
+            wait_timeout=wait_timeout,
+            max_lifetime=0,
+            idle_timeout=0,
+            health_check_interval=float("inf"),
+            name="sqlite",
+        )
+        super().__init__(pool, ThreadedDatabase(pool))
+
+    def describe_columns(self, conn, tables: Sequence[str]) -> Dict[str, set]:
+        return describe_sqlite_columns(conn, tables)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            size = 0
+        return {**super().stats(), "path": str(self.path), "size_bytes": size}
+
+
+def create_storage_backend(backend: str = "tidb",
+                           async_backend: str = "auto",
+                           async_pool_size: int = 10) -> StorageBackend:
+    """依名稱建立儲存後端：tidb（預設）或 sqlite（SQLITE_PATH、SQLITE_POOL_SIZE）"""
+    if backend == "sqlite":
+        return SQLiteStorage(
+            Path(os.getenv("SQLITE_PATH", "data/rag.sqlite3")),
+            pool_size=int(os.getenv("SQLITE_POOL_SIZE", 4)),
+        )
+    if backend != "tidb":
+        logger.warning(f"未知的 STORAGE_BACKEND '{backend}'，改用 tidb")
+    return TiDBStorage(tidb_config_from_env(), get_tidb_pool(),
+                       async_backend=async_backend, async_pool_size=async_pool_size)
+
+
+_shared_storage: Optional[StorageBackend] = None
+_shared_pid: Optional[int] = None
+_shared_lock = threading.Lock()
+
+
+def get_storage_backend(async_backend: str = "auto", async_pool_size: int = 10) -> StorageBackend:
+    """
+    同一程序內共用的儲存後端（API、分類器與時間序列分析共用），依 STORAGE_BACKEND 建立
+    fork 出的子程序會建立自己的後端
+    """
+    global _shared_storage, _shared_pid
+    with _shared_lock:
+        if _shared_storage is not None and _shared_pid == os.getpid():
+            return _shared_storage
+        _shared_storage = create_storage_backend(
+            os.getenv("STORAGE_BACKEND", "tidb"),
+            async_backend=async_backend,
+            async_pool_size=async_pool_size,
+        )
+        _shared_pid = os.getpid()
+        return _shared_storage
@@ -0,0 +1,123 @@
+"""
+分類與標籤的名稱 → id 快取
+儲存文件元資料時原本每個分類、每個標籤各查詢一次；分類與標籤數量少且幾乎不變，
+記在程序內即可讓大多數上傳不需任何查詢
+
+主要功能：
+1. 分類：未命中時以單次查詢重新載入整張分類表
+2. 標籤：未命中的名稱以單次 IN 查詢取得，仍不存在者以單一多列 INSERT 建立
+3. 新建的標籤 id 在交易提交後才以 remember_tags 加入快取，回滾時不會留下無效 id
+4. TTL 到期或 invalidate() 後重新載入；其他 worker 建立同名標籤（重複鍵）或標籤被刪除（外鍵）時，
+   呼叫端清除快取並重試（RETRYABLE_ERRNOS）
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .bulk_writer import BulkWriter
+
+# ER_DUP_ENTRY、ER_NO_REFERENCED_ROW_2：快取與資料庫不一致時重新載入即可成功
+RETRYABLE_ERRNOS = frozenset({1062, 1452})
+
+DEFAULT_TAG_COLOR = '#808080'
+
+
+class TaxonomyCache:
+    """分類與標籤的程序內名稱 → id 對照"""
+
+    def __init__(self, ttl_seconds: float = 600):
+        self.ttl_seconds = ttl_seconds
+        self._categories: Dict[str, int] = {}
+        self._categories_loaded_at: Optional[float] = None
+        self._tags: Dict[str, int] = {}
+        self._tags_loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _expired(self, loaded_at: Optional[float]) -> bool:
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl_seconds
+
+    def invalidate(self):
+        with self._lock:
+            self._categories.clear()
+            self._categories_loaded_at = None
+            self._tags.clear()
+            self._tags_loaded_at = time.monotonic()
+
+    def category_id(self, conn, name: str) -> Optional[int]:
+        """分類 id；不存在時回傳 None"""
+        with self._lock:
+            if not self._expired(self._categories_loaded_at) and name in self._categories:
+                self.hits += 1
+                return self._categories[name]
+            self.misses += 1
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, name FROM categories")
+            categories = {row_name: row_id for row_id, row_name in cursor.fetchall()}
+        finally:
+            cursor.close()
+        with self._lock:
+            self._categories = categories
+            self._categories_loaded_at = time.monotonic()
+            self.reloads += 1
+        return categories.get(name)
+
+    def resolve_tags(self, conn, names: Sequence[str]) -> Tuple[List[int], Dict[str, int]]:
+        """
+        回傳 (依名稱順序去重後的標籤 id, 本次新建的 名稱 → id)
+        新建的標籤屬於呼叫端的交易，提交後須呼叫 remember_tags
+        """
+        names = [name for name in dict.fromkeys(names) if name]
+        with self._lock:
+            if self._expired(self._tags_loaded_at):
+                self._tags.clear()
+                self._tags_loaded_at = time.monotonic()
+            known = {name: self._tags[name] for name in names if name in self._tags}
+            self.hits += len(known)
+            self.misses += len(names) - len(known)
+        missing = [name for name in names if name not in known]
+
+        created: Dict[str, int] = {}
+        if missing:
+            cursor = conn.cursor()
+            try:
+                placeholders = ','.join(['%s'] * len(missing))
+                cursor.execute(f"SELECT id, name FROM tags WHERE name IN ({placeholders})", missing)
+                found = {row_name: row_id for row_id, row_name in cursor.fetchall()}
+            finally:
+                cursor.close()
+            # 已提交的既有標籤可直接快取
+            self.remember_tags(found)
+            known.update(found)
+            new_names = [name for name in missing if name not in found]
+            if new_names:
+                ids = BulkWriter(conn, commit=False).insert(
+                    "tags", ["name", "color", "description"],
+                    [(name, DEFAULT_TAG_COLOR, f'自動建立的標籤: {name}') for name in new_names],
+                    returning_ids=True
+                )
+                created = dict(zip(new_names, ids))
+                known.update(created)
+        return [known[name] for name in names], created
+
+    def remember_tags(self, tags: Dict[str, int]):
+        if not tags:
+            return
+        with self._lock:
+            self._tags.update(tags)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "categories": len(self._categories),
+                "tags": len(self._tags),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "reloads": self.reloads,
+            }
@@ -18,11 +18,11 @@ import statistics
 import re
 from dataclasses import dataclass
 
-import mysql.connector
-from mysql.connector import Error
 import pandas as pd
 import numpy as np
 
+from .storage import DATABASE_ERRORS
+
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -184,7 +184,7 @@ class TimeSeriesAnalyzer:
             logger.info(f"成功儲存時間序列數據: {series_type_name} = {value} ({data_date})")
             return True
             
-        except Error as e:
+        except DATABASE_ERRORS as e:
             logger.error(f"儲存時間序列數據失敗: {e}")
             self.connection.rollback()
             return False
@@ -238,7 +238,7 @@ class TimeSeriesAnalyzer:
             
             return data_points
             
-        except Error as e:
+        except DATABASE_ERRORS as e:
             logger.error(f"取得時間序列數據失敗: {e}")
             return []
     
@@ -377,7 +377,7 @@ class TimeSeriesAnalyzer:
             
             return alerts_triggered
             
-        except Error as e:
+        except DATABASE_ERRORS as e:
             logger.error(f"檢查警報失敗: {e}")
             return []
     
@@ -393,7 +393,7 @@ class TimeSeriesAnalyzer:
             """
             cursor.execute(sql, (alert_id, date.today(), current_value, previous_value, message))
             self.connection.commit()
-        except Error as e:
+        except DATABASE_ERRORS as e:
             logger.error(f"記錄警報日誌失敗: {e}")
     
     def get_statistics_summary(self, series_type_name: str, 
@@ -0,0 +1,80 @@
+"""
+向量編解碼模組
+所有向量讀寫路徑的單一進出口，以 packed float32 NumPy 陣列為內部表示
+
+格式說明：
+1. 二進位格式：little-endian float32，每維 4 bytes（1536 維 = 6 KB），用於本機快取與索引
+2. SQL 文字格式：TiDB 的 VECTOR 型別經 MySQL 協定只接受文字字面值，
+   因此以 9 位有效數字輸出，可無損還原 float32，取代 Python float 的 repr（17 位）
+"""
+
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+DTYPE = np.dtype('<f4')
+
+# 9 位有效數字足以讓任何 float32 經十進位文字後還原為相同的值（7 位會失真）
+TEXT_PRECISION = 9
+
+VectorLike = Union[Sequence[float], np.ndarray]
+
+_literal_formats: Dict[int, str] = {}
+
+
+def to_array(vector: VectorLike) -> np.ndarray:
+    """轉換為連續記憶體的 float32 一維陣列"""
+    return np.ascontiguousarray(vector, dtype=DTYPE).reshape(-1)
+
+
+def to_matrix(vectors: Sequence[VectorLike]) -> np.ndarray:
+    """將多個向量轉換為 (n, dim) 的 float32 矩陣"""
+    if isinstance(vectors, np.ndarray):
+        return np.ascontiguousarray(vectors, dtype=DTYPE).reshape(len(vectors), -1)
+    return np.ascontiguousarray(np.stack([to_array(v) for v in vectors]), dtype=DTYPE)
+
+
+def to_bytes(vector: VectorLike) -> bytes:
+    """編碼為 packed float32 bytes"""
+    return to_array(vector).tobytes()
+
+
+def from_bytes(blob: bytes) -> np.ndarray:
+    """由 packed float32 bytes 解碼（回傳可寫入的副本）"""
+    return np.frombuffer(blob, dtype=DTYPE).copy()
+
+
+def to_sql_literal(vector: VectorLike) -> str:
+    """編碼為 TiDB VECTOR 文字字面值，例如 '[0.0123456791,-0.00200000009]'"""
+    values = to_array(vector).tolist()
+    fmt = _literal_formats.get(len(values))
+    if fmt is None:
+        fmt = "[" + ",".join([f"%.{TEXT_PRECISION}g"] * len(values)) + "]"
+        _literal_formats[len(values)] = fmt
+    return fmt % tuple(values)
+
+
+def from_sql_literal(text: Union[str, bytes, bytearray]) -> np.ndarray:
+    """解碼 TiDB 回傳的 VECTOR 文字（'[...]'）"""
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode('ascii')
+    text = text.strip()
+    if text.startswith('['):
+        text = text[1:-1]
+    if not text:
+        return np.zeros(0, dtype=DTYPE)
+    return np.fromstring(text, sep=',', dtype=DTYPE)
+
+
+def to_list(vector: VectorLike) -> List[float]:
+    """轉換為 Python list（供 JSON 回應使用）"""
+    return to_array(vector).tolist()
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 正規化（一維或二維），使 cosine 相似度等於內積"""
+    vectors = np.asarray(vectors, dtype=DTYPE)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(DTYPE, copy=False)
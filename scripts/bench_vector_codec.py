@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+向量編碼效能基準測試
+比較舊的字串化浮點數與 vector_codec 的序列化成本，以及每次插入 / 查詢的傳輸量
+
+使用方式：
+python scripts/bench_vector_codec.py --count 2000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 以 python scripts/bench_vector_codec.py 直接執行時，將專案根目錄加入匯入路徑
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_store.vector_codec import EMBEDDING_DIM, from_sql_literal, to_bytes, to_sql_literal
+
+# 典型插入語句（不含向量參數）與 chunk 大小
+INSERT_SQL = "INSERT INTO embeddings (doc_id, chunk, vec, document_id) VALUES (%s, %s, CAST(%s AS VECTOR(1536)), %s)"
+QUERY_SQL = """
+SELECT doc_id, chunk,
+       VEC_COSINE_DISTANCE(CAST(vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance
+FROM embeddings
+ORDER BY distance ASC
+LIMIT %s
+"""
+CHUNK_BYTES = 512 * 3  # 512 個中文字的 UTF-8 大小
+
+
+def legacy_join(vector):
+    return "[" + ",".join(map(str, vector)) + "]"
+
+
+def legacy_str(vector):
+    return str(vector)
+
+
+def bench(label, fn, vectors):
+    start = time.perf_counter()
+    outputs = [fn(v) for v in vectors]
+    elapsed = time.perf_counter() - start
+    size = sum(len(o) for o in outputs) / len(outputs)
+    print(f"{label:<34} {elapsed / len(vectors) * 1e6:>10.1f} µs/vec {size:>10.0f} bytes/vec")
+    return outputs, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector serialization.")
+    parser.add_argument("--count", type=int, default=2000, help="Number of vectors to encode.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    matrix = rng.normal(0, 0.03, size=(args.count, EMBEDDING_DIM)).astype(np.float32)
+    # OpenAI SDK 回傳的是 Python float list
+    vectors = [row.astype(np.float64).tolist() for row in matrix]
+
+    print(f"Encoding {args.count} vectors of dim {EMBEDDING_DIM}\n")
+    print(f"{'format':<34} {'encode cost':>17} {'size':>16}")
+    _, legacy_size = bench("legacy ','.join(map(str, v))", legacy_join, vectors)
+    bench("legacy str(v)", legacy_str, vectors)
+    literals, literal_size = bench("vector_codec.to_sql_literal", to_sql_literal, vectors)
+    _, binary_size = bench("vector_codec.to_bytes (local)", to_bytes, vectors)
+
+    start = time.perf_counter()
+    decoded = [from_sql_literal(text) for text in literals]
+    elapsed = time.perf_counter() - start
+    print(f"{'vector_codec.from_sql_literal':<34} {elapsed / len(literals) * 1e6:>10.1f} µs/vec")
+
+    max_error = max(float(np.max(np.abs(d - m))) for d, m in zip(decoded, matrix))
+    print(f"\nmax abs round-trip error: {max_error:.2e}")
+
+    print("\nBytes on the wire (statement text + parameters):")
+    for label, vec_size in (("legacy", legacy_size), ("codec", literal_size)):
+        per_insert = len(INSERT_SQL) + CHUNK_BYTES + vec_size
+        per_query = len(QUERY_SQL) + vec_size
+        print(f"  {label:<8} insert ≈ {per_insert / 1024:6.1f} KB   query ≈ {per_query / 1024:6.1f} KB")
+    print(f"  local binary storage: {binary_size / 1024:.1f} KB per vector")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 import os
+import sys
+from pathlib import Path
 import openai
 import mysql.connector
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 
+# 以 python scripts/embed_upload.py 直接執行時，將專案根目錄加入匯入路徑
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_store.bulk_writer import BulkWriter
+from rag_store.embedding_batcher import iter_batches
+from rag_store.embedding_cache import EmbeddingCache
+from rag_store.vector_codec import to_sql_literal
+
 # 載入 .env 檔案中的環境變數
 load_dotenv('/home/hom/services/rag-store/.env')
 
@@ -24,6 +34,18 @@ SOURCE_DIR = "/home/hom/services/rag-store/ocr_txt"
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
+# Embedding 批次設定
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 128))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", 100000))
+
+# 多列 INSERT 的批次大小（每批一次往返、一次提交）
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", 200))
+
+# Embedding 快取（與 API 服務共用同一個快取檔）
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+
 def get_tidb_connection():
     """建立並返回 TiDB 連線"""
     try:
@@ -42,14 +64,27 @@ def get_tidb_connection():
         print(f"Error connecting to TiDB: {err}")
         return None
 
-def get_embedding(text, model=EMBEDDING_MODEL):
-    """使用 OpenAI API 產生文字的 embedding"""
+def get_embeddings(texts, model=EMBEDDING_MODEL):
+    """產生多段文字的 embedding（先查快取，未命中者以單一多輸入請求補齊），失敗時回傳 None"""
+    vecs = embedding_cache.get_many(model, texts)
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+    if not missing:
+        return vecs
     try:
-        response = openai.embeddings.create(input=[text], model=model)
-        return response.data[0].embedding
+        response = openai.embeddings.create(input=[texts[i] for i in missing], model=model)
+        fetched = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
     except Exception as e:
-        print(f"Error getting embedding: {e}")
+        print(f"Error getting embeddings: {e}")
         return None
+    for i, vec in zip(missing, fetched):
+        vecs[i] = vec
+    embedding_cache.put_many(model, [(texts[i], vec) for i, vec in zip(missing, fetched)])
+    return vecs
+
+def get_embedding(text, model=EMBEDDING_MODEL):
+    """使用 OpenAI API 產生文字的 embedding"""
+    vecs = get_embeddings([text], model)
+    return vecs[0] if vecs else None
 
 def process_and_upload_files():
     """處理所有文字檔案，產生 embeddings 並上傳到 TiDB"""
@@ -57,7 +92,7 @@ def process_and_upload_files():
     if not conn:
         return
         
-    cursor = conn.cursor()
+    writer = BulkWriter(conn, batch_size=BULK_INSERT_BATCH_SIZE)
     
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
@@ -76,33 +111,35 @@ def process_and_upload_files():
             
             chunks = text_splitter.split_text(content)
             
-            for i, chunk_text in enumerate(chunks):
-                print(f"  - Generating embedding for chunk {i+1}/{len(chunks)}...")
+            done = 0
+            for batch in iter_batches(chunks, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS):
+                print(f"  - Generating embeddings for chunks {done+1}-{done+len(batch)}/{len(chunks)}...")
+                done += len(batch)
                 
-                # 產生 embedding
-                vec = get_embedding(chunk_text)
+                # 以一次請求產生整批 embedding
+                vecs = get_embeddings(batch)
+                if not vecs:
+                    continue
                 
-                if vec:
-                    # 插入資料庫
-                    sql = "INSERT INTO embeddings (doc_id, chunk, vec) VALUES (%s, %s, %s)"
-                    val = (doc_id, chunk_text, str(vec)) # 將向量轉為字串儲存
-                    try:
-                        cursor.execute(sql, val)
-                    except mysql.connector.Error as err:
-                        print(f"  - Database insert failed: {err}")
-
-    # 提交所有變更
-    try:
-        conn.commit()
-        print("\nAll changes have been committed to the database.")
-    except mysql.connector.Error as err:
-        print(f"Database commit failed: {err}")
-        conn.rollback()
+                # 整批以多列 INSERT 寫入並提交
+                rows = [(doc_id, chunk_text, to_sql_literal(vec)) # 精簡的 VECTOR 字面值
+                        for chunk_text, vec in zip(batch, vecs)]
+                try:
+                    writer.insert("embeddings", ["doc_id", "chunk", "vec"], rows,
+                                  row_template="(%s, %s, CAST(%s AS VECTOR(1536)))")
+                except mysql.connector.Error as err:
+                    print(f"  - Database insert failed: {err}")
+                    conn.rollback()
+
+    stats = writer.stats()
+    print(f"\nInserted {stats['rows']} rows in {stats['statements']} statements, {stats['commits']} commits.")
 
-    cursor.close()
     conn.close()
     print("Database connection closed.")
 
+    stats = embedding_cache.stats()
+    print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
 def main():
     if not all([OPENAI_API_KEY, TIDB_HOST, TIDB_USER, TIDB_PASSWORD]):
         print("Error: Missing required environment variables in .env file.")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+資料庫存取負載測試
+比較端點內直接呼叫阻塞式 mysql.connector（原本的寫法）與 await 非同步資料庫層時，
+同一個 event loop 上同時處理多個請求的吞吐量、延遲與 event loop 停頓
+
+模式：
+- blocking：每個請求建立新連線並在 event loop 上查詢（連線池之前的端點寫法）
+- pooled：自 TiDB 連線池借出連線，但仍在 event loop 上查詢
+- async：await 非同步資料庫層（安裝 aiomysql 時為原生非同步，否則於執行緒中查詢）
+
+使用方式：
+python scripts/load_test_db.py --concurrency 32 --requests 400
+python scripts/load_test_db.py --sql "SELECT SLEEP(0.05)" --modes blocking,async
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import mysql.connector
+from dotenv import load_dotenv
+
+# 以 python scripts/load_test_db.py 直接執行時，將專案根目錄加入匯入路徑
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_store.async_db import create_async_database
+from rag_store.db_pool import get_tidb_pool, tidb_config_from_env
+
+DEFAULT_SQL = "SELECT id, name FROM categories ORDER BY name"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def probe_loop_lag(stop: asyncio.Event, interval: float = 0.01):
+    """定期 sleep 並量測實際醒來的延遲；event loop 被阻塞時延遲隨之增加"""
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+    return lags
+
+
+async def run_load(request, total: int, concurrency: int):
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                await request()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    stop = asyncio.Event()
+    probe = asyncio.ensure_future(probe_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lags = await probe
+    return latencies, errors, elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test blocking vs async database access.")
+    parser.add_argument("--requests", type=int, default=400, help="Total requests per mode.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent requests on one event loop.")
+    parser.add_argument("--sql", default=DEFAULT_SQL, help="Read-only query executed by every request.")
+    parser.add_argument("--modes", default="blocking,pooled,async", help="Comma-separated modes to run.")
+    parser.add_argument("--backend", default="auto", help="Async backend: auto, aiomysql or thread.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    config, pool = tidb_config_from_env(), get_tidb_pool()
+    if config is None or pool is None:
+        raise SystemExit("TIDB_HOST / TIDB_USER / TIDB_PASSWORD are not set")
+    db = create_async_database(config, pool, backend=args.backend, max_size=pool.max_size)
+
+    def blocking_query(conn):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(args.sql)
+        cursor.fetchall()
+        cursor.close()
+
+    async def blocking():
+        conn = mysql.connector.connect(**config)
+        try:
+            blocking_query(conn)
+        finally:
+            conn.close()
+
+    async def pooled():
+        with pool.connection() as conn:
+            blocking_query(conn)
+
+    async def non_blocking():
+        await db.fetch_all(args.sql)
+
+    requests = {"blocking": blocking, "pooled": pooled, "async": non_blocking}
+    print(f"{args.requests} requests per mode, concurrency {args.concurrency}, async backend {db.backend}\n")
+    print(f"{'mode':<9} {'req/s':>8} {'p50':>9} {'p95':>9} {'max lag':>10} {'errors':>7}")
+
+    async def run_all():
+        for mode in args.modes.split(","):
+            mode = mode.strip()
+            latencies, errors, elapsed, lags = await run_load(requests[mode], args.requests, args.concurrency)
+            if not latencies:
+                print(f"{mode:<9} {'-':>8} {'-':>9} {'-':>9} {'-':>10} {errors:>7}")
+                continue
+            print(f"{mode:<9} {len(latencies) / elapsed:>8.1f} "
+                  f"{statistics.median(latencies) * 1000:>6.1f} ms {percentile(latencies, 0.95) * 1000:>6.1f} ms "
+                  f"{max(lags, default=0.0) * 1000:>7.1f} ms {errors:>7}")
+        await db.close()
+
+    asyncio.run(run_all())
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
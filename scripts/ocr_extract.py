@@ -1,11 +1,14 @@
 import os
-from unstructured.partition.auto import partition
-import pytesseract
-from PIL import Image
 import argparse
+import sys
+from pathlib import Path
 
-# 確保 Tesseract 在系統 PATH 中，或在此處指定路徑
-# pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
+# 以 python scripts/ocr_extract.py 直接執行時，將專案根目錄加入匯入路徑
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rag_store.ocr_pool import IMAGE_EXTENSIONS, partition_text, tesseract_text
+
+# API 的上傳處理使用常駐的 OCR worker 程序池（rag_store/ocr_pool.py），與此腳本共用擷取邏輯
 
 def extract_text_from_file(file_path, output_dir):
     """
@@ -13,10 +16,7 @@ def extract_text_from_file(file_path, output_dir):
     """
     try:
         print(f"Processing file: {file_path}")
-        elements = partition(filename=file_path)
-        
-        # 合併所有元素的文字
-        content = "\n\n".join([str(el) for el in elements])
+        content = partition_text(file_path)
         
         # 建立輸出檔案路徑
         base_name = os.path.basename(file_path)
@@ -32,10 +32,10 @@ def extract_text_from_file(file_path, output_dir):
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
         # 嘗試使用 Tesseract 直接處理圖片
-        if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
+        if file_path.lower().endswith(IMAGE_EXTENSIONS):
             try:
                 print(f"Trying direct OCR with Tesseract for image: {file_path}")
-                text = pytesseract.image_to_string(Image.open(file_path), lang='chi_tra+eng')
+                text = tesseract_text(file_path)
                 
                 base_name = os.path.basename(file_path)
                 file_name, _ = os.path.splitext(base_name)
@@ -0,0 +1,233 @@
+-- 內嵌 SQLite 儲存後端資料庫架構（STORAGE_BACKEND=sqlite）
+-- 與 tidb_cloud_schema.sql、classification_schema.sql、time_series_schema.sql 相同的資料表與預設資料，
+-- 服務啟動時自動執行（可重複執行）
+
+-- 1. 文件類別表
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    description TEXT,
+    icon VARCHAR(50),
+    color VARCHAR(7),
+    parent_id BIGINT REFERENCES categories(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 2. 家庭成員表
+CREATE TABLE IF NOT EXISTS family_members (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    relationship VARCHAR(50),
+    birth_date DATE,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 3. 標籤表
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    color VARCHAR(7),
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 4. 文件元資料表
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename VARCHAR(255) NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    file_path VARCHAR(500) NOT NULL,
+    file_size BIGINT,
+    mime_type VARCHAR(100),
+    category_id BIGINT REFERENCES categories(id) ON DELETE SET NULL,
+    family_member_id BIGINT REFERENCES family_members(id) ON DELETE SET NULL,
+    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    document_date DATE,
+    extracted_amount DECIMAL(15,2),
+    extracted_date DATE,
+    ocr_text TEXT,
+    processing_status VARCHAR(20) DEFAULT 'pending'
+        CHECK (processing_status IN ('pending', 'processing', 'completed', 'failed')),
+    confidence_score FLOAT,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_documents_category ON documents (category_id);
+CREATE INDEX IF NOT EXISTS idx_documents_family_member ON documents (family_member_id);
+CREATE INDEX IF NOT EXISTS idx_documents_document_date ON documents (document_date);
+CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents (upload_date);
+
+-- 5. 文件標籤關聯表（多對多）
+CREATE TABLE IF NOT EXISTS document_tags (
+    document_id BIGINT REFERENCES documents(id) ON DELETE CASCADE,
+    tag_id BIGINT REFERENCES tags(id) ON DELETE CASCADE,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (document_id, tag_id)
+);
+
+-- 6. 文字區塊與向量（VECTOR 以文字字面值儲存，距離由 VEC_COSINE_DISTANCE 自訂函式或本機向量索引計算）
+CREATE TABLE IF NOT EXISTS embeddings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id VARCHAR(128),
+    chunk TEXT,
+    vec TEXT,
+    document_id BIGINT REFERENCES documents(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_document_id ON embeddings (document_id);
+
+-- 7. 時間序列數據類型表
+CREATE TABLE IF NOT EXISTS time_series_types (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    description TEXT,
+    unit VARCHAR(20),
+    category VARCHAR(50),
+    data_type VARCHAR(20) DEFAULT 'numeric'
+        CHECK (data_type IN ('numeric', 'percentage', 'score', 'amount')),
+    color VARCHAR(7),
+    icon VARCHAR(50),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 8. 時間序列數據表
+CREATE TABLE IF NOT EXISTS time_series_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    series_type_id BIGINT NOT NULL REFERENCES time_series_types(id) ON DELETE CASCADE,
+    family_member_id BIGINT REFERENCES family_members(id) ON DELETE SET NULL,
+    document_id BIGINT REFERENCES documents(id) ON DELETE SET NULL,
+    data_date DATE NOT NULL,
+    value DECIMAL(15,4) NOT NULL,
+    additional_info TEXT,
+    source VARCHAR(100),
+    confidence_score FLOAT DEFAULT 1.0,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (series_type_id, family_member_id, data_date, document_id)
+);
+CREATE INDEX IF NOT EXISTS idx_time_series_data_type_date ON time_series_data (series_type_id, data_date);
+CREATE INDEX IF NOT EXISTS idx_time_series_data_member_date ON time_series_data (family_member_id, data_date);
+CREATE INDEX IF NOT EXISTS idx_time_series_data_document_id ON time_series_data (document_id);
+
+-- 9. 時間序列分析結果表
+CREATE TABLE IF NOT EXISTS time_series_analysis (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    series_type_id BIGINT NOT NULL REFERENCES time_series_types(id) ON DELETE CASCADE,
+    family_member_id BIGINT REFERENCES family_members(id) ON DELETE SET NULL,
+    analysis_type VARCHAR(20) NOT NULL
+        CHECK (analysis_type IN ('trend', 'average', 'growth_rate', 'forecast')),
+    period_type VARCHAR(20) NOT NULL
+        CHECK (period_type IN ('weekly', 'monthly', 'quarterly', 'yearly')),
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    result_value DECIMAL(15,4),
+    result_data TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_time_series_analysis_type ON time_series_analysis (series_type_id, analysis_type, period_type);
+CREATE INDEX IF NOT EXISTS idx_time_series_analysis_member ON time_series_analysis (family_member_id, analysis_type);
+
+-- 10. 時間序列警報規則表
+CREATE TABLE IF NOT EXISTS time_series_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    series_type_id BIGINT NOT NULL REFERENCES time_series_types(id) ON DELETE CASCADE,
+    family_member_id BIGINT REFERENCES family_members(id) ON DELETE SET NULL,
+    alert_name VARCHAR(100) NOT NULL,
+    condition_type VARCHAR(20) NOT NULL
+        CHECK (condition_type IN ('threshold_high', 'threshold_low', 'rapid_change', 'trend_analysis')),
+    threshold_value DECIMAL(15,4),
+    change_percentage DECIMAL(5,2),
+    period_days INT DEFAULT 30,
+    is_active BOOLEAN DEFAULT TRUE,
+    last_triggered TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 11. 時間序列警報記錄表
+CREATE TABLE IF NOT EXISTS time_series_alert_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    alert_id BIGINT NOT NULL REFERENCES time_series_alerts(id) ON DELETE CASCADE,
+    triggered_date DATE NOT NULL,
+    current_value DECIMAL(15,4),
+    previous_value DECIMAL(15,4),
+    message TEXT,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_time_series_alert_logs_date ON time_series_alert_logs (alert_id, triggered_date);
+
+-- 預設分類
+INSERT OR IGNORE INTO categories (name, description, icon, color) VALUES
+('帳單', '水電費、電話費、信用卡帳單等', '💳', '#FF6B6B'),
+('收據', '購物收據、醫療收據、教育支出等', '🧾', '#4ECDC4'),
+('成績單', '學校成績、考試結果、學習進度', '📊', '#45B7D1'),
+('健康記錄', '身高體重、健康檢查報告、疫苗記錄', '🏥', '#96CEB4'),
+('保險文件', '保險單、理賠申請、保險證明', '🛡️', '#FFEAA7'),
+('稅務文件', '報稅資料、稅單、扣繳憑單', '📋', '#DDA0DD'),
+('合約文件', '租約、購屋合約、服務合約', '📄', '#98D8C8'),
+('證書證照', '畢業證書、專業證照、資格證明', '🏆', '#F7DC6F'),
+('其他', '未分類或其他類型文件', '📁', '#BDC3C7');
+
+-- 預設標籤
+INSERT OR IGNORE INTO tags (name, color, description) VALUES
+('重要', '#FF4757', '重要文件標記'),
+('緊急', '#FF3838', '需要緊急處理'),
+('待處理', '#FFA502', '需要後續處理'),
+('已完成', '#2ED573', '已處理完成'),
+('定期', '#3742FA', '定期產生的文件'),
+('年度', '#8E44AD', '年度相關文件'),
+('醫療', '#E74C3C', '醫療相關'),
+('教育', '#3498DB', '教育相關'),
+('財務', '#F39C12', '財務相關'),
+('法律', '#9B59B6', '法律相關');
+
+-- 預設家庭成員（name 無唯一鍵，僅在資料表為空時建立）
+INSERT INTO family_members (name, relationship)
+SELECT name, relationship FROM (
+    SELECT '家庭共用' AS name, '共用' AS relationship
+    UNION ALL SELECT '父親', '父親'
+    UNION ALL SELECT '母親', '母親'
+    UNION ALL SELECT '長子/女', '子女'
+    UNION ALL SELECT '次子/女', '子女'
+) WHERE NOT EXISTS (SELECT 1 FROM family_members);
+
+-- 預設時間序列類型
+INSERT OR IGNORE INTO time_series_types (name, description, unit, category, data_type, color, icon) VALUES
+('體重', '體重記錄', 'kg', '健康', 'numeric', '#FF6B6B', '⚖️'),
+('身高', '身高記錄', 'cm', '健康', 'numeric', '#4ECDC4', '📏'),
+('BMI', '身體質量指數', 'BMI', '健康', 'numeric', '#45B7D1', '🏃'),
+('血壓收縮壓', '收縮壓數值', 'mmHg', '健康', 'numeric', '#FF4757', '❤️'),
+('血壓舒張壓', '舒張壓數值', 'mmHg', '健康', 'numeric', '#FF3838', '💓'),
+('體脂率', '體脂肪百分比', '%', '健康', 'percentage', '#FFA502', '📊'),
+('月支出', '每月總支出', '元', '財務', 'amount', '#2ED573', '💰'),
+('月收入', '每月總收入', '元', '財務', 'amount', '#3742FA', '💵'),
+('儲蓄率', '每月儲蓄率', '%', '財務', 'percentage', '#8E44AD', '🏦'),
+('水電費', '水電費支出', '元', '財務', 'amount', '#E74C3C', '⚡'),
+('電話費', '電話費支出', '元', '財務', 'amount', '#3498DB', '📞'),
+('信用卡費', '信用卡費用', '元', '財務', 'amount', '#F39C12', '💳'),
+('國文成績', '國文科成績', '分', '學習', 'score', '#9B59B6', '📚'),
+('數學成績', '數學科成績', '分', '學習', 'score', '#1ABC9C', '🔢'),
+('英文成績', '英文科成績', '分', '學習', 'score', '#E67E22', '🌍'),
+('總平均', '學期總平均', '分', '學習', 'score', '#34495E', '🎯'),
+('GPA', '學期GPA', 'GPA', '學習', 'numeric', '#16A085', '🏆'),
+('運動時數', '每週運動時間', '小時', '生活', 'numeric', '#27AE60', '🏃‍♂️'),
+('睡眠時數', '每日睡眠時間', '小時', '生活', 'numeric', '#8E44AD', '😴'),
+('閱讀時數', '每週閱讀時間', '小時', '生活', 'numeric', '#D35400', '📖');
+
+-- 範例警報規則（僅在資料表為空時建立）
+INSERT INTO time_series_alerts (series_type_id, alert_name, condition_type, threshold_value, change_percentage, period_days)
+SELECT t.id, a.alert_name, a.condition_type, a.threshold_value, a.change_percentage, a.period_days
+FROM (
+    SELECT '體重' AS series, '體重異常增加' AS alert_name, 'rapid_change' AS condition_type,
+           NULL AS threshold_value, 5.0 AS change_percentage, 30 AS period_days
+    UNION ALL SELECT '體重', '體重過重警告', 'threshold_high', 80.0, NULL, 1
+    UNION ALL SELECT '月支出', '支出異常增加', 'rapid_change', NULL, 20.0, 30
+    UNION ALL SELECT '月支出', '支出超標警告', 'threshold_high', 50000.0, NULL, 1
+    UNION ALL SELECT '數學成績', '數學成績下降', 'threshold_low', 70.0, NULL, 1
+) a
+JOIN time_series_types t ON t.name = a.series
+WHERE NOT EXISTS (SELECT 1 FROM time_series_alerts);
@@ -14,3 +14,10 @@ CREATE TABLE IF NOT EXISTS embeddings(
 -- 使用 COSINE 距離的 HNSW 索引，並按需添加列存副本
 ALTER TABLE embeddings
 ADD VECTOR INDEX vec_hnsw ((VEC_COSINE_DISTANCE(vec))) ADD_COLUMNAR_REPLICA_ON_DEMAND;
+
+-- 讀寫分離的複寫心跳（READ_REPLICA_ENABLED）
+-- API 定期寫入主庫，並由本機副本讀回以計算複寫延遲
+CREATE TABLE IF NOT EXISTS replication_heartbeat(
+  id INT PRIMARY KEY,
+  ts DOUBLE NOT NULL
+);
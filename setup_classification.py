@@ -7,6 +7,8 @@ import mysql.connector
 import os
 from dotenv import load_dotenv
 
+from rag_store.schema_capabilities import mark_schema_changed
+
 # 載入環境變數
 load_dotenv()
 
@@ -46,6 +48,8 @@ def setup_classification_schema():
                     raise
 
         conn.commit()
+        # 通知執行中的服務重新偵測 schema
+        mark_schema_changed()
         cursor.close()
         conn.close()
 
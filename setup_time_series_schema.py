@@ -7,6 +7,8 @@ import os
 import mysql.connector
 from dotenv import load_dotenv
 
+from rag_store.schema_capabilities import mark_schema_changed
+
 load_dotenv()
 
 def create_time_series_schema():
@@ -167,6 +169,8 @@ def create_time_series_schema():
         """)
         
         conn.commit()
+        # 通知執行中的服務重新偵測 schema
+        mark_schema_changed()
         conn.close()
         
         print("✅ 時間序列架構建立完成！")
@@ -0,0 +1,67 @@
+"""embedding 快取：內容定址、LRU 淘汰，以及多個程序共用同一快取檔案時的容量上限"""
+
+import sqlite3
+
+from rag_store.embedding_cache import EmbeddingCache
+
+# 4 維 float32 向量 = 16 bytes
+VECTOR_BYTES = 16
+
+
+def vector(value: float):
+    return [value] * 4
+
+
+def test_normalized_text_shares_entry(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3")
+    cache.put_many("model", [("帳單  金額\n1200", vector(1.0))])
+    assert cache.get_many("model", ["帳單 金額 1200", "其他"]) == [vector(1.0), None]
+    assert cache.get("other-model", "帳單 金額 1200") is None
+    cache.put("model", "帳單 金額 1200", vector(1.0))
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["size_bytes"] == VECTOR_BYTES
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_bytes=2 * VECTOR_BYTES)
+    cache.put("model", "a", vector(1.0))
+    cache.put("model", "b", vector(2.0))
+    cache.get("model", "a")
+    cache.put("model", "c", vector(3.0))
+    assert cache.get_many("model", ["a", "b", "c"]) == [vector(1.0), None, vector(3.0)]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_capacity_is_shared_between_processes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first = EmbeddingCache(path, max_bytes=3 * VECTOR_BYTES)
+    second = EmbeddingCache(path, max_bytes=3 * VECTOR_BYTES)
+    for i in range(3):
+        first.put("model", f"first {i}", vector(i))
+    # 第二個程序的寫入依資料表中的實際總量淘汰，而非自己啟動時讀到的空快取
+    second.put("model", "second", vector(9.0))
+    assert second.stats()["evictions"] == 1
+    assert first.stats()["entries"] == second.stats()["entries"] == 3
+    assert first.stats()["size_bytes"] == 3 * VECTOR_BYTES
+    assert first.get("model", "first 0") is None
+
+    second.clear()
+    assert first.stats()["entries"] == 0
+    assert first.stats()["size_bytes"] == 0
+
+
+def test_totals_initialized_from_existing_cache(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    EmbeddingCache(path).put_many("model", [("a", vector(1.0)), ("b", vector(2.0))])
+    # 先前版本建立的快取檔案沒有總量資料表
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        DROP TRIGGER embedding_cache_after_insert;
+        DROP TRIGGER embedding_cache_after_delete;
+        DROP TABLE embedding_cache_totals;
+    """)
+    conn.close()
+
+    cache = EmbeddingCache(path)
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["size_bytes"] == 2 * VECTOR_BYTES
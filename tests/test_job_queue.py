@@ -0,0 +1,252 @@
+"""上傳處理工作佇列：重試退避、死信、中斷工作的回收與分階段續跑"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from rag_store import job_queue
+from rag_store.job_queue import (
+    JOB_COMPLETED, JOB_DEAD, JOB_QUEUED, JOB_RUNNING,
+    STAGE_COMPLETED, STAGE_FAILED, STAGE_PENDING, STAGE_RUNNING,
+    JobQueue, JobWorkerPool,
+)
+
+
+class Clock:
+    """可手動前進的時鐘，取代 job_queue 模組使用的 time"""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(tmp_path / "jobs.sqlite3", max_attempts=3, retry_base_seconds=10, lease_seconds=60)
+    yield queue
+    queue.close()
+
+
+def other_queue(queue: JobQueue, owner: str) -> JobQueue:
+    """共用同一佇列檔案的另一個程序"""
+    other = JobQueue(queue.path, max_attempts=queue.max_attempts,
+                     retry_base_seconds=queue.retry_base_seconds, lease_seconds=queue.lease_seconds)
+    other.owner = owner
+    return other
+
+
+def stage(queue: JobQueue, job_id: str, name: str):
+    return next(stage for stage in queue.get(job_id)["stages"] if stage["name"] == name)
+
+
+def dead_owner() -> str:
+    """本機上已結束的程序"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}"
+
+
+def test_failed_stage_backs_off_then_dead_letters(queue, clock):
+    calls = []
+    dead = []
+
+    async def flaky(job):
+        calls.append(job.attempt)
+        raise RuntimeError("OpenAI timeout")
+
+    async def on_dead(job):
+        dead.append(job)
+
+    pool = JobWorkerPool(queue, {"upload": [("embed", flaky)]}, on_dead=on_dead)
+    job_id = pool.submit("upload", {"file_path": "raw/a.pdf"})
+
+    for attempt in range(1, queue.max_attempts):
+        asyncio.run(pool._run(queue.claim()))
+        job = queue.get(job_id)
+        assert job["status"] == JOB_QUEUED
+        assert job["error"] == "RuntimeError: OpenAI timeout"
+        assert stage(queue, job_id, "embed")["attempts"] == attempt
+        # 指數退避：10、20 秒
+        delay = queue.retry_base_seconds * 2 ** (attempt - 1)
+        assert job["next_run_at"] == clock.now + delay
+        clock.advance(delay - 1)
+        assert queue.claim() is None
+        clock.advance(1)
+
+    asyncio.run(pool._run(queue.claim()))
+    job = queue.get(job_id)
+    assert job["status"] == JOB_DEAD
+    assert stage(queue, job_id, "embed")["status"] == STAGE_FAILED
+    assert calls == [1, 2, 3]
+    assert [(job.id, job.stage) for job in dead] == [(job_id, "embed")]
+    assert pool.stats()["retried"] == 2
+    assert pool.stats()["dead_lettered"] == 1
+
+    # 死信不再自動重試；手動 retry 後重新計算嘗試次數
+    clock.advance(3600)
+    assert queue.claim() is None
+    assert queue.retry(job_id)
+    assert stage(queue, job_id, "embed")["attempts"] == 0
+    assert queue.claim().id == job_id
+
+
+def test_requeue_abandoned_after_lease_expires(queue, clock):
+    job_id = queue.enqueue("upload", {}, ["ocr"])
+    queue.start_stage(queue.claim(), "ocr")
+    other = other_queue(queue, "otherhost:1")
+    try:
+        # 租約內且無法判斷其他主機的程序狀態：視為仍在執行
+        clock.advance(queue.lease_seconds - 1)
+        assert other.requeue_abandoned() == []
+        assert queue.get(job_id)["status"] == JOB_RUNNING
+
+        clock.advance(2)
+        assert other.requeue_abandoned() == []
+        job = queue.get(job_id)
+        assert job["status"] == JOB_QUEUED
+        assert job["error"] == "worker 中斷"
+        # 中斷計為該階段失敗一次
+        assert stage(queue, job_id, "ocr")["attempts"] == 1
+        assert stage(queue, job_id, "ocr")["status"] == STAGE_PENDING
+        assert job["next_run_at"] == clock.now + queue.retry_base_seconds
+    finally:
+        other.close()
+
+
+def test_requeue_abandoned_when_owner_is_dead(queue, clock):
+    queue.owner = dead_owner()
+    job_id = queue.enqueue("upload", {}, ["ocr"])
+    queue.start_stage(queue.claim(), "ocr")
+    other = other_queue(queue, "otherhost:1")
+    try:
+        # 租約尚未逾時，但 worker 程序已結束
+        assert other.requeue_abandoned() == []
+        assert queue.get(job_id)["status"] == JOB_QUEUED
+        assert stage(queue, job_id, "ocr")["attempts"] == 1
+    finally:
+        other.close()
+
+
+def test_requeue_abandoned_dead_letters_at_max_attempts(queue, clock):
+    job_id = queue.enqueue("upload", {"file_path": "raw/a.pdf"}, ["ocr"])
+    other = other_queue(queue, "otherhost:1")
+    try:
+        for _ in range(queue.max_attempts):
+            clock.advance(3600)
+            queue.start_stage(queue.claim(), "ocr")
+            clock.advance(queue.lease_seconds + 1)
+            dead = other.requeue_abandoned()
+        assert [(job.id, job.stage, job.payload) for job in dead] == [(job_id, "ocr", {"file_path": "raw/a.pdf"})]
+        assert queue.get(job_id)["status"] == JOB_DEAD
+    finally:
+        other.close()
+
+
+def test_requeue_abandoned_before_any_stage_is_not_a_failure(queue, clock):
+    job_id = queue.enqueue("upload", {}, ["ocr"])
+    queue.claim()
+    other = other_queue(queue, "otherhost:1")
+    try:
+        clock.advance(queue.lease_seconds + 1)
+        other.requeue_abandoned()
+        assert queue.get(job_id)["status"] == JOB_QUEUED
+        assert stage(queue, job_id, "ocr")["attempts"] == 0
+        assert queue.claim().id == job_id
+    finally:
+        other.close()
+
+
+def test_requeue_abandoned_skips_own_jobs(queue, clock):
+    job_id = queue.enqueue("upload", {}, ["ocr"])
+    queue.start_stage(queue.claim(), "ocr")
+    clock.advance(queue.lease_seconds + 1)
+    assert queue.requeue_abandoned() == []
+    assert queue.get(job_id)["status"] == JOB_RUNNING
+
+
+def test_release_owned_is_not_an_attempt(queue, clock):
+    job_id = queue.enqueue("upload", {}, ["ocr", "embed"])
+    job = queue.claim()
+    queue.start_stage(job, "ocr")
+    queue.complete_stage(job, "ocr", {"text": "..."})
+    queue.start_stage(job, "embed")
+    assert stage(queue, job_id, "embed")["status"] == STAGE_RUNNING
+
+    queue.release_owned()
+    job = queue.get(job_id)
+    assert job["status"] == JOB_QUEUED
+    assert job["next_run_at"] == clock.now
+    assert stage(queue, job_id, "embed")["attempts"] == 0
+    assert stage(queue, job_id, "embed")["status"] == STAGE_PENDING
+    # 已完成的階段不受影響
+    assert stage(queue, job_id, "ocr")["attempts"] == 1
+    assert stage(queue, job_id, "ocr")["status"] == STAGE_COMPLETED
+
+    job = queue.claim()
+    queue.start_stage(job, "embed")
+    assert job.attempt == 1
+
+
+def test_resumes_from_first_incomplete_stage(queue, clock):
+    calls = []
+    failures = {"classify": 1}
+
+    def handler(name, output):
+        async def run(job):
+            calls.append((name, dict(job.state)))
+            if failures.get(name):
+                failures[name] -= 1
+                raise RuntimeError(f"{name} failed")
+            return output
+        return run
+
+    pipeline = [
+        ("ocr", handler("ocr", {"text": "帳單"})),
+        ("classify", handler("classify", {"category": "帳單"})),
+        ("embed", handler("embed", {"chunks_count": 1})),
+    ]
+    pool = JobWorkerPool(queue, {"upload": pipeline})
+    job_id = pool.submit("upload", {"file_path": "raw/a.pdf"})
+    asyncio.run(pool._run(queue.claim()))
+    assert calls == [("ocr", {}), ("classify", {"text": "帳單"})]
+
+    # 另一個程序（重新啟動後）領取：先前階段的輸出已持久化
+    queue.close()
+    clock.advance(queue.retry_base_seconds)
+    reopened = JobQueue(queue.path, retry_base_seconds=queue.retry_base_seconds)
+    try:
+        job = reopened.claim()
+        assert job.completed_stages == ["ocr"]
+        assert job.state == {"text": "帳單"}
+
+        calls.clear()
+        asyncio.run(JobWorkerPool(reopened, {"upload": pipeline})._run(job))
+        assert calls == [("classify", {"text": "帳單"}), ("embed", {"text": "帳單", "category": "帳單"})]
+
+        job = reopened.get(job_id)
+        assert job["status"] == JOB_COMPLETED
+        assert job["progress"] == 1.0
+        assert job["state"] == {"text": "帳單", "category": "帳單", "chunks_count": 1}
+        assert [(stage["name"], stage["attempts"]) for stage in job["stages"]] == [
+            ("ocr", 1), ("classify", 2), ("embed", 1)
+        ]
+    finally:
+        reopened.close()
@@ -0,0 +1,223 @@
+"""SQLite 後端：以 STORAGE_BACKEND=sqlite 載入 API，執行端點與多維度搜尋的實際查詢"""
+
+import asyncio
+import importlib
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+from rag_store.job_queue import Job
+
+
+def vector(*head: float, dimensions: int = 1536):
+    return list(head) + [0.0] * (dimensions - len(head))
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    """設定只在載入時讀取：所有路徑指向暫存目錄，不啟動 startup 事件（OCR 程序與 worker）"""
+    root = tmp_path_factory.mktemp("rag")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(root)
+        for name, value in {
+            "STORAGE_BACKEND": "sqlite",
+            "SQLITE_PATH": str(root / "rag.sqlite3"),
+            "EMBEDDING_CACHE_PATH": str(root / "embeddings.sqlite3"),
+            "CORPUS_VERSION_PATH": str(root / "corpus_version"),
+            "INGEST_QUEUE_PATH": str(root / "jobs.sqlite3"),
+            "VECTOR_INDEX_DIR": str(root / "index"),
+            "VECTOR_INDEX_ENABLED": "false",
+            "READ_REPLICA_ENABLED": "false",
+            "OPENAI_API_KEY": "test",
+        }.items():
+            patch.setenv(name, value)
+        module = importlib.import_module("rag_store.app.main")
+    assert module.storage.name == "sqlite"
+    module.schema_registry.refresh()
+    yield module
+    asyncio.run(module.storage.close())
+
+
+@pytest.fixture(scope="module")
+def documents(main):
+    """兩份文件與其 chunk（經由上傳流程的 embed 與 timeseries 階段寫入）"""
+    classifier = main.document_classifier
+    bill = classifier.save_document_metadata(
+        "bill.pdf", "raw/bill.pdf",
+        {"category": "帳單", "confidence": 0.8, "suggested_tags": ["水電費"],
+         "extracted_data": {"amount": 1200, "date": "2026-09-15"}},
+        ocr_text="台電電費帳單 金額 1200 元",
+    )
+    health = classifier.save_document_metadata(
+        "health.pdf", "raw/health.pdf",
+        {"category": "健康記錄", "confidence": 0.9, "suggested_tags": ["醫療", "健康"],
+         "extracted_data": {"date": "2026-10-01"}},
+        ocr_text="健康檢查 體重: 85 kg",
+    )
+    assert bill and health
+
+    vectors = {"bill": vector(1.0), "health": vector(0.0, 1.0)}
+
+    async def fake_embeddings(texts):
+        return [vectors["bill" if "電費" in text else "health"] for text in texts]
+
+    async def ingest():
+        original = main.get_embeddings
+        main.get_embeddings = fake_embeddings
+        try:
+            for document_id, name, text in [
+                (bill, "bill", "台電電費帳單 金額 1200 元"),
+                (health, "health", "健康檢查 體重: 85 kg"),
+            ]:
+                job = Job(
+                    id=name, kind="upload", payload={"file_path": f"raw/{name}.pdf"},
+                    state={"text": text, "document_id": document_id,
+                           "classification": {"extracted_date": date.today().isoformat()}},
+                    attempt=1,
+                )
+                await main.embed_stage(job)
+                # 重試時先清除先前嘗試寫入的 chunk
+                job.attempt = 2
+                await main.embed_stage(job)
+                await main.timeseries_stage(job)
+        finally:
+            main.get_embeddings = original
+
+    asyncio.run(ingest())
+    return {"bill": bill, "health": health}
+
+
+@pytest.fixture
+def client(main, documents):
+    return TestClient(main.app)
+
+
+def test_embed_stage_replaces_chunks_on_retry(main, documents):
+    conn = main.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT document_id, COUNT(*) FROM embeddings GROUP BY document_id ORDER BY document_id")
+        counts = cursor.fetchall()
+    finally:
+        conn.close()
+    assert counts == [(documents["bill"], 1), (documents["health"], 1)]
+
+
+def test_categories_and_tags(client):
+    categories = {row["name"]: row for row in client.get("/api/categories").json()}
+    assert categories["帳單"]["document_count"] == 1
+    assert categories["其他"]["document_count"] == 0
+
+    tags = client.get("/api/tags").json()
+    assert {row["name"] for row in tags if row["document_count"]} == {"水電費", "醫療", "健康"}
+
+
+def test_documents_with_filters(main, documents):
+    bills = asyncio.run(main.get_documents(category="帳單"))
+    assert [doc.filename for doc in bills] == ["bill.pdf"]
+    assert bills[0].tags == ["水電費"]
+
+    tagged = asyncio.run(main.get_documents(tags=["醫療", "健康"]))
+    assert [doc.id for doc in tagged] == [documents["health"]]
+
+    recent = asyncio.run(main.get_documents(date_from="2026-10-01", date_to="2026-10-31"))
+    assert [(doc.filename, doc.document_date) for doc in recent] == [("health.pdf", "2026-10-01")]
+
+
+def test_search_suggestions_and_filters(client):
+    suggestions = client.get("/api/search/suggestions", params={"q": "健"}).json()
+    assert suggestions["categories"] == ["健康記錄"]
+    assert "健康" in suggestions["tags"]
+
+    filenames = client.get("/api/search/suggestions", params={"q": "bill"}).json()
+    assert filenames["filenames"] == ["bill.pdf"]
+
+    filters = client.get("/api/search/filters").json()
+    assert {row["month"]: row["count"] for row in filters["date_ranges"]} == {"2026-10": 1, "2026-09": 1}
+    assert filters["amount_ranges"][-1]["max"] == 1200
+
+
+def test_vector_search(main, documents):
+    rows = asyncio.run(main.vector_search("電費", 2, query_embedding=vector(1.0, 0.2)))
+    assert [row["doc_id"] for row in rows] == ["bill", "health"]
+    assert rows[0]["distance"] < rows[1]["distance"]
+
+
+@pytest.mark.parametrize("search, expected", [
+    ({"tags": ["醫療"]}, ["health"]),
+    ({"tags": ["醫療", "水電費"], "tag_mode": "all"}, []),
+    ({"tags": ["醫療", "健康"], "tag_mode": "all"}, ["health"]),
+    ({"category": "帳單", "amount_min": 1000}, ["bill"]),
+    ({"date_from": "2026-09-01", "date_to": "2026-09-30"}, ["bill"]),
+    ({}, ["bill", "health"]),
+])
+def test_multi_dimensional_search_in_database(main, documents, search, expected):
+    """不使用本機索引：距離計算與過濾條件都由資料庫的 SQL 執行"""
+    rows = asyncio.run(main._multi_dimensional_search(
+        "電費", limit=4, use_local_index=False, query_embedding=vector(1.0, 0.2), **search
+    ))
+    assert [row["doc_id"] for row in rows] == expected
+
+
+def test_filter_only_search(main, documents):
+    rows = asyncio.run(main._multi_dimensional_search(
+        "", category="健康記錄", search_mode="filter", use_local_index=False
+    ))
+    assert [(row["doc_id"], row["category"]) for row in rows] == [("health", "健康記錄")]
+
+
+def test_time_series_endpoints(client):
+    types = client.get("/api/timeseries/types").json()["time_series_types"]
+    assert "體重" in {row["name"] for row in types}
+
+    data = client.post("/api/timeseries/data", json={"series_type": "體重", "period_days": 30}).json()
+    assert {point["value"] for point in data["data_points"]} == {85.0}
+
+    dashboard = client.get("/api/timeseries/dashboard").json()
+    assert dashboard["categories"]["健康"][0]["latest_value"] == 85.0
+
+
+def test_alerts_read_flow(main, client):
+    conn = main.get_db_connection()
+    try:
+        alerts = main.TimeSeriesAnalyzer(conn).check_alerts("體重")
+    finally:
+        conn.close()
+    assert [alert["condition_type"] for alert in alerts] == ["threshold_high"]
+
+    active = client.get("/api/timeseries/alerts").json()
+    assert active["count"] == 1
+    assert active["alerts"][0]["triggered_date"] == date.today().isoformat()
+    assert client.get("/api/timeseries/dashboard").json()["alerts_count"] == 1
+
+    alert_id = active["alerts"][0]["alert_id"]
+    assert client.post(f"/api/timeseries/alerts/{alert_id}/read").status_code == 200
+    assert client.get("/api/timeseries/alerts").json()["count"] == 0
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("post", "/api/query", {"query": "電費", "date_from": "2026/13/01"}),
+    ("post", "/api/chat/stream", {"query": "電費", "date_to": "yesterday"}),
+    ("post", "/api/search/advanced", {"query": "電費", "date_from": "2026-02-30"}),
+    ("post", "/api/query/batch", {"queries": [{"query": "電費"}, {"query": "健康", "date_to": "10/01"}]}),
+    ("get", "/api/documents?date_from=2026-9-1x", None),
+])
+def test_malformed_dates_are_rejected(client, method, path, body):
+    response = client.request(method, path, json=body)
+    assert response.status_code == 400
+    assert "expected YYYY-MM-DD" in response.json()["detail"]
+
+
+def test_planner_falls_back_to_database_on_malformed_dates(main, documents):
+    main.sync_metadata_index()
+    assert main.metadata_index.ready
+    planners = [
+        main.query_planner,
+        # 尚未建立中繼資料索引時以基數統計估計
+        main.QueryPlanner(None, main.corpus_version, main.get_db_connection),
+    ]
+    for planner in planners:
+        plan = planner.plan(4, True, category="帳單", date_from="not-a-date")
+        assert plan.strategy == main.PLAN_METADATA_SCAN
+        assert plan.candidate_k == 4
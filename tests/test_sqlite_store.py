@@ -0,0 +1,215 @@
+"""SQLite 後端：MySQL / TiDB 語法轉換，以及分類器與時間序列分析的實際查詢"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from rag_store.bulk_writer import BulkWriter
+from rag_store.classification_system import DocumentClassifier
+from rag_store.db_pool import ConnectionPool
+from rag_store.sqlite_store import ER_DUP_ENTRY, connect_sqlite, translate_sql
+from rag_store.storage import SQLITE_SCHEMA_PATH
+from rag_store.taxonomy_cache import TaxonomyCache
+from rag_store.time_series_analyzer import TimeSeriesAnalyzer, process_document_for_time_series
+from rag_store.vector_codec import to_sql_literal
+
+
+def vector(*head: float, dimensions: int = 1536):
+    return list(head) + [0.0] * (dimensions - len(head))
+
+
+@pytest.fixture
+def pool():
+    """單一記憶體資料庫：連線池只保留一條不會汰換的連線"""
+    def connect():
+        conn = connect_sqlite(":memory:")
+        conn.raw.executescript(SQLITE_SCHEMA_PATH.read_text(encoding="utf-8"))
+        return conn
+
+    pool = ConnectionPool(
+        connect, max_size=1, max_lifetime=0, idle_timeout=0,
+        health_check_interval=float("inf"), name="sqlite",
+    )
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def classifier(pool):
+    return DocumentClassifier(pool=pool, taxonomy=TaxonomyCache())
+
+
+def save_document(classifier, filename, category, tags, amount=None, document_date=None):
+    return classifier.save_document_metadata(
+        filename, f"raw/{filename}",
+        {
+            "category": category,
+            "confidence": 0.9,
+            "suggested_tags": tags,
+            "extracted_data": {"amount": amount, "date": document_date},
+        },
+        ocr_text=f"{filename} 內容",
+        file_size=10,
+    )
+
+
+# --- translate_sql ---
+
+def test_translate_placeholders_outside_string_literals():
+    sql = "SELECT DATE_FORMAT(d, '%Y-%m') FROM t WHERE a = %s AND b LIKE '%s' AND c = %s"
+    assert translate_sql(sql) == "SELECT DATE_FORMAT(d, '%Y-%m') FROM t WHERE a = ? AND b LIKE '%s' AND c = ?"
+
+
+def test_translate_vector_cast():
+    sql = "SELECT VEC_COSINE_DISTANCE(CAST(e.vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) FROM embeddings e"
+    assert translate_sql(sql) == "SELECT VEC_COSINE_DISTANCE(e.vec, ?) FROM embeddings e"
+
+
+def test_translate_date_sub():
+    assert translate_sql("WHERE d >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)") == "WHERE d >= DATE(CURDATE(), '-7 day')"
+    assert translate_sql("WHERE d >= DATE_SUB(t.day, INTERVAL 30 DAY)") == "WHERE d >= DATE(t.day, '-30 day')"
+
+
+def test_translate_insert_ignore():
+    assert translate_sql("INSERT IGNORE INTO tags (name) VALUES (%s)") == "INSERT OR IGNORE INTO tags (name) VALUES (?)"
+
+
+def test_translate_on_duplicate_key_update():
+    sql = "INSERT INTO t (a, b) VALUES (%s, %s) ON DUPLICATE KEY UPDATE b = VALUES(b), c = c + 1"
+    assert translate_sql(sql) == (
+        "INSERT INTO t (a, b) VALUES (?, ?) ON CONFLICT DO UPDATE SET b = excluded.b, c = c + 1"
+    )
+
+
+def test_duplicate_key_reports_mysql_errno(pool):
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        with pytest.raises(Exception) as error:
+            cursor.execute("INSERT INTO tags (name) VALUES (%s)", ("醫療",))
+        assert error.value.errno == ER_DUP_ENTRY
+    finally:
+        conn.close()
+
+
+# --- classification_system.py ---
+
+def test_classifier_saves_documents_with_tags(classifier):
+    first = save_document(classifier, "a.pdf", "健康記錄", ["醫療", "新標籤"], 120.5, "2026-10-01")
+    second = save_document(classifier, "b.pdf", "帳單", ["新標籤"], document_date="2026/09/15")
+    assert first and second
+
+    assert [doc["filename"] for doc in classifier.get_documents_by_category("健康記錄")] == ["a.pdf"]
+    tagged = classifier.get_documents_by_tags(["新標籤"])
+    assert {doc["filename"] for doc in tagged} == {"a.pdf", "b.pdf"}
+    assert {doc["category_name"] for doc in tagged} == {"健康記錄", "帳單"}
+
+    stats = classifier.get_statistics()
+    assert stats["total_documents"] == 2
+    assert stats["avg_confidence"] == pytest.approx(0.9)
+    assert {row["name"]: row["count"] for row in stats["by_category"]}["帳單"] == 1
+    assert stats["by_tags"][0]["name"] == "新標籤"
+    assert stats["by_tags"][0]["count"] == 2
+
+
+def test_classifier_completes_pending_document(classifier, pool):
+    document_id = classifier.create_pending_document("c.pdf", "raw/c.pdf", 10, "application/pdf")
+    assert document_id
+    assert classifier.update_processing_status(document_id, "processing")
+
+    saved = classifier.save_document_metadata(
+        "c.pdf", "raw/c.pdf", {"category": "帳單", "suggested_tags": ["醫療"]},
+        document_id=document_id,
+    )
+    # 重試時重複執行不應違反 document_tags 的唯一鍵
+    again = classifier.save_document_metadata(
+        "c.pdf", "raw/c.pdf", {"category": "帳單", "suggested_tags": ["醫療"]},
+        document_id=document_id,
+    )
+    assert saved == again == document_id
+
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT processing_status, category_id FROM documents WHERE id = %s", (document_id,))
+        row = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) AS n FROM document_tags WHERE document_id = %s", (document_id,))
+        assert cursor.fetchone()["n"] == 1
+    finally:
+        conn.close()
+    assert row["processing_status"] == "completed"
+    assert row["category_id"] == classifier.get_category_id("帳單")
+
+
+def test_bulk_insert_with_vector_cast(classifier, pool):
+    document_id = save_document(classifier, "a.pdf", "帳單", [])
+    conn = pool.acquire()
+    try:
+        ids = BulkWriter(conn).insert(
+            "embeddings", ["doc_id", "chunk", "vec", "document_id"],
+            [
+                ("a", "chunk one", to_sql_literal(vector(1.0)), document_id),
+                ("a", "chunk two", to_sql_literal(vector(0.0, 1.0)), document_id),
+            ],
+            row_template="(%s, %s, CAST(%s AS VECTOR(1536)), %s)",
+            returning_ids=True,
+        )
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT id, VEC_COSINE_DISTANCE(CAST(vec AS VECTOR(1536)), CAST(%s AS VECTOR(1536))) AS distance
+            FROM embeddings ORDER BY distance ASC
+            """,
+            (to_sql_literal(vector(1.0, 0.1)),),
+        )
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    assert len(ids) == 2
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["distance"] < rows[1]["distance"]
+
+
+# --- time_series_analyzer.py ---
+
+def test_time_series_upsert_trend_and_alerts(classifier, pool):
+    document_id = save_document(classifier, "health.pdf", "健康記錄", [])
+    today = date.today()
+    conn = pool.acquire()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO family_members (name) VALUES (%s)", ("小明",))
+        member_id = cursor.lastrowid
+        conn.commit()
+
+        assert process_document_for_time_series(conn, document_id, "體重: 70 kg", today - timedelta(days=10), member_id)
+        assert process_document_for_time_series(conn, document_id, "體重: 84 kg", today, member_id)
+        # 同一天、同一文件再次寫入時更新既有數值（ON DUPLICATE KEY UPDATE）
+        assert process_document_for_time_series(conn, document_id, "體重: 85 kg", today, member_id)
+
+        analyzer = TimeSeriesAnalyzer(conn)
+        points = analyzer.get_time_series_data("體重", member_id, start_date=today - timedelta(days=30))
+        assert [(point.date, point.value) for point in points] == [
+            (today - timedelta(days=10), 70.0),
+            (today, 85.0),
+        ]
+
+        summary = analyzer.get_statistics_summary("體重", member_id)
+        assert summary["data_count"] == 2
+        assert summary["latest_value"] == 85.0
+        assert summary["trend_analysis"]["trend_type"] == "increasing"
+
+        # 預設規則：體重過重（> 80）與 30 天內變化超過 5%
+        alerts = analyzer.check_alerts("體重", member_id)
+        assert {alert["condition_type"] for alert in alerts} == {"threshold_high", "rapid_change"}
+
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS n FROM time_series_alert_logs
+            WHERE triggered_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) AND is_read = FALSE
+            """
+        )
+        assert cursor.fetchone()["n"] == 2
+    finally:
+        conn.close()
@@ -0,0 +1,29 @@
+"""向量編解碼：SQL 文字字面值與二進位格式都必須無損還原 float32"""
+
+import numpy as np
+
+from rag_store.vector_codec import (
+    DTYPE, EMBEDDING_DIM, from_bytes, from_sql_literal, to_bytes, to_sql_literal,
+)
+
+
+def embeddings(count: int = 20) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal((count, EMBEDDING_DIM)) / np.sqrt(EMBEDDING_DIM)).astype(DTYPE)
+
+
+def test_sql_literal_round_trips_float32():
+    for vector in embeddings():
+        assert np.array_equal(from_sql_literal(to_sql_literal(vector)), vector)
+
+
+def test_sql_literal_extreme_values():
+    vector = np.array([np.finfo(DTYPE).max, np.finfo(DTYPE).tiny, -1e-45, 0.1, -0.0], dtype=DTYPE)
+    assert np.array_equal(from_sql_literal(to_sql_literal(vector)), vector)
+    assert np.array_equal(from_sql_literal(to_sql_literal(vector).encode("ascii")), vector)
+
+
+def test_binary_round_trip():
+    vector = embeddings(1)[0]
+    assert len(to_bytes(vector)) == EMBEDDING_DIM * 4
+    assert np.array_equal(from_bytes(to_bytes(vector)), vector)